@@ -50,10 +50,10 @@ import operator
 import subprocess
 import queue
 import json
-import signal
 import webbrowser
 import io
 import shutil
+import threading
 from contextlib import redirect_stdout
 from datetime import datetime
 from enum import Enum
@@ -70,11 +70,13 @@ import paho.mqtt.client as mqtt
 
 from tools import CreateApp, ManageTutorials, crc_32c, datagram_to_str, compress_abs_path, TextEditor
 from tools import CreateProject, AppStore, ManageCodeTutorials
-from tools import AppTargetStatus, AppTopicIdStatus, Cfs, CfsStdout, ManageCfs, build_cfs_target
-from cfsinterface import CmdTlmRouter
-from cfsinterface import Cfe, EdsMission
+from tools import AppTargetStatus, AppTopicIdStatus, Cfs, CfsStdout, CfsSupervisor, ManageCfs, build_cfs_target
+from cfsinterface import CmdTlmRouter, RemoteCmdPolicy, BoundedQueue
+from cfsinterface import Cfe, EdsMission, rebuild_cache
 from cfsinterface import TelecommandInterface, TelecommandScript
-from cfsinterface import TelemetryMessage, TelemetryObserver, TelemetryQueueServer
+from cfsinterface import TelemetryMessage, TelemetryObserver, TelemetryQueueServer, TelemetryLimits, DerivedTelemetry, TelemetryCvt
+from cfsinterface import TelemetryDecodePool, LinkAnalytics, LinkQualityPanel
+from cfsinterface import EventStore, EventView
 
 
 
@@ -259,6 +261,11 @@ class TelecommandGui(TelecommandInterface):
         
         self.sg_values = None
         
+    def release_eds_objects(self):
+        super().release_eds_objects()
+        self.payload_struct = None
+        self.payload_gui_entries = {}
+
     def create_payload_gui_entries(self, payload_struct):
         """
         Create a list of a command's payload entries from the EDS
@@ -569,12 +576,13 @@ class BasecampTelemetryMonitor(TelemetryObserver):
     
     
     
-    def __init__(self, tlm_server: TelemetryQueueServer, tlm_monitors, tlm_callback, event_queue):
+    def __init__(self, tlm_server: TelemetryQueueServer, tlm_monitors, tlm_callback, event_queue, event_store):
         super().__init__(tlm_server)
 
         self.tlm_monitors = tlm_monitors
         self.tlm_callback = tlm_callback
         self.event_queue  = event_queue
+        self.event_store  = event_store
         
         self.sys_apps = ['CFE_ES', 'CFE_EVS', 'CFE_SB', 'CFE_TBL', 'CFE_TIME', 'APP_C_DEMO', 'FILE_MGR', 'FILE_XFER']
         
@@ -601,8 +609,8 @@ class BasecampTelemetryMonitor(TelemetryObserver):
                 if tlm_msg.msg_name == 'LONG_EVENT_MSG':
                     payload = tlm_msg.payload()
                     pkt_id = payload.PacketID
-                    event_text = f'FSW Event at {str(tlm_msg.sec_hdr().Seconds)}: {pkt_id.AppName}, {pkt_id.EventType} - {payload.Message}'
-                    self.event_queue.put_nowait(event_text)
+                    self.event_store.add_fsw_event(str(pkt_id.AppName), int(pkt_id.EventID), str(pkt_id.EventType),
+                                                   str(payload.Message), int(tlm_msg.sec_hdr().Seconds))
                     """        
                     LongEventTlm.Payload.PacketID.AppName                        = CFE_TIME
                     LongEventTlm.Payload.PacketID.EventID                        = 20
@@ -731,6 +739,115 @@ class CfsMqttCmdClient():
         return (status == 0)
 
 
+###############################################################################
+
+class BasecampDispatcher(threading.Thread):
+    """
+    Perform Basecamp's autonomous processing outside of the GUI thread. The
+    event and remote command notification queues are drained completely on
+    every pass and the GUI thread is sent batched updates with write_event_value():
+      REFRESH_EVENT     - New events or cFS output need to be displayed. At
+                          most one refresh is outstanding at a time.
+      CFS_STATUS_EVENT  - List of (state, text) CfsSupervisor state changes
+      ONE_HZ_EVENT      - Stale telemetry check that may display a popup
+    Timers use time.monotonic() so they don't depend on how fast the GUI loop
+    runs.
+    """
+    REFRESH_EVENT    = '-DISPATCH_REFRESH-'
+    CFS_STATUS_EVENT = '-DISPATCH_CFS_STATUS-'
+    ONE_HZ_EVENT     = '-DISPATCH_1HZ-'
+    
+    DISPATCH_PERIOD = 0.02  # Seconds between queue drains
+    REFRESH_PERIOD  = 0.1   # Minimum seconds between display refreshes
+    
+    def __init__(self, window, event_queue, event_store, remote_cmd_notify_queue,
+                 cfs_status_queue, cfs_stdout, tlm_limits):
+        threading.Thread.__init__(self)
+        self.window = window
+        self.event_queue = event_queue
+        self.event_store = event_store
+        self.remote_cmd_notify_queue = remote_cmd_notify_queue
+        self.cfs_status_queue = cfs_status_queue
+        self.cfs_stdout = cfs_stdout
+        self.tlm_limits = tlm_limits
+        self.daemon = True
+        
+        self.running = True
+        self.refresh_pending = threading.Event()
+        self.refresh_time = 0.0
+        self.refresh_seq  = 0
+        self.one_hz_time  = time.monotonic()
+
+    def refresh_done(self):
+        """
+        Called by the GUI thread after it processes a REFRESH_EVENT
+        """
+        self.refresh_pending.clear()
+
+    def stop(self):
+        self.running = False
+        self.join(1.0)
+        
+    def run(self):
+        while self.running:
+            self.drain_event_queue()
+            self.log_remote_cmds()
+            self.post_cfs_status()
+            now = time.monotonic()
+            if now - self.one_hz_time >= 1.0:
+                self.one_hz_time += 1.0
+                if now - self.one_hz_time >= 1.0:  # Don't try to catch up after a stall
+                    self.one_hz_time = now
+                self.tlm_limits.check_stale()
+                self.window.write_event_value(self.ONE_HZ_EVENT, None)
+            self.post_refresh(now)
+            time.sleep(self.DISPATCH_PERIOD)
+    
+    def drain_event_queue(self):
+        while True:
+            try:
+                self.event_store.add(self.event_queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def log_remote_cmds(self):
+        """
+        The router sends remote process commands directly to the cFS and
+        notifies Basecamp of the commands its remote command policy logs or
+        denies
+        """
+        while True:
+            try:
+                action, datagram, cmd_port = self.remote_cmd_notify_queue.get_nowait()
+            except queue.Empty:
+                break
+            if action == RemoteCmdPolicy.DENY:
+                event_text = f'Denied remote process command from port {cmd_port}: ' + datagram_to_str(datagram)
+            else:
+                event_text = "Sent remote process command: " + datagram_to_str(datagram)
+            self.event_store.add(event_text)
+            logger.debug(event_text)
+
+    def post_cfs_status(self):
+        status_list = []
+        while True:
+            try:
+                status_list.append(self.cfs_status_queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(status_list) > 0:
+            self.window.write_event_value(self.CFS_STATUS_EVENT, status_list)
+
+    def post_refresh(self, now):
+        if self.refresh_pending.is_set() or (now - self.refresh_time) < self.REFRESH_PERIOD:
+            return
+        if self.event_store.seq != self.refresh_seq or self.cfs_stdout.has_pending_lines():
+            self.refresh_seq  = self.event_store.seq
+            self.refresh_time = now
+            self.refresh_pending.set()
+            self.window.write_event_value(self.REFRESH_EVENT, None)
+        
+        
 ###############################################################################
 
 class App():
@@ -743,6 +860,9 @@ class App():
     CFS_CMD_DEST = Enum('cFSCmdDest', ['UDP', 'MQTT'])
     CFS_TLM_SRC  = {'LOCAL': 'Local', 'REMOTE': 'Remote'}
     
+    LINK_LOG_PERIOD = 10.0  # Minimum seconds between telemetry loss counter logs
+    TLM_VIEWER_ACK_TIMEOUT = 10.0  # Seconds before a request the telemetry viewer hasn't echoed is reported
+    
     FONT_HDR_LABEL = ('Arial bold',14)
     FONT_HDR_TEXT  = ('Arial',14)
     FONT_BDY_LABEL = ('Arial bold',12)
@@ -768,6 +888,7 @@ class App():
         self.EDS_MISSION_NAME    = self.ini_config.get('CFS_TARGET','MISSION_EDS_NAME')
         self.EDS_CFS_TARGET_NAME = self.ini_config.get('CFS_TARGET','CPU_EDS_NAME')
         self.SUDO_START_CFS      = self.ini_config.getboolean('CFS_TARGET','SUDO_START_CFS')
+        self.CFS_AUTO_RESTART    = self.ini_config.getint('CFS_TARGET','AUTO_RESTART')
 
         self.CMD_GUI_PAYLOAD_ROW_COUNT = self.ini_config.getint('GUI','CMD_PAYLOAD_ROW_COUNT')
         self.CMD_GUI_PAYLOAD_ROW_INPUT = self.ini_config.getint('GUI','CMD_PAYLOAD_ROW_INPUT')
@@ -785,6 +906,9 @@ class App():
         self.GND_TLM_PORT     = self.ini_config.getint('NETWORK','GND_TLM_PORT')
         self.GND_TLM_TIMEOUT  = float(self.ini_config.getint('NETWORK','GND_TLM_TIMEOUT'))/1000.0
         self.ROUTER_CTRL_PORT = self.ini_config.getint('NETWORK','CMD_TLM_ROUTER_CTRL_PORT')
+        self.TLM_SOCKET_RCVBUF = self.ini_config.getint('NETWORK','TLM_SOCKET_RCVBUF')
+        self.link_stats_log  = None  # Most recent logged telemetry loss counters
+        self.link_stats_time = 0.0
 
         self.default_tech_doc = self.ini_config.get('APP','DEFAULT_TECH_DOC')
         self.default_proj_doc = self.ini_config.get('APP','DEFAULT_PROJ_DOC')
@@ -795,16 +919,18 @@ class App():
         self.cfs_exe_rel_path   = 'build/exe/' + self.EDS_CFS_TARGET_NAME.lower()
         self.cfs_exe_file       = 'core-' + self.EDS_CFS_TARGET_NAME.lower()
         self.cfs_abs_base_path  = compress_abs_path(os.path.join(self.path, self.ini_config.get('CFS_TARGET','BASE_PATH')))
-        self.cfs_subprocess     = None
-        self.cfs_subprocess_log = ""
         self.cfs_stdout         = None
+        self.cfs_supervisor     = None
+        self.cfs_status_queue   = queue.Queue()
+        self.CFS_STDOUT_LOG     = compress_abs_path(os.path.join(self.path, '..', self.ini_config.get('APP','CFS_STDOUT_LOG')))
         self.cfs_cmd_dest       = self.CFS_CMD_DEST.UDP
         
         self.cfe_time_event_filter = False  #todo: Retaining the state here doesn't work if user starts and stops the cFS and doesn't restart Basecamp
         self.cfs_build_subprocess  = None
         
-        self.event_log   = ""        
-        self.event_queue = queue.Queue()
+        self.event_store = EventStore('BASECAMP', log_file=compress_abs_path(os.path.join(self.path, '..', self.ini_config.get('APP','EVENT_LOGS'))))
+        self.event_view  = EventView(self.event_store)
+        self.event_queue = self.create_bounded_queue('EVENT_QUEUE', 'Event queue')
         self.window = None
         
         self.cfe_app_list = ['CFE_ES', 'CFE_EVS', 'CFE_SB', 'CFE_TBL', 'CFE_TIME']
@@ -826,27 +952,40 @@ class App():
         self.target_control = None
         self.tlm_plot       = None
         self.tlm_screen     = None
-
-        #todo: Add robust telemetry screen port number management
-        # tlm_screen_port is used a starting port number and each telemetry
-        # screen is open with a new port number. This strategy assumes 
-        # basecamp is run for short periods of time with only a few telemetry
-        # screens.
-        self.tlm_screen_port = self.ini_config.getint('NETWORK', 'TLM_SCREEN_TLM_PORT')
+        self.tlm_viewer     = None
+        self.tlm_viewer_requests = []  # [request, send time, reported] waiting for the viewer's echo
+        self.tlm_viewer_ctrl_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.tlm_viewer_ctrl_socket.setblocking(False)
+        self.tlm_viewer_ctrl_addr   = (self.GND_IP_ADDR, self.ini_config.getint('NETWORK', 'TLM_VIEWER_CTRL_PORT'))
 
     def update_event_history_str(self, new_event_text):
-        time = datetime.now().strftime("%H:%M:%S")
-        event_str = time + " - " + new_event_text + "\n"        
-        self.event_log += event_str
+        self.event_store.add(new_event_text)
      
     def display_event(self, new_event_text):
         self.update_event_history_str(new_event_text)
-        self.window["-EVENT_TEXT-"].update(self.event_log)
+        self.event_view.refresh()
 
     def display_tlm_monitor(self, app_name, tlm_msg, tlm_item, tlm_text):
         #TODO: print("Received [%s, %s, %s] %s" % (app_name, tlm_msg, tlm_item, tlm_text))
         self.window["-CFS_TIME-"].update(tlm_text)
         self.tlm_monitor.check_stale_tlm(BasecampTelemetryMonitor.MON_CMD_RECV_TLM)
+        self.cfs_supervisor.notify_tlm()
+
+    def process_cfs_status(self, state, status_text):
+        """
+        Process a CfsSupervisor state change. Telemetry is enabled when the cFS
+        startup completes instead of after a fixed delay.
+        """
+        self.display_event(status_text)
+        if state == CfsSupervisor.STATE_RUNNING:
+            self.enable_telemetry()
+            self.tlm_monitor.check_stale_tlm(BasecampTelemetryMonitor.MON_CMD_START_CFS)
+        elif state in (CfsSupervisor.STATE_IDLE, CfsSupervisor.STATE_CRASHED):
+            self.window["-CFS_IMAGE-"].update(self.GUI_NO_IMAGE_TXT)
+            self.window["-CFS_TIME-"].update(EdsMission.NULL_TLM_STR)
+            self.tlm_monitor.check_stale_tlm(BasecampTelemetryMonitor.MON_CMD_STOP_CFS)
+        elif state == CfsSupervisor.STATE_STARTING:
+            self.window["-CFS_IMAGE-"].update(os.path.join(self.cfs_abs_base_path, self.cfs_exe_rel_path, self.cfs_exe_file))
 
     def send_cfs_mqtt_cmd(self, cmd_obj):
         """
@@ -910,15 +1049,48 @@ class App():
         Close routers after close threads that depend on the routers
         """
         logger.info("Starting app shutdown sequence")
-        if self.cfs_subprocess is not None:
-            logger.info("Killing cFS Process")
-            os.killpg(os.getpgid(self.cfs_subprocess.pid), signal.SIGTERM)  # Send the signal to all the process groups
+        self.dispatcher.stop()
+        self.cfs_supervisor.shutdown()
+        self.cfs_stdout.close()
         self.cmd_tlm_router.shutdown()
         self.tlm_server.shutdown()
         time.sleep(self.GND_TLM_TIMEOUT)
+        if self.tlm_decode_pool is not None:
+            self.tlm_decode_pool.stop()
+        self.tlm_cvt.close()
+        if self.link_quality_panel is not None:
+            self.link_quality_panel.window.close()
         self.window.close()
+        self.event_store.close()
         logger.info("Completed app shutdown sequence")
 
+    def create_bounded_queue(self, ini_prefix, name):
+        return BoundedQueue(self.ini_config.getint('NETWORK',f'{ini_prefix}_SIZE'),
+                            self.ini_config.get('NETWORK',f'{ini_prefix}_POLICY').strip(), name)
+
+    def update_link_status(self):
+        """
+        Display the telemetry loss counters and log them when they change.
+        Sequence gaps are link loss, kernel drops are socket buffer overflows
+        and queue drops are consumers that can't keep up.
+        """
+        link_stats = self.cmd_tlm_router.get_link_stats()
+        queue_drops  = link_stats['gnd-tlm-queue']['drop-cnt'] + self.event_queue.drop_cnt
+        kernel_drops = '--' if link_stats['kernel-drops'] is None else link_stats['kernel-drops']
+        link_text = (f"Rx {link_stats['rx-cnt']}, Lost {link_stats['lost-cnt']}, "
+                     f"Queue Drops {queue_drops}, Kernel Drops {kernel_drops}")
+        self.window['-TLM_LINK-'].update(link_text)
+        log_stats = (link_stats['lost-cnt'], link_stats['dup-cnt'], link_stats['reorder-cnt'], link_stats['resync-cnt'],
+                     link_stats['kernel-drops'], link_stats['gnd-tlm-queue']['drop-cnt'], link_stats['cfs-cmd-queue']['drop-cnt'],
+                     self.event_queue.drop_cnt, link_stats['remote-cmd-notify-queue']['drop-cnt'])
+        now = time.monotonic()
+        if log_stats != self.link_stats_log and (now - self.link_stats_time) >= self.LINK_LOG_PERIOD:
+            self.link_stats_log  = log_stats
+            self.link_stats_time = now
+            logger.info(f"Telemetry link: {link_text}, Duplicates {link_stats['dup-cnt']}, Out of order {link_stats['reorder-cnt']}, "
+                        f"Resyncs {link_stats['resync-cnt']}, Tlm queue {link_stats['gnd-tlm-queue']}, Cmd queue {link_stats['cfs-cmd-queue']}, "
+                        f"Event queue drops {self.event_queue.drop_cnt}, Remote cmd notify queue drops {link_stats['remote-cmd-notify-queue']['drop-cnt']}")
+
     def cmd_topic_list(self):
         cmd_topics = [EdsMission.TOPIC_CMD_TITLE_KEY]
         cmd_topic_list = list(self.telecommand_gui.get_topics().keys())
@@ -995,6 +1167,63 @@ class App():
             sg.popup(f'Failed to open {pdf_filename}, file does not exist.', title='Tutorials', keep_on_top=True, non_blocking=True, grab_anywhere=True, modal=False)
         #self.pdf_viewer = sg.execute_py_file(pdf_viewer_app, parms=tutorial_path, cwd=self.tools_path)
 
+    def open_tlm_view(self, view_parms):
+        """
+        Telemetry screens and plots are hosted by a single TlmViewer process
+        that shares one telemetry stream. The viewer is launched with the first
+        view request and receives subsequent requests on its control port.
+        The viewer echoes each request and check_tlm_viewer_requests() handles
+        the echoes so the GUI thread never waits for the viewer.
+        """
+        if self.tlm_viewer is not None and self.tlm_viewer.poll() is None:
+            request = view_parms.encode('utf-8')
+            try:
+                self.tlm_viewer_ctrl_socket.sendto(request, self.tlm_viewer_ctrl_addr)
+            except OSError as e:
+                logger.error(f'Error sending telemetry viewer request: {e}')
+            self.tlm_viewer_requests.append([request, time.monotonic(), False])
+        else:
+            self.launch_tlm_viewer(view_parms)
+
+    def launch_tlm_viewer(self, view_parms):
+        self.tlm_viewer_requests = []
+        self.cmd_tlm_router.add_gnd_tlm_dest(self.ini_config.getint('NETWORK','TLM_VIEWER_TLM_PORT'))
+        self.tlm_viewer = sg.execute_py_file("tlmviewer.py", parms=view_parms, cwd=self.cfs_interface_dir)
+
+    def check_tlm_viewer_requests(self):
+        """
+        Called periodically from the GUI thread. A new viewer is only launched
+        after the running viewer exits, because a second viewer would share
+        its telemetry port, so a request the viewer exited without echoing
+        is relaunched. Requests a running viewer hasn't echoed within
+        TLM_VIEWER_ACK_TIMEOUT seconds are reported once.
+        """
+        if len(self.tlm_viewer_requests) == 0:
+            return
+        while True:
+            try:
+                datagram, host = self.tlm_viewer_ctrl_socket.recvfrom(1024)
+            except OSError:
+                break
+            for i, request in enumerate(self.tlm_viewer_requests):
+                if request[0] == datagram:
+                    del self.tlm_viewer_requests[i]
+                    break
+        if len(self.tlm_viewer_requests) == 0:
+            return
+        if self.tlm_viewer.poll() is not None:
+            unopened = [request[0].decode('utf-8') for request in self.tlm_viewer_requests]
+            logger.info(f'Telemetry viewer exited before opening "{unopened[0]}", launching a new viewer')
+            self.launch_tlm_viewer(unopened[0])
+            for view_parms in unopened[1:]:
+                self.display_event(f'Telemetry viewer exited before opening "{view_parms}", request the view again')
+        else:
+            now = time.monotonic()
+            for request in self.tlm_viewer_requests:
+                if not request[2] and (now - request[1]) > self.TLM_VIEWER_ACK_TIMEOUT:
+                    request[2] = True
+                    self.display_event(f'Telemetry viewer has not opened "{request[0].decode("utf-8")}", it may still be loading the EDS')
+
     def launch_tlmplot(self):
                 
         # 1. Get user app selection & create telemetry topic dictionary 
@@ -1102,8 +1331,7 @@ class App():
 
         #todo: Add check if tlm_plots been run before or is there logic in router?
         if (len(tlm_plot_cmd_parms)>0):
-            self.cmd_tlm_router.add_gnd_tlm_dest(self.ini_config.getint('NETWORK','TLM_PLOT_TLM_PORT'))                
-            self.tlm_plot = sg.execute_py_file("tlmplot.py", parms=tlm_plot_cmd_parms, cwd=self.cfs_interface_dir)
+            self.open_tlm_view('plot ' + tlm_plot_cmd_parms)
 
     def create_window(self, sys_target_str, sys_comm_str):
         """
@@ -1121,7 +1349,7 @@ class App():
         
         menu_def = [
                        ['File',       ['Create Project...', '---', 'Create App', 'Download Basecamp App', 'Download NASA App', '---', 'Add App to Target', 'Remove App from Target', 'App Target Status', '---', 'Exit']], #TODO: 'Certify App'
-                       ['Tools',      ['Browse Files', 'Run Cmd Sender', 'Run Script', 'Manage cFS Tables', 'Plot Data', '---', 'Run Perf Monitor', '---', 'Preferences']],
+                       ['Tools',      ['Browse Files', 'Run Cmd Sender', 'Run Script', 'Manage cFS Tables', 'Plot Data', 'Display Page', 'Link Quality', '---', 'Run Perf Monitor', '---', 'Preferences']],
                        ['Remote Ops', ['Configure Command Destination', 'Configure Telemetry Source', 'Control Remote Target']],  
                        ['Tutorials',  tutorial_menu],
                        ['Help',       ['Tech Docs...', 'Project Docs...', 'About']]
@@ -1174,11 +1402,14 @@ class App():
                       sg.Text('Telemetry:', font=sec_hdr_font, pad=(4,1)), sg.Text(self.CFS_TLM_SRC['LOCAL'], key='-CFS_TLM_SRC-', font=sec_hdr_font, text_color='blue'), 
                       sg.Text('  ', font=sec_hdr_font, pad=(4,1)),
                       sg.Text('Time:', font=sec_hdr_font, pad=(4,1)), sg.Text(EdsMission.NULL_TLM_STR, key='-CFS_TIME-', font=sec_hdr_font, text_color='blue'), 
+                      sg.Text('  ', font=sec_hdr_font, pad=(4,1)),
+                      sg.Text('Link:', font=sec_hdr_font, pad=(4,1)), sg.Text(EdsMission.NULL_TLM_STR, key='-TLM_LINK-', font=sec_hdr_font, text_color='blue'), 
                       sg.Button('Restart', enable_events=True, key='-RESTART-', visible=False)],
                      #[sg.Output(font=log_font, size=(125, 10))],
-                     [sg.MLine(default_text=self.cfs_subprocess_log, font=log_font, enable_events=True, size=(135, 20), key='-CFS_PROCESS_TEXT-')],
-                     [sg.Text('Ground Events', font=pri_hdr_font), sg.Button('Clear', enable_events=True, key='-CLEAR_EVENTS-', pad=(5,1))],
-                     [sg.MLine(default_text=self.event_log, font=log_font, enable_events=True, size=(135, 8), key='-EVENT_TEXT-')]
+                     [sg.MLine(default_text='', font=log_font, enable_events=True, size=(135, 20), key='-CFS_PROCESS_TEXT-')],
+                     [sg.Text('Ground Events', font=pri_hdr_font), sg.Button('Clear', enable_events=True, key='-CLEAR_EVENTS-', pad=(5,1)),
+                      sg.Text('Search', pad=((20,4),1)), sg.Input(size=(30,1), enable_events=True, key='-EVENT_SEARCH-')],
+                     [sg.MLine(default_text='', font=log_font, enable_events=True, size=(135, 8), key='-EVENT_TEXT-')]
                  ]
 
         #sg.Button('Send Cmd', enable_events=True, key='-SEND_CMD-', pad=(10,1)),
@@ -1187,10 +1418,15 @@ class App():
         return window
   
     def reload_eds_libs(self):
-        #importlib.invalidate_caches()
-        self.telecommand_gui.eds_mission.reload_libs()
-        self.telecommand_script.eds_mission.reload_libs()
-        self.tlm_server.eds_mission.reload_libs()
+        """
+        Rebuild the EDS cache for a new cFS build in a separate process so the
+        GUI stays responsive. The '-EDS_CACHE_BUILT-' event swaps the new
+        database into the EDS targets. The telemetry CVT keeps its slots until
+        Basecamp is restarted.
+        """
+        def build_cache():
+            self.window.write_event_value('-EDS_CACHE_BUILT-', rebuild_cache(self.EDS_MISSION_NAME))
+        threading.Thread(target=build_cache, daemon=True).start()
        
        
     def execute(self):
@@ -1207,9 +1443,13 @@ class App():
             # Command & Telemetry Router
                              
             self.cmd_tlm_router = CmdTlmRouter(self.CFS_IP_ADDR, self.CFS_CMD_PORT, 
-                                  self.GND_IP_ADDR, self.ROUTER_CTRL_PORT, self.GND_TLM_PORT, self.GND_TLM_TIMEOUT)
+                                  self.GND_IP_ADDR, self.ROUTER_CTRL_PORT, self.GND_TLM_PORT, self.GND_TLM_TIMEOUT,
+                                  gnd_tlm_queue=self.create_bounded_queue('GND_TLM_QUEUE', 'Ground telemetry queue'),
+                                  cfs_cmd_queue=self.create_bounded_queue('CFS_CMD_QUEUE', 'cFS command queue'),
+                                  rcvbuf_size=self.TLM_SOCKET_RCVBUF,
+                                  remote_cmd_notify_queue=self.create_bounded_queue('REMOTE_CMD_QUEUE', 'Remote command notify queue'))
             self.cfs_cmd_output_queue = self.cmd_tlm_router.get_cfs_cmd_queue()
-            self.cfs_cmd_input_queue  = self.cmd_tlm_router.get_cfs_cmd_source_queue()
+            self.remote_cmd_notify_queue = self.cmd_tlm_router.get_remote_cmd_notify_queue()
 
         except Exception as e:
             err_str = f'Error creating command-telemetry router: {e}.'
@@ -1231,7 +1471,22 @@ class App():
             # Telemetry Objects
              
             self.tlm_server  = TelemetryQueueServer(self.EDS_MISSION_NAME, self.EDS_CFS_TARGET_NAME, self.cmd_tlm_router.get_gnd_tlm_queue())
-            self.tlm_monitor = BasecampTelemetryMonitor(self.tlm_server, self.tlm_monitors, self.display_tlm_monitor, self.event_queue)
+            self.tlm_monitor = BasecampTelemetryMonitor(self.tlm_server, self.tlm_monitors, self.display_tlm_monitor, self.event_queue, self.event_store)
+            self.tlm_derived = DerivedTelemetry(self.tlm_server)
+            self.tlm_derived.load(compress_abs_path(os.path.join(self.path, self.ini_config.get('PATHS','TLM_DERIVED_FILE'))))
+            self.tlm_limits  = TelemetryLimits(self.tlm_server, self.event_queue)
+            self.tlm_limits.load(compress_abs_path(os.path.join(self.path, self.ini_config.get('PATHS','TLM_LIMITS_FILE'))))
+            self.tlm_cvt     = TelemetryCvt(self.ini_config.get('APP','TLM_CVT_NAME'), self.tlm_server)
+            self.tlm_server.add_server_observer(self.tlm_cvt.publish)
+            self.link_analytics = LinkAnalytics(self.tlm_server.topic_index.app_id_topics)
+            self.tlm_server.set_link_analytics(self.link_analytics)
+            self.link_quality_panel = None  # Non-blocking LinkQualityPanel serviced by the event loop
+            self.tlm_decode_pool = None
+            tlm_decode_topics = [topic.strip() for topic in self.ini_config.get('APP','TLM_DECODE_TOPICS').split(',') if topic.strip()]
+            if self.ini_config.getint('APP','TLM_DECODE_WORKERS') > 0 and len(tlm_decode_topics) > 0:
+                self.tlm_decode_pool = TelemetryDecodePool(self.EDS_MISSION_NAME, self.EDS_CFS_TARGET_NAME, self.ini_config.getint('APP','TLM_DECODE_WORKERS'))
+                self.tlm_decode_pool.start()
+                self.tlm_server.set_decode_pool(self.tlm_decode_pool, [self.tlm_server.topic_index.get_app_id(topic) for topic in tlm_decode_topics])
             self.tlm_server.execute()      
             self.cmd_tlm_router.start()
              
@@ -1242,14 +1497,26 @@ class App():
             sys.exit(2)
 
         self.window = self.create_window(sys_target_str, sys_comm_str)
+        self.event_view.attach(self.window['-EVENT_TEXT-'])
+        self.cfs_stdout = CfsStdout(self.window, self.CFS_STDOUT_LOG)
+        self.cfs_supervisor = CfsSupervisor(self.cfs_stdout, self.cfs_status_queue, self.CFS_AUTO_RESTART)
+        self.cfs_supervisor.start()
+        self.dispatcher = BasecampDispatcher(self.window, self.event_queue, self.event_store, self.remote_cmd_notify_queue,
+                                             self.cfs_status_queue, self.cfs_stdout, self.tlm_limits)
+        self.dispatcher.start()
         # --- Loop taking in user input --- #
+        # Autonomous processing is performed by the dispatcher which posts window events
         restart = False
-        window_read_timeout = 50
-        tlm_mon_1hz_poll_lim = 1000/window_read_timeout
-        tlm_mon_1hz_poll_cnt = 0
         while True:
     
-            self.event, self.values = self.window.read(timeout=window_read_timeout)
+            if self.link_quality_panel is None:
+                self.event, self.values = self.window.read()
+            else:
+                window, self.event, self.values = sg.read_all_windows()
+                if window is self.link_quality_panel.window:
+                    if not self.link_quality_panel.handle_event(self.event, self.values):
+                        self.link_quality_panel = None
+                    continue
             logger.debug("App Window Read()\nEvent: %s\nValues: %s" % (self.event, self.values))
 
             if self.event in (sg.WIN_CLOSED, 'Exit', '-RESTART-') or self.event is None:
@@ -1260,23 +1527,45 @@ class App():
             ##### Autonomous System Behavior #####
             ######################################
             
-            if not self.event_queue.empty():
-                new_event_text = self.event_queue.get_nowait()
-                self.display_event(new_event_text)
+            if self.event == BasecampDispatcher.REFRESH_EVENT:
+                self.event_view.refresh()  # Includes FSW events stored by the telemetry thread
+                self.cfs_stdout.refresh()
+                self.dispatcher.refresh_done()
+                continue
             
-            # Route commands from remote processes. for now, always accept commands
-            if not self.cfs_cmd_input_queue.empty():
-                datagram = self.cfs_cmd_input_queue.get()[0]
-                self.cfs_cmd_output_queue.put(datagram)
-                self.display_event("Sent remote process command: " + datagram_to_str(datagram))
-                logger.debug("Sent remote process command: " + datagram_to_str(datagram))
-
-            tlm_mon_1hz_poll_cnt += 1
-            if tlm_mon_1hz_poll_cnt > tlm_mon_1hz_poll_lim:
+            elif self.event == BasecampDispatcher.CFS_STATUS_EVENT:
+                for state, status_text in self.values[self.event]:
+                    self.process_cfs_status(state, status_text)
+                continue
+            
+            elif self.event == BasecampDispatcher.ONE_HZ_EVENT:
+                self.update_link_status()
+                self.check_tlm_viewer_requests()
+                if self.link_quality_panel is not None:
+                    self.link_quality_panel.refresh()
                 stale_tlm = self.tlm_monitor.check_stale_tlm(BasecampTelemetryMonitor.MON_CMD_POLL_TLM)
                 if stale_tlm:
                     self.display_event('Executive Service telemtry is not updating, verify the cFS is running and cFS telemetry output is enabled')
-                tlm_mon_1hz_poll_cnt = 0
+                continue
+                
+            elif self.event == '-RELOAD_EDS-':
+                self.display_event(f"Reloading the '{self.EDS_MISSION_NAME}' EDS definitions")
+                self.reload_eds_libs()
+                continue
+
+            elif self.event == '-EDS_CACHE_BUILT-':
+                if not self.values[self.event]:
+                    self.display_event(f"Error loading the '{self.EDS_MISSION_NAME}' EDS definitions, see the log file for details")
+                elif EdsMission.hot_reload(self.EDS_MISSION_NAME):
+                    if self.tlm_decode_pool is not None:
+                        self.tlm_decode_pool.restart()
+                    self.display_event(f"Reloaded the '{self.EDS_MISSION_NAME}' EDS definitions")
+                else:
+                    popup_text = f"The '{self.EDS_MISSION_NAME}' EDS definitions are in use and can't be reloaded.\n\nRestart Basecamp to use the new definitions?"
+                    if sg.popup_ok_cancel(popup_text, title='Reload EDS Definitions', keep_on_top=True, grab_anywhere=True, modal=True) == 'OK':
+                        restart = True
+                        break
+                continue
                 
             #######################
             ##### MENU EVENTS #####
@@ -1286,7 +1575,7 @@ class App():
 
             if self.event == 'Create Project...':
                 project_path = os.path.join(self.path,self.PROJECTS_PATH)
-                manage_cfs = ManageCfs(self.path, self.cfs_abs_base_path, self.USR_APP_PATH, self.window, self.EDS_CFS_TARGET_NAME)
+                manage_cfs = ManageCfs(self.path, self.cfs_abs_base_path, self.USR_APP_PATH, self.window, self.EDS_CFS_TARGET_NAME, self.cfs_supervisor)
                 CreateProject(self.PROJECTS_URL, project_path, self.APP_STORE_URL, self.APP_REPO_BRANCH, self.USR_APP_PATH, manage_cfs).execute()
 
             elif self.event == 'Create App':
@@ -1313,7 +1602,7 @@ class App():
                 app_store.execute()
 
             elif self.event in ('Add App to Target','Remove App from Target', 'App Target Status'):
-                manage_cfs = ManageCfs(self.path, self.cfs_abs_base_path, self.USR_APP_PATH, self.window, self.EDS_CFS_TARGET_NAME)
+                manage_cfs = ManageCfs(self.path, self.cfs_abs_base_path, self.USR_APP_PATH, self.window, self.EDS_CFS_TARGET_NAME, self.cfs_supervisor)
                 manage_cfs.execute(self.event.split(' ')[0]) # First menu word used as execute() command
 
             elif self.event == 'Certify App':
@@ -1342,6 +1631,22 @@ class App():
             elif self.event == 'Plot Data':
                 self.launch_tlmplot()
 
+            elif self.event == 'Display Page':
+                tlm_page_path = compress_abs_path(os.path.join(self.path, self.ini_config.get('PATHS','TLM_PAGE_PATH')))
+                page_file = sg.popup_get_file('Select a telemetry page definition file', title='Display Page', initial_folder=tlm_page_path,
+                                              file_types=(('Page Files', '*.json'),), keep_on_top=True)
+                if page_file:
+                    self.open_tlm_view(f'page {page_file}')
+                    self.display_event(f'Created telemetry page for {os.path.basename(page_file)}')
+
+            elif self.event == 'Link Quality':
+                if self.link_quality_panel is None:
+                    self.link_quality_panel = LinkQualityPanel(self.link_analytics, self.cmd_tlm_router.get_link_stats,
+                                                               compress_abs_path(os.path.join(self.path, '..')))
+                    self.link_quality_panel.create_window()
+                else:
+                    self.link_quality_panel.window.bring_to_front()
+
             elif self.event == 'Run Perf Monitor':
                 subprocess.Popen("java -jar ../perf-monitor/CPM.jar",shell=True)  #TODO - Use ini file path definition
 
@@ -1469,17 +1774,17 @@ class App():
  
             elif self.event == '-CREATE_CFS-':
             
-                if self.cfs_subprocess is None:
+                if not self.cfs_supervisor.is_active():
                     build_cfs_script = os.path.join(self.path, Cfs.SH_BUILD_CFS_TOPICIDS)
-                    build_cfs_target(build_cfs_script, self.cfs_abs_base_path, self.window)
+                    build_cfs_target(build_cfs_script, self.cfs_abs_base_path, self.cfs_supervisor)
                 else:
                     sg.popup("A cFS image is currently running. You must stop the current image prior to building a new image.", title='Build cFS', keep_on_top=True, non_blocking=True, grab_anywhere=True, modal=False)
                 
             elif self.event == '-BUILD_CFS-':
             
-                if self.cfs_subprocess is None:
+                if not self.cfs_supervisor.is_active():
                     build_cfs_script = os.path.join(self.path, Cfs.SH_MAKE_INSTALL_CFS)
-                    build_cfs_target(build_cfs_script, self.cfs_abs_base_path, self.window)
+                    build_cfs_target(build_cfs_script, self.cfs_abs_base_path, self.cfs_supervisor)
                 else:
                     sg.popup("A cFS image is currently running. You must stop the current image prior to building a new image.", title='Build cFS', keep_on_top=True, non_blocking=True, grab_anywhere=True, modal=False)
 
@@ -1500,17 +1805,11 @@ class App():
                 #                                       stdout=self.cfs_pty_slave, stderr=self.cfs_pty_slave, close_fds=True,
                 #                                       shell=True) #, bufsize=1, universal_newlines=True)                
                 print(f'popen_str: {popen_str}')
-                self.cfs_subprocess = subprocess.Popen(popen_str, stdout=subprocess.PIPE, shell=True, 
-                                                       bufsize=1, universal_newlines=True,
-                                                       preexec_fn = lambda : (os.setsid(), os.nice(10)))
-                time.sleep(2.0)
-                if self.cfs_subprocess is not None:
-                    self.window["-CFS_IMAGE-"].update(os.path.join(cfs_abs_exe_path, self.cfs_exe_file))
-                    time.sleep(1.0)
-                    self.enable_telemetry()
-                    self.cfs_stdout = CfsStdout(self.cfs_subprocess, self.window)
-                    self.cfs_stdout.start()
-                    self.tlm_monitor.check_stale_tlm(BasecampTelemetryMonitor.MON_CMD_START_CFS)       
+                # The supervisor reports the start and startup complete through cfs_status_queue
+                if self.cfs_supervisor.is_active():
+                    self.cfs_supervisor.restart_cfs(popen_str)
+                else:
+                    self.cfs_supervisor.start_cfs(popen_str)
                 """ 
                 #todo: Kill current thread if running
                 #todo: history_setting_filename doesn't seem to do anything. My goal is to save cFS image locations across app invocations 
@@ -1525,10 +1824,8 @@ class App():
                     self.cfs_popen = sg.execute_command_subprocess(self.cfs_exe_str, cwd=cfs_dir)
                 """
             elif self.event == '-STOP_CFS-':
-                if self.cfs_subprocess is not None:
-                    logger.info("Killing cFS Process")
-                    os.killpg(os.getpgid(self.cfs_subprocess.pid), signal.SIGTERM)  # Send the signal to all the process groups
-                    self.cfs_subprocess = None
+                logger.info("Stopping cFS Process")
+                self.cfs_supervisor.stop_cfs()
                 self.window["-CFS_IMAGE-"].update(self.GUI_NO_IMAGE_TXT)
                 self.window["-CFS_TIME-"].update(EdsMission.NULL_TLM_STR)
                 self.tlm_monitor.check_stale_tlm(BasecampTelemetryMonitor.MON_CMD_STOP_CFS) 
@@ -1788,18 +2085,18 @@ class App():
                 tlm_topic = self.values['-TLM_TOPICS-']
                 if tlm_topic != EdsMission.TOPIC_TLM_TITLE_KEY:                    
                     app_name = self.tlm_server.get_app_name_from_topic(tlm_topic)
-                    tlm_screen_cmd_parms = f'{self.tlm_screen_port} {app_name} {tlm_topic}'
-                    self.cmd_tlm_router.add_gnd_tlm_dest(self.tlm_screen_port)
-                    self.tlm_screen = sg.execute_py_file("tlmscreen.py", parms=tlm_screen_cmd_parms, cwd=self.cfs_interface_dir)
-                    self.display_event(f'Created telemetry screen for {tlm_topic} on port {self.tlm_screen_port}')
-                    self.tlm_screen_port += 1
+                    self.open_tlm_view(f'screen {app_name} {tlm_topic}')
+                    self.display_event(f'Created telemetry screen for {tlm_topic}')
                 else:
                     sg.popup('Please select a telemetry topic from the dropdown list', title='Telemetry Topic', keep_on_top=True, non_blocking=True, grab_anywhere=True, modal=False)
                 
             elif self.event == '-CLEAR_EVENTS-':
-                self.event_log = ""
+                self.event_view.clear()
                 self.display_event('Cleared event display')
 
+            elif self.event == '-EVENT_SEARCH-':
+                self.event_view.set_filter(text=self.values['-EVENT_SEARCH-'])
+
         self.shutdown()
 
         return restart
@@ -24,11 +24,34 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
-from .cfeconstants  import Cfe
-from .edsmission    import EdsMission, CfeEdsTarget
-from .telecommand   import TelecommandInterface, TelecommandScript
-from .telemetry     import TelemetryMessage, TelemetryObserver, TelemetryServer, TelemetrySocketServer, TelemetryQueueServer
-from .cmdtlmrouter  import CmdTlmRouter, RouterCmd
-from .cmdtlmprocess import CmdProcess, CmdTlmProcess
-from .targetcontrol import TargetControl
+import importlib
+
+# Modules are imported when one of their names is first used so a process only
+# loads the EDS, GUI and MQTT dependencies of the classes it uses
+LAZY_EXPORTS = {
+    'cfeconstants':  ['Cfe'],
+    'edsmission':    ['EdsMission', 'CfeEdsTarget', 'TopicIndex'],
+    'edscache':      ['EdsCache', 'rebuild_cache'],
+    'telecommand':   ['TelecommandInterface', 'TelecommandScript'],
+    'telemetry':     ['TelemetryMessage', 'TelemetryObserver', 'TelemetryServer', 'TelemetrySocketServer', 'TelemetryQueueServer'],
+    'cmdtlmrouter':  ['CmdTlmRouter', 'RouterCmd', 'RemoteCmdPolicy'],
+    'cmdtlmprocess': ['CmdProcess', 'CmdTlmProcess'],
+    'tlmhistory':    ['TelemetryHistory'],
+    'tlmlimits':     ['TelemetryLimits'],
+    'tlmderived':    ['DerivedTelemetry'],
+    'tlmcvt':        ['TelemetryCvt', 'TelemetryCvtReader'],
+    'tlmdecode':     ['TelemetryDecodePool'],
+    'tlmlink':       ['BoundedQueue', 'LinkMonitor'],
+    'tlmanalytics':  ['LinkAnalytics', 'LinkQualityPanel'],
+    'eventstore':    ['EventStore', 'EventView'],
+    'targetcontrol': ['TargetControl'],
+}
+LAZY_EXPORT_MODULES = {name: module for module, names in LAZY_EXPORTS.items() for name in names}
+
+def __getattr__(name):
+    if name not in LAZY_EXPORT_MODULES:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f'.{LAZY_EXPORT_MODULES[name]}', __name__), name)
+    globals()[name] = value
+    return value
 
@@ -104,9 +104,16 @@ class CfeFile(CfeEdsTarget):
         self.data_loaded = False
         self.tbl_data_array = []   # 2 column matrix with each row containing EDS parameter string and its value
         self.topic_name = None
-        self.topic_dict = self.eds_mission.get_tbl_topic_dict()
         print(f'self.topic_dict: {self.topic_dict}')
         
+    def load_topics(self):
+        """
+        Files are identified by the table topics rather than the telemetry topics
+        """
+        super().load_topics()
+        self.topic_dict  = self.eds_mission.get_tbl_topic_dict()
+        self.topic_index = self.eds_mission.get_topic_index(self.id)
+
     def extract_data(self, base_object, base_name):
         """
         Inputs:
@@ -167,7 +174,8 @@ class CfeFile(CfeEdsTarget):
                     file_hdr_len_hi = self.file_data[8]  << 8 | self.file_data[9]
                     file_hdr_len    = file_hdr_len_hi << 16 | file_hdr_len_lo
                     print(f'file_hdr_len: {file_hdr_len}')  
-                    self.topic_id = self.topic_dict[topic_name] + 3
+                    self.topic_id = self.topic_index.get_app_id(topic_name)
+                    stream_id = list(self.topic_index.get_stream_id(self.topic_id).to_bytes(2,byteorder='big'))
                     tlm_msg_len = len(self.file_data) + 5
                     print(f'self.topic_id: {self.topic_id}, tlm_msg_len: {tlm_msg_len}') 
                     tlm_msg_len = list(tlm_msg_len.to_bytes(2,byteorder='big'))
@@ -176,7 +184,7 @@ class CfeFile(CfeEdsTarget):
                     tlm_msg_len_hi = tlm_msg_len[0]
                     print(f'tlm_len_hi: {tlm_msg_len_hi}, tlm_len_lo: {tlm_msg_len_lo}')
                     #                                      Sequence    Length                          Seconds                 SubSecs
-                    self.ccsds_hdr = [0x08, self.topic_id, 0xD7, 0xC2, tlm_msg_len_hi, tlm_msg_len_lo, 0x00, 0x01, 0x02, 0x03, 0x04, 0x05]
+                    self.ccsds_hdr = [stream_id[0], stream_id[1], 0xD7, 0xC2, tlm_msg_len_hi, tlm_msg_len_lo, 0x00, 0x01, 0x02, 0x03, 0x04, 0x05]
                     
                     self.file_len = self.file_len + 12
                     self.file_len = list(self.file_len.to_bytes(4,byteorder='big'))
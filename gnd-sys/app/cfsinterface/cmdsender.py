@@ -27,7 +27,6 @@ import os
 import socket
 import configparser
 from queue import Queue
-from datetime import datetime
 
 import logging
 logger = logging.getLogger(__name__)
@@ -38,11 +37,13 @@ if __name__ == '__main__':
     from telecommand   import TelecommandScript
     from telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
     from cmdtlmprocess import CmdTlmProcess
+    from eventstore    import EventStore, EventView
 else:
     from .cfeconstants  import Cfe
     from .telecommand   import TelecommandScript
     from .telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
     from .cmdtlmprocess import CmdTlmProcess
+    from .eventstore    import EventStore, EventView
 from tools import crc_32c, compress_abs_path, bin_hex_decode, bin_hex_encode, TextEditor
 
 import FreeSimpleGUI as sg
@@ -247,11 +248,12 @@ class CmdSender(CmdTlmProcess):
     """
     Provide a user interface for issuing commands from a command sender file.
     """
-    def __init__(self, mission_name, cmd_sender_path, gnd_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, browser_tlm_timeout):
+    def __init__(self, mission_name, cmd_sender_path, gnd_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, browser_tlm_timeout, event_log_file=None):
         super().__init__(mission_name, gnd_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, browser_tlm_timeout)
 
         self.cmd_sender_path = cmd_sender_path
-        self.event_history = ""
+        self.event_store = EventStore('CMD_SENDER', log_file=event_log_file)
+        self.event_view  = EventView(self.event_store)
         self.init_cycle = True
         self.help_text = HelpText()
             
@@ -260,16 +262,17 @@ class CmdSender(CmdTlmProcess):
         self.cmd_sender_comments = []
             
     def event_callback(self, event_txt):
-        self.display_event(event_txt)
+        """
+        Called from the telemetry thread. The event view is refreshed by the GUI loop.
+        """
+        self.update_event_history_str(event_txt)
             
     def update_event_history_str(self, new_event_text):
-        time = datetime.now().strftime("%H:%M:%S")
-        event_str = time + " - " + new_event_text + "\n"        
-        self.event_history += event_str
+        self.event_store.add(new_event_text)
  
     def display_event(self, new_event_text):
         self.update_event_history_str(new_event_text)
-        self.window["-EVENT_TEXT-"].update(self.event_history)
+        self.event_view.refresh()
                 
     def get_filename(self, gui_filename):
         """
@@ -320,10 +323,11 @@ class CmdSender(CmdTlmProcess):
             [sg.MLine(default_text='', font=log_font, enable_events=True, size=(window_width,5), key='-COMMENT_LIST-')],
             #[sg.Column(self.command_col, element_justification='c'), sg.VSeperator(), sg.Column(self.comment_col, element_justification='c')],
             [sg.Text('Events', font=pri_hdr_font), sg.Button('Clear', enable_events=True, key='-CLEAR_EVENTS-', pad=(5,1))],
-            [sg.MLine(default_text=self.event_history, font=log_font, enable_events=True, size=(window_width, 5), key='-EVENT_TEXT-')]]
+            [sg.MLine(default_text='', font=log_font, enable_events=True, size=(window_width, 5), key='-EVENT_TEXT-')]]
             
  
-        self.window = sg.Window('Commmand Sender', self.layout, resizable=True)
+        self.window = sg.Window('Commmand Sender', self.layout, resizable=True, finalize=True)
+        self.event_view.attach(self.window['-EVENT_TEXT-'])
         
         self.tlm_monitors = {'CFE_ES': {'HK_TLM': ['Seconds']}, 'FILE_MGR': {'DIR_LIST_TLM': ['Seconds']}}        
         self.tlm_monitor = CmdSenderTelemetryMonitor(self.tlm_server, self.tlm_monitors, self.event_callback)
@@ -332,6 +336,7 @@ class CmdSender(CmdTlmProcess):
         while True:
 
             self.event, self.values = self.window.read(timeout=100)
+            self.event_view.refresh()
         
             if self.init_cycle:
                 self.init_cycle = False
@@ -376,7 +381,7 @@ class CmdSender(CmdTlmProcess):
                 self.help_text.display()
                 
             elif self.event == '-CLEAR_EVENTS-':
-                self.event_history = ""
+                self.event_view.clear()
                 self.display_event("Cleared event display")
                    
         self.shutdown()
@@ -407,7 +412,8 @@ if __name__ == '__main__':
     sender_cmd_port = config.getint('NETWORK','CMD_SENDER_CMD_PORT')
     sender_tlm_port = config.getint('NETWORK','CMD_SENDER_TLM_PORT')
     mission_name     = config.get('CFS_TARGET','MISSION_EDS_NAME')
+    event_log_file   = compress_abs_path(os.path.join(os.getcwd(), '..', '..', config.get('APP','EVENT_LOGS')))
     
-    cmd_sender = CmdSender(mission_name, cmd_sender_path, cfs_ip_addr, router_ctrl_port, sender_cmd_port, sender_tlm_port, 1.0)
+    cmd_sender = CmdSender(mission_name, cmd_sender_path, cfs_ip_addr, router_ctrl_port, sender_cmd_port, sender_tlm_port, 1.0, event_log_file)
     cmd_sender.execute()
     
@@ -23,6 +23,7 @@ import sys
 import time
 import os
 import socket
+import threading
 from queue import Queue
 
 if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
@@ -47,14 +48,16 @@ class CmdProcess():
 
         self.cfs_cmd_queue = Queue()
         self.cmd_script = TelecommandScript(mission_name, 'cpu1', self.cfs_cmd_queue)  #TODO - Use kwarg?
+        self.cmd_lock = threading.Lock()  # Commands may be sent from the GUI and telemetry threads
        
        
     def send_cfs_cmd(self, app_name, cmd_name, cmd_payload):
-        (cmd_sent, cmd_text, cmd_status) = self.cmd_script.send_cfs_cmd(app_name, cmd_name, cmd_payload)
-        if 'Error' not in cmd_status:
-            datagram = self.cfs_cmd_queue.get()
-            print(f'CmdTlmProcess sending {app_name}:{cmd_name} to router {self.router_cmd_socket_addr}')
-            self.router_cmd_socket.sendto(datagram, self.router_cmd_socket_addr)
+        with self.cmd_lock:
+            (cmd_sent, cmd_text, cmd_status) = self.cmd_script.send_cfs_cmd(app_name, cmd_name, cmd_payload)
+            if 'Error' not in cmd_status:
+                datagram = self.cfs_cmd_queue.get()
+                print(f'CmdTlmProcess sending {app_name}:{cmd_name} to router {self.router_cmd_socket_addr}')
+                self.router_cmd_socket.sendto(datagram, self.router_cmd_socket_addr)
 
    
 ###############################################################################
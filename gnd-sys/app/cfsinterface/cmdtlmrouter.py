@@ -21,26 +21,62 @@
          output apps. 
       2. The app that creates the router communicates via queues to the router.
          The router supports additional UDP command and telemetry connections.
-         Commands from mutliple UDP command sockets are not sent to the cFS and
-         are placed in a queue that can be read by the parent app. This allows
-         the app to serve as a single point for managing flight commands. 
-         Telemetry is routed from the cFS socket to multiple telemetry
-         monitors.
+         Commands from mutliple UDP command sockets are checked by a remote
+         command policy and the allowed commands are sent to the cFS by the
+         router. The app can install its own policy with set_remote_cmd_policy()
+         and reads a notification for each logged or denied command from
+         the remote command notification queue. This allows the app to serve
+         as a single point for managing flight commands without the commands
+         passing through the app. Telemetry is routed from the cFS socket to
+         multiple telemetry monitors.
       3. 'Ground telemetry' is cFS telemetry sent to multiple ground telemetry
          destinations. It is not telemetry from a ground source.
+      4. The app can supply BoundedQueues for the ground telemetry, cFS
+         command and remote command notification queues so a slow consumer
+         can't grow memory without limit. The notification queue is bounded
+         by default because it's only read when the app polls it.
+         The router's LinkMonitor counts CCSDS sequence gaps before packets
+         are queued so link loss is counted separately from queue drops. See
+         get_link_stats().
          
 """
+import os
+import sys
 import socket
 import logging
 from queue import Queue
 from threading import Thread, Lock
 
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    sys.path.append('..')
+    from tlmlink import BoundedQueue, LinkMonitor, set_rcvbuf, udp_socket_drops
+else:
+    from .tlmlink import BoundedQueue, LinkMonitor, set_rcvbuf, udp_socket_drops
+
 logger = logging.getLogger("router")
 
 class RouterCmd():
    CLOSE_PORT      = 'ClosePort'
    SET_CFS_IP_ADDR = 'SetCfsIpAddr'
-   
+
+
+class RemoteCmdPolicy():
+   """
+   Remote command policy actions. A policy is a function with the signature
+   policy(datagram, host, cmd_port) that returns one of the actions:
+     ALLOW - Send the command to the cFS
+     LOG   - Send the command to the cFS and post a notification
+     DENY  - Discard the command and post a notification
+   """
+   ALLOW = 'Allow'
+   LOG   = 'Log'
+   DENY  = 'Deny'
+
+   @staticmethod
+   def log_all(datagram, host, cmd_port):
+      return RemoteCmdPolicy.LOG
+
+
 ###############################################################################
 
 class CmdSource():
@@ -80,9 +116,15 @@ class CmdTlmRouter(Thread):
     The router and cFS command input designs are identical. Using a queue for
     router control commands is a little overkill since the only ground command 
     is to remove a telemetry port. 
+    gnd_tlm_queue and cfs_cmd_queue default to unbounded queues,
+    remote_cmd_notify_queue defaults to REMOTE_CMD_NOTIFY_QUEUE_SIZE and
+    rcvbuf_size of zero uses the OS default cFS telemetry socket buffer size.
     """
+    REMOTE_CMD_NOTIFY_QUEUE_SIZE = 1000
+
     def __init__(self, cfs_ip_addr, cfs_cmd_port, 
-                 gnd_ip_addr, router_ctrl_port, gnd_tlm_port, gnd_tlm_timeout):
+                 gnd_ip_addr, router_ctrl_port, gnd_tlm_port, gnd_tlm_timeout,
+                 gnd_tlm_queue=None, cfs_cmd_queue=None, rcvbuf_size=0, remote_cmd_notify_queue=None):
     
         super().__init__()
 
@@ -97,7 +139,10 @@ class CmdTlmRouter(Thread):
         
         self.cfs_cmd_source = {}
         self.cfs_cmd_source_queue = Queue()
-        self.cfs_cmd_queue  = Queue()
+        self.cfs_cmd_queue  = BoundedQueue(name='cFS command queue') if cfs_cmd_queue is None else cfs_cmd_queue
+        self.remote_cmd_policy = RemoteCmdPolicy.log_all
+        self.remote_cmd_notify_queue = (BoundedQueue(self.REMOTE_CMD_NOTIFY_QUEUE_SIZE, BoundedQueue.DROP_OLDEST, 'Remote command notify queue')
+                                        if remote_cmd_notify_queue is None else remote_cmd_notify_queue)  # (action, datagram, cmd_port)
         
         # Ground Commands & Telemetry
         
@@ -112,9 +157,11 @@ class CmdTlmRouter(Thread):
 
         self.gnd_tlm_socket = None
         self.gnd_tlm_port   = gnd_tlm_port
-        self.gnd_tlm_queue  = Queue()
+        self.gnd_tlm_queue  = BoundedQueue(name='Ground telemetry queue') if gnd_tlm_queue is None else gnd_tlm_queue
         self.gnd_tlm_socket_addr = (self.gnd_ip_addr, self.gnd_tlm_port)
         self.gnd_tlm_timeout = gnd_tlm_timeout
+        self.gnd_tlm_rcvbuf_size = rcvbuf_size
+        self.link_monitor = LinkMonitor()
 
         self.tlm_dest_mutex  = Lock()
         self.tlm_dest_addr   = {}
@@ -140,8 +187,14 @@ class CmdTlmRouter(Thread):
     def add_cfs_cmd_source(self, cmd_port):
         self.cfs_cmd_source[cmd_port] = CmdSource(self.cfs_ip_addr, cmd_port, 0.2)  #TODO - Decide on timeout management
         
-    def get_cfs_cmd_source_queue(self):
-        return self.cfs_cmd_source_queue
+    def get_remote_cmd_notify_queue(self):
+        return self.remote_cmd_notify_queue
+
+    def set_remote_cmd_policy(self, policy):
+        """
+        See RemoteCmdPolicy. The policy is called from the router thread.
+        """
+        self.remote_cmd_policy = policy
 
     def remove_cfs_cmd_source(self, cmd_port):
         try:
@@ -167,6 +220,18 @@ class CmdTlmRouter(Thread):
     def get_gnd_tlm_queue(self):
         return self.gnd_tlm_queue
 
+    def get_link_stats(self):
+        """
+        Return the telemetry loss counters. kernel-drops is None if the OS
+        doesn't report them.
+        """
+        stats = self.link_monitor.get_totals()
+        stats['kernel-drops']  = None if self.gnd_tlm_socket is None else udp_socket_drops(self.gnd_tlm_socket)
+        stats['gnd-tlm-queue'] = self.gnd_tlm_queue.get_stats()
+        stats['cfs-cmd-queue'] = self.cfs_cmd_queue.get_stats()
+        stats['remote-cmd-notify-queue'] = self.remote_cmd_notify_queue.get_stats()
+        return stats
+
     def add_gnd_tlm_dest(self, tlm_port):
         self.tlm_dest_mutex.acquire()
         self.tlm_dest_addr[tlm_port] = (self.gnd_ip_addr, tlm_port)
@@ -201,6 +266,7 @@ class CmdTlmRouter(Thread):
         
         self.gnd_tlm_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.gnd_tlm_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        set_rcvbuf(self.gnd_tlm_socket, self.gnd_tlm_rcvbuf_size)
         self.gnd_tlm_socket.bind(self.gnd_tlm_socket_addr)
         self.gnd_tlm_socket.setblocking(False)
         self.gnd_tlm_socket.settimeout(self.gnd_tlm_timeout)
@@ -226,10 +292,13 @@ class CmdTlmRouter(Thread):
         be acceptable for STEM education type projects.
         """
         # Process cFS Commands
-        # 1. Put commands from all sources on self.cfs_cmd_source_queue
-        # 2. Send all commands from self.cfs_cmd_source_queue
-        for cmd_source in self.cfs_cmd_source:
-            self.cfs_cmd_source[cmd_source].read_cmd_port(self.cfs_cmd_source_queue)
+        # 1. Send the commands from each source that are allowed by the remote command policy
+        # 2. Send all commands from self.cfs_cmd_queue
+        for cmd_port, cmd_source in list(self.cfs_cmd_source.items()):
+            cmd_source.read_cmd_port(self.cfs_cmd_source_queue)
+            while not self.cfs_cmd_source_queue.empty():
+                datagram, host = self.cfs_cmd_source_queue.get()
+                self.route_remote_cmd(datagram, host, cmd_port)
 
         while not self.cfs_cmd_queue.empty():
             datagram = self.cfs_cmd_queue.get()
@@ -241,6 +310,7 @@ class CmdTlmRouter(Thread):
             while True:
                 datagram, host = self.gnd_tlm_socket.recvfrom(4096)
                 logger.debug(f'Received datagram: size={len(datagram)} {host}\n{self.datagram_to_str(datagram)}')
+                self.link_monitor.update(datagram)
                 self.gnd_tlm_queue.put((datagram, host))
                 self.tlm_dest_mutex.acquire()
                 for dest_addr in self.tlm_dest_addr:
@@ -269,6 +339,19 @@ class CmdTlmRouter(Thread):
                 logger.info(f'Invalid router command recieved: {str(cmd_token)}')
 
 
+    def route_remote_cmd(self, datagram, host, cmd_port):
+        try:
+            action = self.remote_cmd_policy(datagram, host, cmd_port)
+        except Exception as e:
+            logger.error(f'Remote command policy error, denying command from port {cmd_port}: {e}')
+            action = RemoteCmdPolicy.DENY
+        if action != RemoteCmdPolicy.DENY:
+            self.cfs_cmd_socket.sendto(datagram, self.cfs_cmd_socket_addr)
+            logger.debug(f'Sent remote command from port {cmd_port}:\n{self.datagram_to_str(datagram)}')
+        if action != RemoteCmdPolicy.ALLOW:
+            self.remote_cmd_notify_queue.put((action, datagram, cmd_port))
+
+
     def tlm_dest_connect_thread(self):
         
         logger.info('Starting tlm_dest_connect_thread')
@@ -0,0 +1,250 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Cache dictionaries derived from the EDS libraries between process starts
+
+    Notes:
+      1. Building the target, topic and command dictionaries iterates the EDS
+         interface database through the python bindings which dominates the
+         start up time of every tool process. EdsCache stores the
+         dictionaries in a JSON file per mission so only the first process
+         after a cFS build iterates the database.
+      2. The cache is keyed by a build hash of the EDS library files. The hash
+         uses each file's path, size and modification time so it's computed
+         without reading the libraries. A hash mismatch discards every entry.
+      3. Entries are written to a temporary file that replaces the cache file
+         so concurrent processes never read a partially written cache. Values
+         must be JSON serializable and dictionary keys must be strings.
+      4. rebuild_cache() builds a mission's cache in a new process so a
+         process can prepare the cache for a new cFS build without loading
+         the new EDS libraries itself. See EdsMission.hot_reload().
+      5. Run 'python3 edscache.py [mission]' to benchmark the tool process
+         start up time with a cold and a warm cache. 'python3 edscache.py
+         --build [mission]' builds the cache.
+"""
+
+import sys
+import os
+import json
+import glob
+import time
+import hashlib
+import threading
+import subprocess
+
+import logging
+logger = logging.getLogger(__name__)
+
+EDS_CACHE_PATH    = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'cache')
+EDS_CACHE_VERSION = 1
+
+
+def eds_lib_files(mission_name, module_files):
+    """
+    Return the EDS library files that define a mission's database: the
+    python binding modules and the mission's shared libraries in the
+    binding directories and LD_LIBRARY_PATH.
+    """
+    lib_files = set()
+    lib_dirs  = set()
+    for module_file in module_files:
+        if module_file is not None:
+            lib_files.add(os.path.abspath(module_file))
+            lib_dirs.add(os.path.dirname(os.path.abspath(module_file)))
+    for lib_dir in os.environ.get('LD_LIBRARY_PATH', '').split(os.pathsep):
+        if lib_dir:
+            lib_dirs.add(os.path.abspath(lib_dir))
+    for lib_dir in lib_dirs:
+        lib_files.update(glob.glob(os.path.join(lib_dir, f'*{mission_name}*.so*')))
+    return sorted(lib_files)
+
+
+def eds_build_hash(lib_files):
+    build_hash = hashlib.sha1()
+    for lib_file in lib_files:
+        try:
+            stat = os.stat(lib_file)
+            build_hash.update(f'{lib_file}:{stat.st_size}:{stat.st_mtime_ns};'.encode('utf-8'))
+        except OSError:
+            build_hash.update(f'{lib_file}:missing;'.encode('utf-8'))
+    return build_hash.hexdigest()
+
+
+###############################################################################
+
+class EdsCache():
+    """
+    Persistent dictionary of EDS derived values for one mission
+    """
+    def __init__(self, mission_name, lib_files, cache_path=EDS_CACHE_PATH):
+
+        self.mission_name = mission_name
+        self.lib_files  = lib_files
+        self.cache_file = os.path.join(cache_path, f'eds_{mission_name}.json')
+        self.lock = threading.Lock()
+        self.build_hash = None
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """
+        Compute the build hash and load the entries that match it
+        """
+        with self.lock:
+            self.build_hash = eds_build_hash(self.lib_files)
+            self.entries = self.read_entries()
+
+    def read_entries(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+            if cache.get('version') == EDS_CACHE_VERSION and cache.get('build-hash') == self.build_hash:
+                return cache['entries']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def get(self, key, build_value):
+        """
+        Return the cached value for key. If key isn't cached build_value() is
+        called and its value is saved.
+        """
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+        value = build_value()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            # Merge with entries other processes may have saved since this cache was loaded
+            entries = self.read_entries()
+            entries.update(self.entries)
+            entries[key] = value
+            self.entries = entries
+            if eds_build_hash(self.lib_files) != self.build_hash:
+                # The libraries were rebuilt so the file belongs to the new build
+                return
+            tmp_file = f'{self.cache_file}.{os.getpid()}'
+            try:
+                os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+                with open(tmp_file, 'w') as f:
+                    json.dump({'version': EDS_CACHE_VERSION, 'build-hash': self.build_hash, 'entries': entries}, f, separators=(',',':'))
+                os.replace(tmp_file, self.cache_file)
+            except OSError as e:
+                logger.error(f'Error writing EDS cache file {self.cache_file}: {e}')
+
+    def snapshot(self):
+        with self.lock:
+            return (self.build_hash, self.entries)
+
+    def restore(self, snapshot):
+        """
+        Restore the in-memory entries returned by snapshot(). The cache file
+        isn't changed.
+        """
+        with self.lock:
+            self.build_hash, self.entries = snapshot
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            try:
+                os.remove(self.cache_file)
+            except OSError:
+                pass
+
+
+###############################################################################
+
+def build_cache(mission_name):
+    """
+    Build every cached dictionary of a mission. The EdsMission objects
+    populate the cache as a side effect.
+    """
+    from edsmission import EdsMission
+    tlm_mission = EdsMission(mission_name, EdsMission.TELEMETRY_IF)
+    tlm_mission.get_target_dict()
+    tlm_mission.get_topic_dict()
+    tlm_mission.get_tbl_topic_dict()
+    tlm_mission.get_app_id_dict()
+    cmd_mission = EdsMission(mission_name, EdsMission.TELECOMMAND_IF)
+    cmd_mission.get_topic_dict()
+    cmd_mission.get_command_dict(EdsMission.TOPIC_CMD_TITLE_KEY)
+
+
+def rebuild_cache(mission_name, timeout=120):
+    """
+    Clear and build a mission's cache in a new process. Returns True if the
+    cache was built.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    EdsCache(mission_name, []).clear()
+    try:
+        result = subprocess.run([sys.executable, os.path.basename(__file__), '--build', mission_name], cwd=cwd,
+                                capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error(f'Building the {mission_name} EDS cache timed out after {timeout} seconds')
+        return False
+    if result.returncode != 0:
+        logger.error(f'Error building the {mission_name} EDS cache:\n{result.stderr}')
+    return result.returncode == 0
+
+
+STARTUP_BENCHMARK = """
+import sys, time
+start = time.perf_counter()
+sys.path.append('..')
+from telemetry   import TelemetrySocketServer
+from telecommand import TelecommandScript
+import_time = time.perf_counter() - start
+start = time.perf_counter()
+tlm_server = TelemetrySocketServer('{mission}', 'cpu1', '127.0.0.1', 8000, 0, 1.0)
+cmd_script = TelecommandScript('{mission}', 'cpu1', None)
+cmd_script.get_topic_commands(list(cmd_script.topic_dict)[-1])
+print(import_time, time.perf_counter() - start)
+"""
+
+def benchmark(mission_name, runs):
+    """
+    Time a tool process's imports and EDS object construction in new
+    interpreters. The first run uses an empty cache.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    script = STARTUP_BENCHMARK.format(mission=mission_name)
+    for run in range(runs):
+        if run == 0:
+            EdsCache(mission_name, []).clear()
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', script], cwd=cwd, capture_output=True, text=True)
+        total_time = time.perf_counter() - start
+        if result.returncode != 0:
+            print(result.stderr)
+            return
+        import_time, eds_time = [float(t) for t in result.stdout.split()[-2:]]
+        cache = 'cold' if run == 0 else 'warm'
+        print(f'{cache} cache: process {total_time:.3f}s, imports {import_time:.3f}s, EDS objects {eds_time:.3f}s')
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--build':
+        build_cache(sys.argv[2] if len(sys.argv) > 2 else 'basecamp')
+    else:
+        mission_name = sys.argv[1] if len(sys.argv) > 1 else 'basecamp'
+        runs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+        benchmark(mission_name, runs)
+
@@ -43,15 +43,24 @@
 """
 
 from abc import ABC, abstractmethod
-import sys
+import os
 import importlib
 import time
+import gc
+import threading
+import weakref
+import contextlib
 import logging
 logger = logging.getLogger(__name__)
 
 import EdsLib
 import CFE_MissionLib
 
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    from edscache import EdsCache, eds_lib_files
+else:
+    from .edscache import EdsCache, eds_lib_files
+
 ###############################################################################
 
 class EdsMission:
@@ -60,6 +69,15 @@ class EdsMission:
     toolchain. This class should not be used as a base class because the EDS
     libraries should not be extended beynd what the build toolchain generates.
     Objects of this class should be owned by classes like CfeTarget. 
+
+    The EDS database is loaded when it's first used. The dictionaries built
+    from the interface are saved in an EdsCache that is shared by the
+    process's EdsMission objects so most processes never iterate the
+    database.
+
+    CfeEdsTargets use acquire() so a process has one reference counted
+    EdsMission for each mission and interface. The targets share its database
+    and dictionaries. The dictionaries must be treated as read only.
     """
     
     #todo: Are there invalid ID conventions in the EDS to use as default values & for validity checks
@@ -82,30 +100,155 @@ class EdsMission:
     TOPIC_TBL_TITLE_KEY = "-- Table Topic --"
     COMMAND_TITLE_KEY   = "-- Command --"
     
+    CCSDS_APID_MASK    = 0x07FF
+    CCSDS_TLM_STREAM   = 0x0800  # Primary header word 1 of a telemetry packet with a secondary header
+    PROBE_TLM_HDR_LEN  = 64      # Longer than the telemetry header of every header type
+    
+    caches = {}    # mission_name: EdsCache
+    registry = {}  # (mission_name, interface_type): EdsMission shared by the process's targets
+    registry_lock = threading.RLock()
+    
     def __init__(self, mission_name, interface_type):
         self.mission_name = mission_name
         self.interface_type = interface_type
-        self.load_eds_database()
-
-    def reload_libs(self):
-        print('reload_libs')
-        #importlib.invalidate_caches()
-        #importlib.reload(EdsLib)
-        #importlib.reload(CFE_MissionLib)
-        for m in ['EdsLib', 'CFE_MissionLib']:
-            print('m=',m)
-            if m in sys.modules:
-                del(sys.modules[m])
-                print('reload_libs deleted ',m)
+        self.ref_cnt = 0
+        self.targets = weakref.WeakSet()
+        self._db = None  # (lib_db, cfe_db, interface) replaced as a unit so users never see a partial reload
+        self.topic_indexes = {}  # target instance ID: TopicIndex
+        with EdsMission.registry_lock:
+            if mission_name not in EdsMission.caches:
+                module_files = [getattr(EdsLib, '__file__', None), getattr(CFE_MissionLib, '__file__', None)]
+                EdsMission.caches[mission_name] = EdsCache(mission_name, eds_lib_files(mission_name, module_files))
+        self.cache = EdsMission.caches[mission_name]
+
+    @classmethod
+    def acquire(cls, mission_name, interface_type):
+        """
+        Return the process's EdsMission for the mission and interface. Each
+        acquire() must be paired with a release().
+        """
+        with cls.registry_lock:
+            eds_mission = cls.registry.get((mission_name, interface_type))
+            if eds_mission is None:
+                eds_mission = cls(mission_name, interface_type)
+                cls.registry[(mission_name, interface_type)] = eds_mission
+            eds_mission.ref_cnt += 1
+            return eds_mission
+
+    def release(self):
+        """
+        The database is released when the last user releases the object
+        """
+        with EdsMission.registry_lock:
+            self.ref_cnt -= 1
+            if self.ref_cnt <= 0 and EdsMission.registry.get((self.mission_name, self.interface_type)) is self:
+                del EdsMission.registry[(self.mission_name, self.interface_type)]
+                self._db = None
+
+    def add_target(self, target):
+        """
+        Targets are refreshed when the database is reloaded
+        """
+        self.targets.add(target)
+
+    def get_db(self):
+        db = self._db
+        if db is None:
+            with EdsMission.registry_lock:
+                if self._db is None:
+                    self.load_eds_database()
+                db = self._db
+        return (None, None, None) if db is None else db
+
+    @property
+    def lib_db(self):
+        return self.get_db()[0]
+
+    @property
+    def cfe_db(self):
+        return self.get_db()[1]
+
+    @property
+    def interface(self):
+        return self.get_db()[2]
 
     def load_eds_database(self):
-        try:
-            self.lib_db     = EdsLib.Database(self.mission_name)
-            self.cfe_db     = CFE_MissionLib.Database(self.mission_name, self.lib_db)  #cfe_db => CFE_MissionLib.Database(self.mission_name), type => CFE_MissionLib.Database
-            self.interface  = self.cfe_db.Interface(self.interface_type)
-        except RuntimeError:
-            print("Error accessing EDS libraries. Verify your LD_LIBRARY_PATH, PYTHONPATH environment variable settings and mission name")
-            logger.error("Error accessing EDS libraries. Verify your LD_LIBRARY_PATH, PYTHONPATH environment variable settings and mission name")
+        with EdsMission.registry_lock:
+            # A (re)loaded database may be a new build so the cache's build hash is recomputed
+            self.cache.load()
+            try:
+                lib_db    = EdsLib.Database(self.mission_name)
+                cfe_db    = CFE_MissionLib.Database(self.mission_name, lib_db)  #cfe_db => CFE_MissionLib.Database(self.mission_name), type => CFE_MissionLib.Database
+                interface = cfe_db.Interface(self.interface_type)
+                self._db  = (lib_db, cfe_db, interface)
+                self.topic_indexes = {}
+            except RuntimeError:
+                print("Error accessing EDS libraries. Verify your LD_LIBRARY_PATH, PYTHONPATH environment variable settings and mission name")
+                logger.error("Error accessing EDS libraries. Verify your LD_LIBRARY_PATH, PYTHONPATH environment variable settings and mission name")
+
+    def reload(self):
+        """
+        Reload the database and refresh the dictionaries of every target
+        that shares this object. The registry lock is held so no target
+        acquires the object or loads the database during the reload.
+        """
+        with EdsMission.registry_lock:
+            self.load_eds_database()
+            self.load_target_topics()
+
+    def load_target_topics(self):
+        for target in list(self.targets):
+            try:
+                target.load_topics()
+            except RuntimeError:
+                logger.error(f'Error reloading EDS topics for target {target.target_name}')
+
+    @classmethod
+    def hot_reload(cls, mission_name):
+        """
+        Swap a rebuilt EDS database into every target of a mission without
+        restarting the process. The cache should be rebuilt first using
+        edscache.rebuild_cache() so the swap only loads the libraries.
+
+        The EdsLib bindings keep one database object per mission name and
+        load the database library by name so the previous database must be
+        released before the new build can be loaded. Every target's eds_lock
+        is held during the swap so telemetry servers finish the packet they're
+        decoding and decode the packets received during the swap with the new
+        database.
+
+        Returns False if the previous database is still referenced. The
+        previous database and dictionaries remain in use and the process must
+        be restarted to use the new build.
+        """
+        with cls.registry_lock:
+            eds_missions = [eds_mission for key, eds_mission in cls.registry.items() if key[0] == mission_name]
+            targets = [target for eds_mission in eds_missions for target in list(eds_mission.targets)]
+            cache = cls.caches.get(mission_name)
+            with contextlib.ExitStack() as target_locks:
+                for target in targets:
+                    target_locks.enter_context(target.eds_lock)
+                prev_db = None
+                for eds_mission in eds_missions:
+                    if eds_mission._db is not None:
+                        prev_db = weakref.ref(eds_mission._db[0])
+                    eds_mission._db = None
+                for target in targets:
+                    target.release_eds_objects()
+                gc.collect()
+                released = (prev_db is None or prev_db() is None)
+                if not released:
+                    logger.error(f'The {mission_name} EDS database is still referenced so the new build was not loaded')
+                prev_cache = None if cache is None else cache.snapshot()
+                for eds_mission in eds_missions:
+                    eds_mission.load_eds_database()
+                if released:
+                    for eds_mission in eds_missions:
+                        eds_mission.load_target_topics()
+                elif prev_cache is not None:
+                    # The bindings returned the previous database so keep its dictionaries
+                    cache.restore(prev_cache)
+        return released
 
     
     
@@ -115,10 +258,12 @@ class EdsMission:
         target[0] = Name (string)
         target[1] = ID (integer)
         """
-        target_dict = { EdsMission.TARGET_TITLE_KEY: EdsMission.NULL_ID }
-        for target in self.cfe_db:
-            target_dict[target[0]] = target[1]
-        return target_dict
+        def build_target_dict():
+            target_dict = { EdsMission.TARGET_TITLE_KEY: EdsMission.NULL_ID }
+            for target in self.cfe_db:
+                target_dict[target[0]] = target[1]
+            return target_dict
+        return self.cache.get('targets', build_target_dict)
     
     
     def has_target(self, target_name):
@@ -145,16 +290,18 @@ class EdsMission:
         Telecommand topic = (topic name, ID) => ('CFE_ES/Application/CMD', 1)
         Telemetry topic   = (topic name, ID) => ('CFE_ES/Application/HK_TLM', 61)
         """
-        if self.interface_type == EdsMission.TELECOMMAND_IF:
-            topic_dict = {EdsMission.TOPIC_CMD_TITLE_KEY: EdsMission.NULL_ID}
-        else:
-            topic_dict = {EdsMission.TOPIC_TLM_TITLE_KEY: EdsMission.NULL_ID}
-
-        for topic in self.interface:
-            if not topic[0].endswith(EdsMission.TBL_FILE_TOKEN):
-                topic_dict[topic[0]] = topic[1]
+        def build_topic_dict():
+            if self.interface_type == EdsMission.TELECOMMAND_IF:
+                topic_dict = {EdsMission.TOPIC_CMD_TITLE_KEY: EdsMission.NULL_ID}
+            else:
+                topic_dict = {EdsMission.TOPIC_TLM_TITLE_KEY: EdsMission.NULL_ID}
+
+            for topic in self.interface:
+                if not topic[0].endswith(EdsMission.TBL_FILE_TOKEN):
+                    topic_dict[topic[0]] = topic[1]
         
-        return dict(sorted(topic_dict.items()))
+            return dict(sorted(topic_dict.items()))
+        return self.cache.get(f'{self.interface_type}:topics', build_topic_dict)
 
     def get_tbl_topic_dict(self):
         """
@@ -162,14 +309,69 @@ class EdsMission:
         proxy telemetry with a naming convention of ending the topic name
         with EdsMission.TBL_FILE_TOKEN
         """
-        topic_dict = {EdsMission.TOPIC_TBL_TITLE_KEY: EdsMission.NULL_ID}
+        def build_tbl_topic_dict():
+            topic_dict = {EdsMission.TOPIC_TBL_TITLE_KEY: EdsMission.NULL_ID}
 
-        for topic in self.interface:
-            print(f'topic[0]: {topic[0]}')
-            if topic[0].endswith(EdsMission.TBL_FILE_TOKEN):
-                topic_dict[topic[0]] = topic[1]
+            for topic in self.interface:
+                print(f'topic[0]: {topic[0]}')
+                if topic[0].endswith(EdsMission.TBL_FILE_TOKEN):
+                    topic_dict[topic[0]] = topic[1]
         
-        return dict(sorted(topic_dict.items()))
+            return dict(sorted(topic_dict.items()))
+        return self.cache.get(f'{self.interface_type}:tbl-topics', build_tbl_topic_dict)
+
+    def get_command_dict(self, topic_name):
+        """
+        Return a dictionary of a telecommand topic's commands or None if the
+        topic doesn't have commands. The commands of every topic are cached
+        when the first topic is requested.
+        Command = (command name, ID) => ('Noop', 1130)
+        """
+        def build_command_dicts():
+            command_dicts = {}
+            for topic in self.interface:
+                try:
+                    command_dicts[topic[0]] = {command[0]: command[1] for command in self.interface.Topic(topic[1])}
+                except RuntimeError:
+                    pass
+            return command_dicts
+        return self.cache.get(f'{self.interface_type}:commands', build_command_dicts).get(topic_name)
+
+    def get_app_id_dict(self):
+        """
+        Return the CCSDS AppIds of each telemetry topic ID keyed by the topic ID
+        string. The mission library's message ID mapping (header type, topic ID
+        base and instance bits) is defined by the mission's EDS parameters so
+        the AppIds are found by asking the library to decode a telemetry header
+        with each AppId. A topic has an AppId for each target instance the
+        header type can encode, in ascending order.
+        Topic ID AppIds = (topic ID string, AppIds) => ('61', [0, 64, 128, ...])
+        """
+        def build_app_id_dict():
+            app_id_dict = {}
+            header = bytearray(EdsMission.PROBE_TLM_HDR_LEN)
+            header[2:6] = (0xC0, 0x00, 0x00, EdsMission.PROBE_TLM_HDR_LEN-7)  # Unsegmented, CCSDS length is total length - 7 
+            for app_id in range(EdsMission.CCSDS_APID_MASK+1):
+                header[0:2] = (EdsMission.CCSDS_TLM_STREAM | app_id).to_bytes(2, byteorder='big')
+                try:
+                    eds_id, topic_id = self.cfe_db.DecodeEdsId(bytes(header))
+                except RuntimeError:
+                    continue
+                app_id_dict.setdefault(str(topic_id), []).append(app_id)
+            return app_id_dict
+        return self.cache.get('app-ids', build_app_id_dict)
+
+    def get_topic_index(self, instance_id):
+        """
+        Return the TopicIndex of a target instance's telemetry and table topics
+        """
+        topic_index = self.topic_indexes.get(instance_id)
+        if topic_index is None:
+            topic_dict = dict(self.get_topic_dict())
+            topic_dict.update(self.get_tbl_topic_dict())
+            topic_index = TopicIndex(topic_dict, self.get_app_id_dict(), instance_id)
+            self.topic_indexes[instance_id] = topic_index
+        return topic_index
 
     def get_eds_id_from_topic(self, topic_name):
         """
@@ -226,6 +428,65 @@ class EdsMission:
         return (eds_entry, eds_object)
 
         
+###############################################################################
+
+class TopicIndex:
+    """
+    Map a target instance's telemetry topics between topic names, topic IDs,
+    CCSDS AppIds, CCSDS stream IDs and (app name, message name) pairs. The
+    maps are built once from the EdsMission dictionaries so every lookup is
+    a dictionary access. Lookups of undefined values return
+    EdsMission.NULL_ID or None. The maps must be treated as read only.
+    """
+    def __init__(self, topic_dict, app_id_dict, instance_id):
+
+        self.instance_id = instance_id
+        self.topic_ids   = {}  # topic name: topic ID
+        self.app_ids     = {}  # topic name: AppId
+        self.topic_id_app_ids = {}  # topic ID: AppId
+        self.app_id_topics    = {}  # AppId: topic name
+        self.app_msg_app_ids  = {}  # (APP_NAME, MSG_NAME): AppId
+        
+        for topic_name, topic_id in topic_dict.items():
+            app_ids = app_id_dict.get(str(topic_id))
+            if not app_ids:
+                continue
+            # An instance's AppId is its entry in the topic's AppIds, header types without instance bits have one AppId
+            app_id = app_ids[min(max(instance_id, 0), len(app_ids)-1)]
+            self.topic_ids[topic_name] = topic_id
+            self.app_ids[topic_name]   = app_id
+            self.topic_id_app_ids[topic_id] = app_id
+            self.app_id_topics[app_id] = topic_name
+            topic_token = topic_name.split('/')
+            if len(topic_token) == 3:
+                self.app_msg_app_ids[(topic_token[0].upper(), topic_token[2].upper())] = app_id
+
+    def get_app_id(self, topic_name):
+        return self.app_ids.get(topic_name, EdsMission.NULL_ID)
+
+    def get_app_id_from_names(self, app_name, msg_name):
+        return self.app_msg_app_ids.get((app_name.upper(), msg_name.upper()), EdsMission.NULL_ID)
+
+    def get_app_id_from_topic_id(self, topic_id):
+        return self.topic_id_app_ids.get(topic_id, EdsMission.NULL_ID)
+
+    def get_topic(self, app_id):
+        return self.app_id_topics.get(app_id)
+
+    def get_topic_id(self, app_id):
+        topic_name = self.app_id_topics.get(app_id)
+        return EdsMission.NULL_ID if topic_name is None else self.topic_ids[topic_name]
+
+    def get_stream_id(self, app_id):
+        """
+        Return the first primary header word of the AppId's telemetry packets
+        """
+        return EdsMission.CCSDS_TLM_STREAM | app_id
+
+    def get_app_id_from_stream_id(self, stream_id):
+        return stream_id & EdsMission.CCSDS_APID_MASK
+
+
 ###############################################################################
 
 class CfeEdsTarget:
@@ -237,16 +498,34 @@ class CfeEdsTarget:
     def __init__(self, mission_name, target_name, interface):
             
         self.mission_name = mission_name
-        self.eds_mission  = EdsMission(mission_name, interface)
+        self.eds_mission  = EdsMission.acquire(mission_name, interface)
         self.target_name  = target_name
+        self.eds_lock     = threading.RLock()  # Held while using EDS objects in threads other than the GUI's
+        self.eds_mission.add_target(self)
+        weakref.finalize(self, self.eds_mission.release)
 
         self.reload_eds_database(False)
  
      
     def reload_eds_database(self, load_database=True):
+        """
+        load_database reloads the EDS database which refreshes every target
+        that shares the mission and interface
+        """
         if load_database:
-            self.eds_mission.load_eds_database()
+            self.eds_mission.reload()
+        else:
+            self.load_topics()
+
+    def release_eds_objects(self):
+        """
+        Release the EDS objects created from the current database so it can
+        be unloaded by EdsMission.hot_reload(). Child classes that keep EDS
+        objects override this.
+        """
+        pass
 
+    def load_topics(self):
         self.topic_dict = {}
         self.topic_id   = EdsMission.NULL_ID
         
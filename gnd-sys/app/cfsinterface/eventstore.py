@@ -0,0 +1,257 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Store and display flight and ground event messages
+
+    Notes:
+      1. EventStore keeps the most recent events in a bounded ring with
+         indexes by app name and event type. Every event is also appended to
+         a JSON lines log file so the full session history is kept on disk
+         without growing memory. Multiple processes may append to the same
+         log file, each record identifies its source.
+      2. Events can be added from any thread. Each event has a sequence
+         number so views can fetch only the events added since their last
+         refresh.
+      3. EventView displays the last N events, optionally filtered, in a
+         Multiline element. New events are appended and the oldest lines are
+         deleted so a refresh costs the number of new events rather than the
+         length of the history.
+"""
+
+import json
+import threading
+from collections import deque
+from datetime import datetime
+
+import logging
+logger = logging.getLogger(__name__)
+
+EVENT_TYPE_DEBUG = 'DEBUG'
+EVENT_TYPE_INFO  = 'INFORMATION'
+EVENT_TYPE_ERROR = 'ERROR'
+EVENT_TYPE_CRIT  = 'CRITICAL'
+
+EVENT_SOURCE_FSW = 'FSW'
+
+
+###############################################################################
+
+class EventRecord():
+    """
+    A single event. sc_time is the spacecraft time in seconds for flight
+    events and None for ground events.
+    """
+    __slots__ = ('seq', 'time', 'source', 'app_name', 'event_id', 'event_type', 'message', 'sc_time', 'search_text')
+
+    def __init__(self, seq, time, source, app_name, event_id, event_type, message, sc_time=None):
+        self.seq        = seq
+        self.time       = time
+        self.source     = source
+        self.app_name   = app_name
+        self.event_id   = event_id
+        self.event_type = event_type
+        self.message    = message
+        self.sc_time    = sc_time
+        self.search_text = f'{app_name} {message}'.lower()
+
+    def is_fsw(self):
+        return self.source == EVENT_SOURCE_FSW
+
+    def to_json(self):
+        return json.dumps({'time': self.time.isoformat(timespec='milliseconds'), 'source': self.source, 'app': self.app_name,
+                           'id': self.event_id, 'type': self.event_type, 'sc-time': self.sc_time, 'message': self.message})
+
+    def __str__(self):
+        time = self.time.strftime("%H:%M:%S")
+        if self.is_fsw():
+            return f'{time} - FSW Event at {int(self.sc_time)}: {self.app_name}, {self.event_type} - {self.message}'
+        return f'{time} - {self.message}'
+
+
+###############################################################################
+
+class EventStore():
+    """
+    Bounded in-memory event history backed by an append-only log file
+    """
+    def __init__(self, source, depth=1000, log_file=None):
+
+        self.source = source
+        self.depth  = depth
+        self.lock   = threading.Lock()
+        self.seq    = 0
+        self.ring   = deque()
+        self.app_index  = {}  # app_name: deque of EventRecord
+        self.type_index = {}  # event_type: deque of EventRecord
+
+        self.log_file = log_file
+        self.log = None
+        if log_file is not None:
+            try:
+                self.log = open(log_file, 'a', buffering=1)
+            except OSError as e:
+                logger.error(f'Error opening event log file {log_file}: {e}')
+
+    def add(self, message, app_name=None, event_type=EVENT_TYPE_INFO, event_id=0):
+        """
+        Add a ground event. app_name defaults to the store's source.
+        """
+        return self.append(self.source, self.source if app_name is None else app_name, event_id, event_type, message)
+
+    def add_fsw_event(self, app_name, event_id, event_type, message, sc_time):
+        return self.append(EVENT_SOURCE_FSW, app_name, event_id, event_type, message, sc_time)
+
+    def append(self, source, app_name, event_id, event_type, message, sc_time=None):
+        with self.lock:
+            self.seq += 1
+            record = EventRecord(self.seq, datetime.now(), source, app_name, event_id, event_type, message, sc_time)
+            if len(self.ring) >= self.depth:
+                oldest = self.ring.popleft()
+                # The oldest event is always the first entry of its indexes
+                self.app_index[oldest.app_name].popleft()
+                self.type_index[oldest.event_type].popleft()
+            self.ring.append(record)
+            self.app_index.setdefault(app_name, deque()).append(record)
+            self.type_index.setdefault(event_type, deque()).append(record)
+            if self.log is not None:
+                try:
+                    self.log.write(record.to_json() + '\n')
+                except OSError as e:
+                    logger.error(f'Error writing event log file {self.log_file}: {e}')
+                    self.log = None
+        return record
+
+    def query(self, app_name=None, event_type=None, text=None, since_seq=0, limit=None):
+        """
+        Return the matching events in the ring, oldest first. text is a case
+        insensitive substring of the app name or message. limit returns the
+        most recent matches.
+        """
+        with self.lock:
+            if app_name is not None:
+                records = tuple(self.app_index.get(app_name, ()))
+            elif event_type is not None:
+                records = tuple(self.type_index.get(event_type, ()))
+            else:
+                records = tuple(self.ring)
+        text = None if not text else text.lower()
+        matches = []
+        for record in reversed(records):
+            if record.seq <= since_seq or (limit is not None and len(matches) >= limit):
+                break
+            if event_type is not None and record.event_type != event_type:
+                continue
+            if text is not None and text not in record.search_text:
+                continue
+            matches.append(record)
+        matches.reverse()
+        return matches
+
+    def search_log(self, text, limit=None):
+        """
+        Search the full session history in the log file. Returns a list of
+        record dictionaries, oldest first.
+        """
+        if self.log_file is None:
+            return []
+        text = text.lower()
+        matches = deque(maxlen=limit)
+        try:
+            with open(self.log_file) as f:
+                for line in f:
+                    if text in line.lower():
+                        try:
+                            matches.append(json.loads(line))
+                        except ValueError:
+                            continue
+        except OSError as e:
+            logger.error(f'Error reading event log file {self.log_file}: {e}')
+        return list(matches)
+
+    def apps(self):
+        with self.lock:
+            return sorted(app_name for app_name, records in self.app_index.items() if len(records) > 0)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+###############################################################################
+
+class EventView():
+    """
+    Display the last rows events of an EventStore in a Multiline element.
+    refresh() must be called from the GUI thread.
+    """
+    def __init__(self, event_store: EventStore, rows=200):
+
+        self.event_store = event_store
+        self.rows = rows
+        self.element  = None
+        self.last_seq = 0
+        self.line_cnt = 0
+        self.filter   = {}
+
+    def attach(self, element):
+        """
+        element is a Multiline. The current events are displayed.
+        """
+        self.element = element
+        self.rebuild()
+
+    def set_filter(self, app_name=None, event_type=None, text=None):
+        self.filter = {'app_name': app_name, 'event_type': event_type, 'text': text}
+        self.rebuild()
+
+    def clear(self):
+        """
+        Clear the display. The events remain in the store.
+        """
+        self.last_seq = self.event_store.seq
+        self.line_cnt = 0
+        if self.element is not None:
+            self.element.Widget.delete('1.0', 'end')
+
+    def rebuild(self):
+        if self.element is None:
+            return
+        self.element.Widget.delete('1.0', 'end')
+        self.line_cnt = 0
+        self.last_seq = 0
+        self.refresh()
+
+    def refresh(self):
+        """
+        Append the events added since the last refresh and delete the lines
+        that scrolled out of the view
+        """
+        if self.element is None or self.event_store.seq == self.last_seq:
+            return
+        store_seq = self.event_store.seq
+        records = self.event_store.query(since_seq=self.last_seq, limit=self.rows, **self.filter)
+        if len(records) == 0:
+            self.last_seq = store_seq
+            return
+        self.last_seq = max(store_seq, records[-1].seq)
+        widget = self.element.Widget
+        widget.insert('end', ''.join(str(record) + '\n' for record in records))
+        self.line_cnt += len(records)
+        if self.line_cnt > self.rows:
+            widget.delete('1.0', f'{self.line_cnt - self.rows + 1}.0')
+            self.line_cnt = self.rows
+        widget.see('end')
+
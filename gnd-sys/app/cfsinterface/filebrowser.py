@@ -26,8 +26,11 @@ import time
 import os
 import socket
 import configparser
-from queue import Queue
-from datetime import datetime
+import json
+import threading
+import bisect
+from queue import Queue, PriorityQueue, Empty
+from collections import deque
 
 import logging
 logger = logging.getLogger(__name__)
@@ -38,12 +41,14 @@ if __name__ == '__main__':
     from telecommand   import TelecommandScript
     from telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
     from cmdtlmprocess import CmdTlmProcess
+    from eventstore    import EventStore, EventView
 else:
     from .cfeconstants  import Cfe
     from .telecommand   import TelecommandScript
     from .telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
     from .cmdtlmprocess import CmdTlmProcess
-from tools import crc_32c, compress_abs_path, bin_hex_decode, bin_hex_encode, TextEditor
+    from .eventstore    import EventStore, EventView
+from tools import crc_32c, compress_abs_path, bin_hex_decode, bin_hex_encode, TextEditor, DirWatcher, DELTA_DEL
 
 import FreeSimpleGUI as sg
     
@@ -51,62 +56,276 @@ import FreeSimpleGUI as sg
 
 class GroundDir():
     """
+    Manage the ground directory display. A DirWatcher maintains the directory's
+    stat cache and reports changes as deltas so a refresh doesn't require
+    listing and stat'ing every file. The watcher thread posts a
+    GND_DIR_DELTA_EVENT to the window and the GUI loop calls apply_deltas()
+    from its own thread.
     """
+    GND_DIR_DELTA_EVENT = '-GND_DIR_DELTA-'
+    EMPTY_DIR_STR = 'Folder empty or only contains other folders'
+    
     def __init__(self, path, sg_window: sg.Window):
         self.sg_window  = sg_window
         self.path = compress_abs_path(path if os.path.isdir(path) else "")
-        self.file_list = []
+        self.file_list = []   # Sorted display strings
+        self.file_text = {}   # filename: display string
         self.file_list_fmt_str = "{:<20} {:>8}  {:>20}"
+        self.dir_watcher = DirWatcher(self.dir_watcher_callback)
 
     def path_filename(self, filename):
         return os.path.join(self.path, filename)
 
+    def format_file_text(self, filename, file_stat):
+        return self.file_list_fmt_str.format(filename, file_stat[0], time.ctime(file_stat[1]))
+        
     def create_file_list(self, path=None):
+        """
+        Perform a full scan of the directory. This is only needed when the
+        path changes or the user requests a refresh.
+        """
         if path is not None:
             self.path = compress_abs_path(path)
-        dir_list = []
-        try:
-            dir_list = os.listdir(self.path)
-        except:
-            pass
-        
-        # Filenames only: self.file_list = [f for f in dir_list if os.path.isfile(os.path.join(self.path, f))]
-        self.file_list = []
-        for f in dir_list:
-            path_f = os.path.join(self.path, f)
-            if os.path.isfile(path_f):
-                file_stat = os.stat(path_f) 
-                file_text = self.file_list_fmt_str.format(f, file_stat.st_size, time.ctime(file_stat.st_mtime))
-                self.file_list.append(file_text)
-
+        dir_stats = self.dir_watcher.watch(self.path)
+        if not self.dir_watcher.is_alive():
+            self.dir_watcher.start()
+        self.file_text = {f: self.format_file_text(f, dir_stats[f]) for f in dir_stats}
+        self.file_list = sorted(self.file_text.values())
+        self.display_file_list()
+
+    def display_file_list(self):
         if len(self.file_list) == 0:
-            self.file_list = ['Folder empty or only contains other folders']
-        self.file_list.sort() 
-        self.sg_window.update(self.file_list)
+            self.sg_window.update([self.EMPTY_DIR_STR])
+        else:
+            self.sg_window.update(self.file_list)
+        
+    def dir_watcher_callback(self, path, deltas):
+        """
+        Called from the DirWatcher thread
+        """
+        self.sg_window.ParentForm.write_event_value(self.GND_DIR_DELTA_EVENT, (path, deltas))
+        
+    def remove_file_text(self, filename):
+        file_text = self.file_text.pop(filename, None)
+        if file_text is not None:
+            i = bisect.bisect_left(self.file_list, file_text)
+            if i < len(self.file_list) and self.file_list[i] == file_text:
+                del self.file_list[i]
+                
+    def apply_deltas(self, path, deltas):
+        """
+        Called by the GUI loop in response to a GND_DIR_DELTA_EVENT
+        """
+        if path != self.path:
+            return
+        for action, filename, file_stat in deltas:
+            self.remove_file_text(filename)
+            if action != DELTA_DEL:
+                file_text = self.format_file_text(filename, file_stat)
+                self.file_text[filename] = file_text
+                bisect.insort(self.file_list, file_text)
+        self.display_file_list()
         
     def delete_file(self, filename):
+        """
+        The directory watcher reports the change
+        """
         file_pathname = os.path.join(self.path, filename)
         if os.path.exists(file_pathname):
             os.remove(file_pathname)
         else:
             print("TODO: The file does not exist")
-        self.create_file_list(self.path)
         
     def rename_file(self, src_file, dst_file):
         src_file_pathname = os.path.join(self.path, src_file)
         if os.path.exists(src_file_pathname):
             dst_file_pathname = os.path.join(self.path, dst_file)
             os.rename(src_file_pathname, dst_file_pathname)
-            self.create_file_list(self.path)
         else:
             print("TODO: The file does not exist")
             
+    def shutdown(self):
+        self.dir_watcher.shutdown()
+
+
+###############################################################################
+
+class FlightDirListing():
+    """
+    Accumulate the DIR_LIST_TLM pages for one flight directory. FILE_MGR's
+    SendDirListTlm command returns one page per command starting at
+    DirListOffset and DirFileCnt contains the total number of directory
+    entries so the listing knows when it is complete. Entries are inserted
+    in sorted order so each page doesn't trigger a full re-sort.
+    """
+    OS_FILESTAT_MODE_DIR = 0x10000  # osapi-file.h FileModeBits
+    
+    def __init__(self, path):
+        self.path = path
+        self.dir_file_cnt  = None  # Unknown until the first page is received
+        self.next_offset   = 0
+        self.complete      = False
+        self.file_list     = []    # Sorted display strings
+        self.filenames     = set()
+        self.subdirs       = []    # Names of entries with the OSAL directory mode bit set
+        self.request_time  = time.monotonic()
+        self.complete_time = None
+
+    def add_page(self, payload, file_list_fmt_str):
+        """
+        Returns True if another page needs to be requested. A page with fewer
+        entries than the packet's file list capacity is always the last page.
+        """
+        pkt_file_cnt = int(payload.PktFileCnt)
+        self.dir_file_cnt = int(payload.DirFileCnt)
+        for entry in payload.FileList:
+            filename = str(entry['Name'])
+            if len(filename) > 0 and filename not in self.filenames:
+                self.filenames.add(filename)
+                if int(entry['Mode']) & FlightDirListing.OS_FILESTAT_MODE_DIR:
+                    bisect.insort(self.subdirs, filename)
+                file_text = file_list_fmt_str.format(filename, str(entry['Size']), str(entry['Time']))
+                bisect.insort(self.file_list, file_text)
+        self.next_offset = int(payload.DirListOffset) + pkt_file_cnt
+        if pkt_file_cnt == 0 or pkt_file_cnt < len(payload.FileList) or self.next_offset >= self.dir_file_cnt:
+            self.complete = True
+            self.complete_time = time.monotonic()
+        return not self.complete
+
+
+###############################################################################
+
+class FlightDirCache():
+    """
+    Cache completed flight directory listings by path. A listing expires after
+    ttl seconds and the FlightDir commands that modify a directory invalidate
+    its listing. Pending listings are tracked separately so telemetry pages can
+    be matched to their request using the payload's DirName.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.listings = {}
+        self.pending  = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Return a completed listing that hasn't expired or None
+        """
+        with self.lock:
+            listing = self.listings.get(path)
+            if listing is not None and (time.monotonic() - listing.complete_time) > self.ttl:
+                del self.listings[path]
+                listing = None
+            return listing
+
+    def start(self, path):
+        with self.lock:
+            listing = FlightDirListing(path)
+            self.pending[path] = listing
+            return listing
+
+    def get_pending(self, path):
+        with self.lock:
+            return self.pending.get(path)
+
+    def has_listing(self, path):
+        """
+        True if a current or pending listing exists for path
+        """
+        return path in self.pending or self.get(path) is not None
+
+    def complete(self, listing):
+        with self.lock:
+            if self.pending.get(listing.path) is listing:
+                del self.pending[listing.path]
+            self.listings[listing.path] = listing
+
+    def cancel(self, path):
+        with self.lock:
+            self.pending.pop(path, None)
+
+    def invalidate(self, *paths):
+        with self.lock:
+            for path in paths:
+                self.listings.pop(path, None)
+
+
+###############################################################################
+
+class FlightDirPrefetcher(threading.Thread):
+    """
+    Prefetch the parent and the visible subdirectories of the current flight
+    directory into the FlightDir listing cache. Requests are sent one at a
+    time at a low priority: the parent is fetched before subdirectories and a
+    prefetch is only sent when no user-initiated listing is pending. Each
+    schedule() call starts a new generation so requests queued for a
+    directory the user has left are dropped.
+    """
+    PARENT_PRIORITY = 1
+    SUBDIR_PRIORITY = 2
+    MAX_SUBDIRS     = 16    # Limit the uplink traffic for large directories
+    REQUEST_DELAY   = 0.5   # Seconds between prefetch requests
+    
+    def __init__(self, flt_dir):
+        super().__init__(daemon=True)
+        self.flt_dir = flt_dir
+        self.queue = PriorityQueue()
+        self.generation = 0
+        self.seq = 0
+        self.terminate = threading.Event()
+        
+    def schedule(self, path, subdirs):
+        self.generation += 1
+        parent_path = self.flt_dir.parent_path(path)
+        if parent_path is not None:
+            self.put(self.PARENT_PRIORITY, parent_path)
+        for dir_name in subdirs[:self.MAX_SUBDIRS]:
+            self.put(self.SUBDIR_PRIORITY, path + '/' + dir_name)
+
+    def put(self, priority, path):
+        self.seq += 1
+        self.queue.put((priority, self.seq, self.generation, path))
+        
+    def run(self):
+        while not self.terminate.is_set():
+            try:
+                priority, seq, generation, path = self.queue.get(timeout=1.0)
+            except Empty:
+                continue
+            if generation != self.generation or self.flt_dir.cache.has_listing(path):
+                continue
+            # Yield to a user-initiated listing 
+            while self.flt_dir.cache.get_pending(self.flt_dir.path) is not None and not self.terminate.is_set():
+                time.sleep(self.REQUEST_DELAY)
+            logger.debug(f'Prefetching flight directory {path}')
+            self.flt_dir.request_listing(path)
+            request_time = time.monotonic()
+            while self.flt_dir.cache.get_pending(path) is not None and not self.terminate.is_set():
+                if (time.monotonic() - request_time) > self.flt_dir.LIST_TIMEOUT:
+                    if path != self.flt_dir.path:
+                        self.flt_dir.cache.cancel(path)
+                    break
+                time.sleep(0.1)
+            self.terminate.wait(self.REQUEST_DELAY)
+
+    def shutdown(self):
+        self.terminate.set()
+        
 
 ###############################################################################
 
 class FlightDir():
     """
+    Manage the flight directory display. Listings are requested a page at a
+    time and the GUI is never blocked waiting for telemetry. The telemetry
+    callback posts a FLT_DIR_LISTING_EVENT to the window as pages arrive and
+    the GUI loop calls display_file_list() from its own thread. 
     """
+    FLT_DIR_LISTING_EVENT = '-FLT_DIR_LISTING-'
+    CACHE_TTL    = 30.0  # Seconds a completed listing is reused
+    LIST_TIMEOUT = 4.0   # Seconds to wait for a listing page
+    
     def __init__(self, path, cmd_tlm_process: CmdTlmProcess, sg_window: sg.Window):
         self.cmd_tlm_process = cmd_tlm_process
         self.sg_window = sg_window
@@ -115,31 +334,85 @@ class FlightDir():
         self.file_cnt  = 0
         self.file_list = []
         self.file_list_fmt_str = "{:<20} {:>8}  {:>8}"
+        self.cache = FlightDirCache(self.CACHE_TTL)
+        self.prefetcher = FlightDirPrefetcher(self)
         
     def path_filename(self, filename):
         return self.path + '/' + filename
     
+    def parent_path(self, path):
+        """
+        '/cf' is the base dir. split('/') will create a first element of "".
+        Returns None if path is a base dir.
+        """
+        path_list = path.split('/')
+        if len(path_list) > 2:
+            return '/'.join(path_list[:-1])
+        return None
+        
     def create_file_list(self, path=None):
+        """
+        Display the cached listing if it's current otherwise request the first
+        listing page. The remaining pages are requested by the telemetry callback.
+        """
         if path is not None:
             self.path = path
-        self.file_list = []
-        self.filename_max_len = 0
-        self.cmd_tlm_process.send_cfs_cmd('FILE_MGR', 'SendDirTlm',  {'DirName': self.path, 'IncludeSizeTime': 1})
-        time.sleep(2.0) # Give time for telemetry (FILE_MGR's SEND_DIR_TLM_DELAY impacts this)
-        if len(self.file_list) == 0:
-            self.sg_window.update(['Check cFS connection or empty/nonexistent directory'])
+        listing = self.cache.get(self.path)
+        if listing is not None:
+            self.display_listing(listing)
+            self.prefetcher.schedule(self.path, listing.subdirs)
+        else:
+            listing = self.cache.get_pending(self.path)
+            if listing is None or (time.monotonic() - listing.request_time) > self.LIST_TIMEOUT:
+                self.request_listing(self.path)
+            self.sg_window.update(['Requesting directory listing...'])
+
+    def refresh(self):
+        self.cache.invalidate(self.path)
+        self.cache.cancel(self.path)
+        self.create_file_list()
+        
+    def request_listing(self, path, offset=0):
+        if offset == 0:
+            self.cache.start(path)
+        self.cmd_tlm_process.send_cfs_cmd('FILE_MGR', 'SendDirListTlm',  {'DirName': path, 'DirListOffset': offset, 'IncludeSizeTime': 1})
 
-    def move_up(self):
+    def check_timeout(self):
         """
-        '/cf' is the base dir. split('/') will create a first element of "".
+        Called periodically by the GUI loop. A listing that doesn't complete
+        within LIST_TIMEOUT is abandoned.
+        """
+        listing = self.cache.get_pending(self.path)
+        if listing is not None and (time.monotonic() - listing.request_time) > self.LIST_TIMEOUT:
+            self.cache.cancel(self.path)
+            if len(listing.file_list) == 0:
+                self.sg_window.update(['Check cFS connection or empty/nonexistent directory'])
+            else:
+                self.display_listing(listing)
+
+    def display_file_list(self, path):
+        """
+        Called by the GUI loop in response to a FLT_DIR_LISTING_EVENT
         """
-        path_list = self.path.split('/')
-        print("path_list = " + str(path_list))
-        if len(path_list) > 2: 
-            new_path = ''
-            for dir_name in path_list[1:len(path_list)-1]:
-                new_path += '/'+ dir_name 
-            self.create_file_list(new_path)
+        if path == self.path:
+            listing = self.cache.get(path)
+            if listing is None:
+                listing = self.cache.get_pending(path)
+            if listing is not None:
+                self.display_listing(listing)
+            
+    def display_listing(self, listing):
+        self.file_list = list(listing.file_list)
+        self.file_cnt  = len(self.file_list)
+        if self.file_cnt == 0:
+            self.sg_window.update(['Empty directory'])
+        else:
+            self.sg_window.update(self.file_list)
+            
+    def move_up(self):
+        parent_path = self.parent_path(self.path)
+        if parent_path is not None: 
+            self.create_file_list(parent_path)
             
     def move_down(self, dir_name):
         """
@@ -154,171 +427,720 @@ class FlightDir():
         dir_path = self.path_filename(dir_name)
         print('dir_path = ' +  dir_path)
         self.cmd_tlm_process.send_cfs_cmd('FILE_MGR', 'CreateDir',  {'DirName': dir_path})
+        self.cache.invalidate(self.path, dir_path)
         self.create_file_list(dir_path)
 
     def delete_dir(self, dir_name):
         dir_name = self.path_filename(dir_name)
         self.cmd_tlm_process.send_cfs_cmd('FILE_MGR', 'DeleteDir',  {'DirName': dir_name})
-        self.create_file_list(self.path)
+        self.cache.invalidate(self.path, dir_name)
+        self.refresh()
 
     def delete_file(self, filename):
         filename = self.path_filename(filename)
         self.cmd_tlm_process.send_cfs_cmd('FILE_MGR', 'DeleteFile',  {'Filename': filename})
-        self.create_file_list(self.path)
+        self.refresh()
 
     def rename_file(self, src_file, dst_file):
         src_file =  self.path_filename(src_file)
         dst_file =  self.path_filename(dst_file)
         self.cmd_tlm_process.send_cfs_cmd('FILE_MGR', 'RenameFile',  {'SourceFilename': src_file, 'TargetFilename': dst_file})
-        self.create_file_list(self.path)
+        self.refresh()
 
     def filemgr_dir_list_callback(self, time, payload):
-        print("payload.DirName = "       + str(payload.DirName))
-        print("payload.DirFileCnt = "    + str(payload.DirFileCnt))
-        print("payload.PktFileCnt = "    + str(payload.PktFileCnt))
-        print("payload.DirListOffset = " + str(payload.DirListOffset))        
-        for entry in payload.FileList:
-            if (len(str(entry['Name'])) > 0):
-                file_text = self.file_list_fmt_str.format(str(entry['Name']), str(entry['Size']), str(entry['Time']))
-                self.file_list.append(file_text)
-        #print("file_list: " + str(self.file_list))
-        self.file_list.sort()
-        self.sg_window.update(self.file_list)
+        """
+        Called from the telemetry thread. Unsolicited listings, for example
+        from a SendDirTlm command sent by another tool, are accepted when they
+        start at offset 0.
+        """
+        dir_name = str(payload.DirName)
+        logger.debug(f'DIR_LIST_TLM {dir_name}: DirFileCnt {payload.DirFileCnt}, PktFileCnt {payload.PktFileCnt}, DirListOffset {payload.DirListOffset}')
+        listing = self.cache.get_pending(dir_name)
+        if listing is None:
+            if int(payload.DirListOffset) != 0:
+                return
+            listing = self.cache.start(dir_name)
+        if listing.add_page(payload, self.file_list_fmt_str):
+            self.request_listing(dir_name, listing.next_offset)
+        else:
+            self.cache.complete(listing)
+            if dir_name == self.path:
+                self.prefetcher.schedule(dir_name, listing.subdirs)
+        self.sg_window.ParentForm.write_event_value(self.FLT_DIR_LISTING_EVENT, dir_name)
 
 
 ###############################################################################
 
-class FileXfer():
+class FileXferJob():
     """
+    A single queued file transfer. Uploads send FITP data segment commands and
+    downloads receive FOTP data segment telemetry. byte_cnt, seg_cnt, and
+    file_crc always refer to the whole file so a resumed transfer reports its
+    total progress. fitp_crc is the CRC of the current FITP transaction which
+    only differs from file_crc when an upload is resumed. 
     """
-    def __init__(self, cmd_tlm_process: CmdTlmProcess):
-        self.cmd_tlm_process = cmd_tlm_process
+    UPLOAD   = 'Up'
+    DOWNLOAD = 'Down'
+    
+    QUEUED   = 'Queued'
+    ACTIVE   = 'Active'
+    PAUSED   = 'Paused'
+    DONE     = 'Done'
+    CANCELED = 'Canceled'
+    FAILED   = 'Failed'
+    
+    def __init__(self, job_id, direction, gnd_file, flt_file, bin_file):
+        self.job_id    = job_id
+        self.direction = direction
+        self.gnd_file  = gnd_file
+        self.flt_file  = flt_file
+        self.bin_file  = bin_file
+        self.state     = self.QUEUED
+        
+        self.file      = None
+        self.file_len  = os.stat(gnd_file).st_size if direction == self.UPLOAD else 0
+        self.data_seg_len = int(Cfe.FILE_XFER_DATA_SEG_LEN/2) if bin_file else Cfe.FILE_XFER_DATA_SEG_LEN # Encoding doubles the data size
+        self.byte_cnt  = 0
+        self.seg_cnt   = 0    # Data segments in the destination file
+        self.file_crc  = 0
+        self.fitp_crc  = 0
+        self.fitp_byte_cnt   = 0
+        self.fitp_seg_offset = 0  # Segments in the flight file when the FITP transaction started
+        self.data_seg_id = 0  # Last data segment ID sent or received in the current transaction
+        self.cmd_queue = deque()
+        
+        self.resume      = False  # Resume from the job's checkpoint when activated
+        self.resume_wait = None   # Telemetry a resuming job is waiting for
+        self.part_file   = None   # Flight file receiving the remainder of a resumed upload
+        self.finishing   = False  # Upload's finish commands are queued, done when they're sent
+        self.seg_crc     = deque()  # (seg_cnt, file_crc) for uploaded segments not acknowledged
+        self.ack_seg_cnt = 0
+        self.fitp_idle_cnt = 0
+
+        self.active_time = 0.0  # Seconds spent in the ACTIVE state
+        self.active_start = None
+        self.last_activity = None
+
+    def filename(self):
+        return os.path.basename(self.gnd_file)
+        
+    def is_finished(self):
+        return self.state in (self.DONE, self.CANCELED, self.FAILED)
+
+    def set_state(self, state):
+        now = time.monotonic()
+        if self.state == self.ACTIVE and state != self.ACTIVE:
+            self.active_time += now - self.active_start
+        elif state == self.ACTIVE and self.state != self.ACTIVE:
+            self.active_start  = now
+            self.last_activity = now
+        self.state = state
+        if self.is_finished() and self.file is not None:
+            self.file.close()
+            self.file = None
+        
+    def elapsed_time(self):
+        if self.state == self.ACTIVE:
+            return self.active_time + (time.monotonic() - self.active_start)
+        return self.active_time
+        
+    def throughput(self):
+        """
+        Bytes per second while active
+        """
+        elapsed_time = self.elapsed_time()
+        return self.byte_cnt/elapsed_time if elapsed_time > 0.0 else 0.0
 
-        self.recv_state    = 'IDLE'
-        self.recv_file     = None
-        self.recv_bin_file = False
-        self.recv_flt_filename = None
-        self.recv_gnd_filename = None
-        self.gnd_file_list_refresh = None  # Callback function to refresh ground display
-
-    def send_bin_file(self, gnd_file, flt_file):
-        """
-        Send a binary file to the cFS as hex encoded text file. There's interest in 
-        using NASA apps with Basecamp so binary file transfer is needed. Prior to this 
-        I didn't use the python encode/decode because I already had my FSW PktUtil_
-        functions and I didn't feel like researching a standards-based solution.
-        The data_seg_len represents the binary data length and not the encoded length.
-        """
-        max_bin_data_seg_len = int(Cfe.FILE_XFER_DATA_SEG_LEN/2) # Encoding doubles the data size
-        file_crc     = 0
-        bytes_read   = 0
-        data_seg_id  = 1
-        file_len = os.stat(gnd_file).st_size
-        
-        #TODO popup_text = f'Before SendFile command. max_bin_data_seg_len: {max_bin_data_seg_len}'
-        #TODO sg.popup(popup_text, title='FILE_XFER Debug', grab_anywhere=True, modal=False)
-        self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'StartBinFitp', {'DestFilename': flt_file})
-        
-        with open(gnd_file,'rb') as f: 
-            while True:
-                bin_data_segment = f.read(max_bin_data_seg_len)
-                if not bin_data_segment: # Null indicates EOF
-                    #TODO sg.popup('End of File', title='FILE_XFER Debug', grab_anywhere=True, modal=False)
-                    break
-                hex_data_segment = bin_hex_encode(bin_data_segment)
-                if len(hex_data_segment) != int(len(bin_data_segment)*2):
-                    popup_text = f'Error encoding binary data segment. hex_len: {len(hex_data_segment)}, bin_len: {len(bin_data_segment)}'
-                    sg.popup(popup_text, title='FILE_XFER Error', grab_anywhere=True, modal=False)                
-                #TODO popup_text = f'Before FitpDataSegment command. bin_data_segment: {len(bin_data_segment)}'
-                #TODO sg.popup(popup_text, title='FILE_XFER Debug', grab_anywhere=True, modal=False)
-                self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'FitpDataSegment', {'Id': data_seg_id, 'Len': len(bin_data_segment), 'Data': hex_data_segment})
-                file_crc = crc_32c(file_crc, bin_data_segment)
-                data_seg_id += 1
-                time.sleep(0.25)
-            #TODO sg.popup('Before FinishFitpTransfer command', title='FILE_XFER Debug', grab_anywhere=True, modal=False)
-            self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'FinishFitp', {'FileLen': file_len, 'FileCrc': file_crc, 'LastDataSegmentId': data_seg_id-1})
-
-    def send_file(self, gnd_file, flt_file):
-        """
-        Send a file to the cFS. This is a prototype 
-        TODO - Generalize to binary once the EDS binary block updates are approved
-        TODO - and implemented in cfe-eds-framework 
-        """
-        file_crc    = 0
-        bytes_read  = 0
-        data_seg_id = 1
-        file_len = os.stat(gnd_file).st_size
+    def eta(self):
+        """
+        Estimated seconds to completion or None if it can't be estimated
+        """
+        rate = self.throughput()
+        if rate > 0.0 and self.file_len > 0:
+            return max(self.file_len - self.byte_cnt, 0)/rate
+        return None
+        
+    def table_row(self):
+        progress = f'{100*self.byte_cnt//self.file_len}%' if self.file_len > 0 else '--'
+        eta = self.eta()
+        eta_str = '--' if eta is None or self.state != self.ACTIVE else time.strftime('%M:%S', time.gmtime(eta))
+        return [self.job_id, self.direction, self.filename(), progress, f'{self.throughput()/1024.0:.1f} KB/s', eta_str, self.state]
+
+    def gnd_file_identity(self):
+        """
+        Uploads are only resumed if the ground file hasn't changed
+        """
+        gnd_stat = os.stat(self.gnd_file)
+        return [gnd_stat.st_size, gnd_stat.st_mtime_ns]
+        
+    def checkpoint(self):
+        """
+        Uploads record the segments acknowledged in FILE_XFER's housekeeping
+        telemetry and downloads record the segments written to the ground file
+        """
+        if self.direction == self.UPLOAD:
+            seg_cnt, file_crc = self.ack_seg_cnt, self.ack_crc()
+        else:
+            seg_cnt, file_crc = self.seg_cnt, self.file_crc
+        return {'direction': self.direction, 'gnd-file': self.gnd_file, 'flt-file': self.flt_file, 'bin-file': self.bin_file,
+                'file-len': self.file_len, 'data-seg-len': self.data_seg_len, 'seg-cnt': seg_cnt,
+                'byte-cnt': min(seg_cnt*self.data_seg_len, self.file_len), 'file-crc': file_crc,
+                'gnd-file-id': self.gnd_file_identity() if self.direction == self.UPLOAD else None}
+
+    def ack_crc(self):
+        for seg_cnt, file_crc in self.seg_crc:
+            if seg_cnt == self.ack_seg_cnt:
+                return file_crc
+        return 0 if self.ack_seg_cnt == 0 else None
+        
+    def load_checkpoint(self, checkpoint):
+        self.file_len     = checkpoint['file-len']
+        self.data_seg_len = checkpoint['data-seg-len']
+        self.ack_seg_cnt  = checkpoint['seg-cnt']
+        self.seg_cnt      = checkpoint['seg-cnt']
+        self.byte_cnt     = checkpoint['byte-cnt']
+        self.file_crc     = checkpoint['file-crc']
+        self.gnd_file_id  = checkpoint['gnd-file-id']
+        self.resume = True
+        
+
+###############################################################################
+
+class FileXferManager(threading.Thread):
+    """
+    Run queued uploads and downloads in a background worker so the GUI event
+    loop is never blocked.
+
+    FILE_XFER supports one FITP (uplink) and one FOTP (downlink) transaction
+    at a time so one upload and one download are active concurrently and the
+    remaining jobs wait in the queue. Every command sent to the cFS, data
+    segments and control commands, consumes one slot of the uplink budget
+    which is defined in commands per second. Jobs with pending commands are
+    serviced round-robin so a long upload can't starve a download's start,
+    pause, or resume command. Cancel commands are sent immediately.
+
+    Active transfers periodically save a JSON checkpoint in checkpoint_path.
+    A checkpoint is deleted when its transfer completes or is canceled so
+    the remaining checkpoints identify interrupted transfers that can be
+    resumed:
+      - Downloads restart FOTP at the checkpoint's data segment offset after
+        truncating the ground file to the checkpoint and verifying its CRC
+      - FITP can't start at an offset so an upload resumes by asking FILE_MGR
+        for the partial flight file's size, uploading the remaining segments
+        to a part file, and concatenating the two files  
+
+    progress_callback() is called from the worker thread, at most
+    PROGRESS_PERIOD seconds apart, when a job changes. GUIs should post an
+    event to their window and then call get_table_rows() and get_events()
+    from the GUI thread.
+    """
+    PROGRESS_PERIOD  = 0.25  # Seconds
+    DOWNLINK_TIMEOUT = 15.0  # Seconds without expected telemetry before a transfer fails
+    CHECKPOINT_SEGMENTS = 16 # Downlink segments between checkpoints
+    FITP_IDLE_LIM    = 2     # Consecutive HK packets with FITP inactive before an upload fails
+    MAX_SEG_OFFSET   = 0xFFFF  # StartFotp DataSegOffset is a uint16
+    PART_FILE_SUFFIX = '.part'
+    TMP_FILE_SUFFIX  = '.tmp'
+    UPLINK_CMD_RATE  = 4.0     # Default commands per second
+    
+    def __init__(self, cmd_tlm_process: CmdTlmProcess, progress_callback, checkpoint_path=None, uplink_cmd_rate=UPLINK_CMD_RATE):
+        super().__init__(daemon=True)
+        self.cmd_tlm_process   = cmd_tlm_process
+        self.progress_callback = progress_callback
+        self.checkpoint_path   = checkpoint_path
+        self.uplink_cmd_period = 1.0/uplink_cmd_rate
+        
+        self.jobs   = []
+        self.events = deque()
+        self.next_job_id = 1
+        self.upload   = None  # Active jobs
+        self.download = None
+        self.rr_index = 0
+        self.changed  = False
+        self.last_progress = 0.0
+        self.lock = threading.RLock()
+        self.terminate = threading.Event()
+        
+        if self.checkpoint_path is not None:
+            os.makedirs(self.checkpoint_path, exist_ok=True)
+        
+    def add_upload(self, gnd_file, flt_file, bin_file):
+        return self.add_job(FileXferJob.UPLOAD, gnd_file, flt_file, bin_file)
+        
+    def add_download(self, flt_file, gnd_file, bin_file):
+        return self.add_job(FileXferJob.DOWNLOAD, gnd_file, flt_file, bin_file)
+    
+    def add_job(self, direction, gnd_file, flt_file, bin_file):
+        with self.lock:
+            job = FileXferJob(self.next_job_id, direction, gnd_file, flt_file, bin_file)
+            self.next_job_id += 1
+            self.jobs.append(job)
+            self.add_event(job, f'Queued {direction.lower()}load of {job.filename()}')
+            return job
+
+    def get_job(self, job_id):
+        with self.lock:
+            for job in self.jobs:
+                if job.job_id == job_id:
+                    return job
+        return None
+        
+    def pause(self, job_id):
+        with self.lock:
+            job = self.get_job(job_id)
+            if job is not None and job.state == FileXferJob.ACTIVE:
+                job.set_state(FileXferJob.PAUSED)
+                if job.direction == FileXferJob.DOWNLOAD:
+                    job.cmd_queue.append(('FILE_XFER', 'PauseFotp', {}))
+                self.add_event(job, f'Paused transfer of {job.filename()}')
                 
-        #TODO sg.popup("Before SendFile command", title='FILE_XFER Debug', grab_anywhere=True, modal=False)
-        self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'StartFitp', {'DestFilename': flt_file})
-
-        # https://stackoverflow.com/questions/52722787/problem-sending-binary-files-via-sockets-python
-        # send file size as big endian 64 bit value (8 bytes)
-        # self.sock.sendall(os.stat(gnd_file).st_size.tobytes(8,'big'))
-        with open(gnd_file,'r') as f: 
-            while True:
-                data_segment = f.read(Cfe.FILE_XFER_DATA_SEG_LEN) #bytearray(f.read(64))
-                if not data_segment: # Null indicates EOF
-                    break
+    def resume(self, job_id):
+        """
+        Resume a paused job or requeue a failed job from its checkpoint
+        """
+        with self.lock:
+            job = self.get_job(job_id)
+            if job is None:
+                return
+            if job.state == FileXferJob.PAUSED:
+                job.set_state(FileXferJob.ACTIVE)
+                if job.direction == FileXferJob.DOWNLOAD:
+                    job.cmd_queue.append(('FILE_XFER', 'ResumeFotp', {}))
+                self.add_event(job, f'Resumed transfer of {job.filename()}')
+            elif job.state == FileXferJob.FAILED:
+                checkpoint = self.read_checkpoint(job)
+                new_job = self.add_job(job.direction, job.gnd_file, job.flt_file, job.bin_file)
+                if checkpoint is not None:
+                    new_job.load_checkpoint(checkpoint)
+                self.jobs.remove(job)
+
+    def cancel(self, job_id):
+        cancel_cmd = None
+        with self.lock:
+            job = self.get_job(job_id)
+            if job is not None and not job.is_finished():
+                if job is self.upload:
+                    cancel_cmd = ('FILE_XFER', 'CancelFitp', {})
+                    self.upload = None
+                elif job is self.download:
+                    cancel_cmd = ('FILE_XFER', 'CancelFotp', {})
+                    self.download = None
+                job.set_state(FileXferJob.CANCELED)
+                self.delete_checkpoint(job)
+                self.add_event(job, f'Canceled transfer of {job.filename()}')
+        # Don't hold the lock during the socket send, it blocks the telemetry thread
+        if cancel_cmd is not None:
+            self.send_cmd(*cancel_cmd)
+
+    def cancel_download(self):
+        with self.lock:
+            download = self.download
+        if download is not None:
+            self.cancel(download.job_id)
+            
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if not job.is_finished()]
+            self.changed = True
+        
+    def get_table_rows(self):
+        with self.lock:
+            return [job.table_row() for job in self.jobs]
+
+    def get_events(self):
+        """
+        Return and clear the (event_text, job) list
+        """
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+    def add_event(self, job, event_text):
+        self.events.append((event_text, job))
+        self.changed = True
+        
+    def send_cmd(self, app_name, cmd_name, cmd_payload):
+        self.cmd_tlm_process.send_cfs_cmd(app_name, cmd_name, cmd_payload)
+
+    def fail_job(self, job, event_text):
+        if job.direction == FileXferJob.DOWNLOAD and job.file is not None:
+            job.file.flush()
+            self.write_checkpoint(job)
+        job.set_state(FileXferJob.FAILED)
+        self.add_event(job, event_text + '. Select Resume Transfer to continue from the last checkpoint')
+        
+    ## Checkpoints ##
+    
+    def checkpoint_filename(self, job):
+        flt_file = job.flt_file.strip('/').replace('/', '_')
+        return os.path.join(self.checkpoint_path, f'{job.direction.lower()}-{flt_file}.json')
+        
+    def write_checkpoint(self, job):
+        """
+        Write to a temporary file and rename so a checkpoint is never partially written
+        """
+        if self.checkpoint_path is None:
+            return
+        checkpoint = job.checkpoint()
+        if checkpoint['file-crc'] is None:
+            return
+        checkpoint_file = self.checkpoint_filename(job)
+        try:
+            with open(checkpoint_file + self.TMP_FILE_SUFFIX, 'w') as f:
+                json.dump(checkpoint, f, indent=2)
+            os.replace(checkpoint_file + self.TMP_FILE_SUFFIX, checkpoint_file)
+        except OSError as e:
+            logger.error(f'Error writing transfer checkpoint {checkpoint_file}: {e}')
+
+    def read_checkpoint(self, job):
+        if self.checkpoint_path is None:
+            return None
+        try:
+            with open(self.checkpoint_filename(job)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+    def delete_checkpoint(self, job):
+        if self.checkpoint_path is not None:
+            try:
+                os.remove(self.checkpoint_filename(job))
+            except OSError:
+                pass
+    
+    def get_checkpoints(self):
+        """
+        Return a list of the checkpoints for interrupted transfers
+        """
+        checkpoints = []
+        if self.checkpoint_path is not None:
+            for filename in sorted(os.listdir(self.checkpoint_path)):
+                if filename.endswith('.json'):
+                    try:
+                        with open(os.path.join(self.checkpoint_path, filename)) as f:
+                            checkpoints.append(json.load(f))
+                    except (OSError, ValueError):
+                        logger.error(f'Error reading transfer checkpoint {filename}')
+        return checkpoints
+        
+    def discard_checkpoints(self):
+        if self.checkpoint_path is not None:
+            for filename in os.listdir(self.checkpoint_path):
+                if filename.endswith('.json'):
+                    os.remove(os.path.join(self.checkpoint_path, filename))
+        
+    def resume_checkpoints(self, checkpoints):
+        with self.lock:
+            for checkpoint in checkpoints:
+                if checkpoint['direction'] == FileXferJob.UPLOAD and not os.path.exists(checkpoint['gnd-file']):
+                    continue
+                job = self.add_job(checkpoint['direction'], checkpoint['gnd-file'], checkpoint['flt-file'], checkpoint['bin-file'])
+                job.load_checkpoint(checkpoint)
                 
-                #TODO sg.popup("Before FitpDataSegment command", title='FILE_XFER Debug', grab_anywhere=True, modal=False)
-                self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'FitpDataSegment', {'Id': data_seg_id, 'Len': len(data_segment), 'Data': data_segment})
-                file_crc = crc_32c(file_crc, bytearray(data_segment,'utf-8'))
-                data_seg_id += 1
-                time.sleep(0.25)
-            #TODO sg.popup("Before FinishFitpTransfer command", title='FILE_XFER Debug', grab_anywhere=True, modal=False)
-            self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'FinishFitp', {'FileLen': file_len, 'FileCrc': file_crc, 'LastDataSegmentId': data_seg_id-1})
+    ## Worker ##
+    
+    def activate_jobs(self):
+        """
+        A finished job is replaced after its queued commands have been sent
+        """
+        if self.upload is None or (self.upload.is_finished() and len(self.upload.cmd_queue) == 0):
+            self.upload = self.next_queued_job(FileXferJob.UPLOAD)
+            if self.upload is not None:
+                self.start_upload(self.upload)
+        if self.download is None or (self.download.is_finished() and len(self.download.cmd_queue) == 0):
+            self.download = self.next_queued_job(FileXferJob.DOWNLOAD)
+            if self.download is not None:
+                self.start_download(self.download)
+
+    def next_queued_job(self, direction):
+        for job in self.jobs:
+            if job.direction == direction and job.state == FileXferJob.QUEUED:
+                return job
+        return None
+        
+    def start_upload(self, job):
+        """
+        Text files are read in text mode so data segments are sent as strings.
+        Only binary uploads can be resumed because the FITP text segment length
+        is in characters. A resumed upload waits for FILE_MGR's FILE_INFO_TLM
+        for the partial flight file before starting FITP.
+        """
+        job.set_state(FileXferJob.ACTIVE)
+        if job.resume and job.bin_file and job.gnd_file_id == job.gnd_file_identity():
+            job.resume_wait = 'FILE_INFO_TLM'
+            job.cmd_queue.append(('FILE_MGR', 'SendFileInfoTlm', {'Filename': job.flt_file, 'ComputeCrc': 0, 'CrcType': 'CRC_16'}))
+            self.add_event(job, f'Requesting {job.flt_file} size to resume upload')
+        else:
+            self.start_fitp(job, 0)
+            
+    def start_fitp(self, job, seg_cnt):
+        job.file = open(job.gnd_file, 'rb' if job.bin_file else 'r')
+        job.seg_cnt  = 0
+        job.byte_cnt = 0
+        job.file_crc = 0
+        for i in range(seg_cnt):
+            job.file_crc = crc_32c(job.file_crc, job.file.read(job.data_seg_len))
+            job.seg_cnt  += 1
+            job.byte_cnt += job.data_seg_len
+        job.fitp_crc    = 0
+        job.fitp_byte_cnt   = 0
+        job.fitp_seg_offset = seg_cnt
+        job.data_seg_id = 0
+        job.ack_seg_cnt = seg_cnt
+        job.seg_crc     = deque([(seg_cnt, job.file_crc)])
+        job.part_file   = job.flt_file + self.PART_FILE_SUFFIX if seg_cnt > 0 else None
+        dest_file = job.flt_file if job.part_file is None else job.part_file
+        job.cmd_queue.append(('FILE_XFER', 'StartBinFitp' if job.bin_file else 'StartFitp', {'DestFilename': dest_file}))
+        if seg_cnt > 0:
+            self.add_event(job, f'Resuming upload of {job.gnd_file} at segment {seg_cnt}, {job.byte_cnt} bytes')
+        else:
+            self.add_event(job, f'Started upload of {job.gnd_file} to {job.flt_file}')
 
+    def resume_upload(self, job, payload):
+        """
+        FITP writes complete segments so a partial flight file that isn't a
+        segment multiple can't be resumed
+        """
+        flt_file_len = int(payload.Size)
+        seg_cnt = flt_file_len // job.data_seg_len
+        job.resume_wait = None
+        job.last_activity = time.monotonic()
+        if flt_file_len == job.file_len:
+            job.byte_cnt = job.file_len
+            job.set_state(FileXferJob.DONE)
+            self.delete_checkpoint(job)
+            self.add_event(job, f'{job.flt_file} already complete, {job.file_len} bytes')
+        elif 0 < flt_file_len < job.file_len and (flt_file_len % job.data_seg_len) == 0:
+            self.start_fitp(job, seg_cnt)
+            checkpoint = self.read_checkpoint(job)
+            if checkpoint is not None and seg_cnt == checkpoint['seg-cnt'] and job.file_crc != checkpoint['file-crc']:
+                job.file.close()
+                self.add_event(job, f'{job.gnd_file} CRC differs from its checkpoint, restarting upload')
+                job.cmd_queue.clear()
+                self.start_fitp(job, 0)
+        else:
+            self.add_event(job, f'Unable to resume from {job.flt_file} with length {flt_file_len}, restarting upload')
+            self.start_fitp(job, 0)
+            
+    def start_download(self, job):
+        """
+        A resumed download truncates the ground file to the checkpoint's
+        segment count and verifies the remaining data against the checkpoint
+        CRC before requesting FOTP to start at the segment offset 
+        """
+        data_seg_offset = 0
+        if job.resume:
+            job.resume = False
+            try:
+                with open(job.gnd_file, 'r+b') as f:
+                    f.truncate(job.byte_cnt)
+                    file_crc = crc_32c(0, f.read())
+                if file_crc == job.file_crc and job.seg_cnt <= self.MAX_SEG_OFFSET:
+                    data_seg_offset = job.seg_cnt
+                    job.resume = True
+            except OSError:
+                pass
+        if job.resume:
+            self.add_event(job, f'Resuming download of {job.flt_file} at segment {data_seg_offset}, {job.byte_cnt} bytes')
+        else:
+            job.seg_cnt  = 0
+            job.byte_cnt = 0
+            job.file_crc = 0
+            self.add_event(job, f'Started download of {job.flt_file} to {job.gnd_file}')
+        start_cmd = 'StartBinFotp' if job.bin_file else 'StartFotp'
+        job.cmd_queue.append(('FILE_XFER', start_cmd, {'DataSegLen': job.data_seg_len, 'DataSegOffset': data_seg_offset, 'SrcFilename': job.flt_file}))
+        job.resume_wait = 'START_FOTP_TLM'
+        job.set_state(FileXferJob.ACTIVE)
+        
+    def next_upload_cmd(self, job):
+        """
+        Read the next data segment. The data_seg_len represents the binary data
+        length and not the encoded length. At EOF FinishFitp is returned and a
+        resumed upload queues the commands that reassemble the flight file. The
+        upload completes when next_cmd() has sent them.
+        """
+        data_segment = job.file.read(job.data_seg_len)
+        if data_segment:
+            bin_data_segment = data_segment if job.bin_file else bytearray(data_segment,'utf-8')
+            job.data_seg_id += 1
+            job.seg_cnt  += 1
+            job.byte_cnt += len(data_segment)
+            job.file_crc = crc_32c(job.file_crc, bin_data_segment)
+            job.fitp_crc = crc_32c(job.fitp_crc, bin_data_segment)
+            job.fitp_byte_cnt += len(data_segment)
+            job.seg_crc.append((job.seg_cnt, job.file_crc))
+            if job.bin_file:
+                data_segment = bin_hex_encode(data_segment)
+            return ('FILE_XFER', 'FitpDataSegment', {'Id': job.data_seg_id, 'Len': len(bin_data_segment), 'Data': data_segment})
+        # EOF
+        job.finishing = True
+        if job.part_file is not None:
+            # Replace the flight file with the partial file plus the part file
+            tmp_file = job.flt_file + self.TMP_FILE_SUFFIX
+            job.cmd_queue.extend([('FILE_MGR', 'ConcatenateFile', {'Source1Filename': job.flt_file, 'Source2Filename': job.part_file, 'TargetFilename': tmp_file}),
+                                  ('FILE_MGR', 'DeleteFile', {'Filename': job.flt_file}),
+                                  ('FILE_MGR', 'RenameFile', {'SourceFilename': tmp_file, 'TargetFilename': job.flt_file}),
+                                  ('FILE_MGR', 'DeleteFile', {'Filename': job.part_file})])
+        return ('FILE_XFER', 'FinishFitp', {'FileLen': job.fitp_byte_cnt, 'FileCrc': job.fitp_crc, 'LastDataSegmentId': job.data_seg_id})
+        
+    def complete_upload(self, job):
+        job.byte_cnt = job.file_len
+        job.set_state(FileXferJob.DONE)
+        self.delete_checkpoint(job)
+        self.add_event(job, f'Completed upload of {job.filename()}, {job.file_len} bytes')
+        
+    def next_cmd(self):
+        """
+        Select the next command round-robin from the active jobs
+        """
+        active_jobs = [job for job in (self.upload, self.download) if job is not None]
+        for i in range(len(active_jobs)):
+            job = active_jobs[(self.rr_index + i) % len(active_jobs)]
+            if len(job.cmd_queue) > 0:
+                cmd = job.cmd_queue.popleft()
+            elif job is self.upload and job.finishing:
+                if not job.is_finished():
+                    self.complete_upload(job)
+                continue
+            elif job is self.upload and job.state == FileXferJob.ACTIVE and job.resume_wait is None:
+                cmd = self.next_upload_cmd(job)
+            else:
+                continue
+            self.rr_index = (self.rr_index + i + 1) % len(active_jobs)
+            self.changed = True
+            return cmd
+        return None
+
+    def check_timeouts(self):
+        for job in (self.upload, self.download):
+            if job is None or job.state != FileXferJob.ACTIVE:
+                continue
+            if job.direction == FileXferJob.DOWNLOAD or job.resume_wait is not None:
+                if (time.monotonic() - job.last_activity) > self.DOWNLINK_TIMEOUT:
+                    self.fail_job(job, f'Transfer of {job.filename()} timed out')
+        
+    def run(self):
+        while not self.terminate.wait(self.uplink_cmd_period):
+            with self.lock:
+                self.activate_jobs()
+                self.check_timeouts()
+                cmd = self.next_cmd()
+                if self.upload is not None and self.upload.is_finished() and len(self.upload.cmd_queue) == 0:
+                    self.upload = None
+                if self.download is not None and self.download.is_finished() and len(self.download.cmd_queue) == 0:
+                    self.download = None
+            if cmd is not None:
+                self.send_cmd(*cmd)
+            self.report_progress()
+    
+    def report_progress(self):
+        now = time.monotonic()
+        if (now - self.last_progress) >= self.PROGRESS_PERIOD:
+            active = self.upload is not None or self.download is not None
+            if self.changed or active:
+                self.changed = False
+                self.last_progress = now
+                self.progress_callback()
+
+    ## Telemetry ##
+                
     def tlm_callback(self, tlm_msg: TelemetryMessage):
         """
+        Receive FILE_XFER and FILE_MGR file info telemetry. Called from the
+        telemetry thread. 
         """
-        print("filexfer_callback()")
         payload = tlm_msg.payload()
-        if tlm_msg.msg_name == 'START_FOTP_TLM':
-            self.recv_state = 'START'
-            print(f'Start receive file for {payload.SrcFilename} with length {payload.DataLen} binary flag {payload.BinFile}')
-            open_flags = 'w'
-            if payload.BinFile:
-                open_flags = 'wb'
-                self.recv_bin_file = True
-            self.recv_file = open(self.recv_gnd_filename, open_flags)
-        elif tlm_msg.msg_name == 'FOTP_DATA_SEGMENT_TLM':
-            self.recv_state = 'RECV_DATA'
-            print(f'Receive file data segment {payload.Id}, length {payload.Len}, data: {str(payload.Data)}')
-            if self.recv_bin_file:
-                bin_data_segment = bin_hex_decode(str(payload.Data))
-                self.recv_file.write(bin_data_segment)
+        with self.lock:
+            if tlm_msg.msg_name == 'HK_TLM':
+                self.fitp_hk_callback(payload.Fitp)
+            elif tlm_msg.msg_name == 'FILE_INFO_TLM':
+                job = self.upload
+                if job is not None and job.resume_wait == 'FILE_INFO_TLM' and str(payload.Filename) == job.flt_file:
+                    self.resume_upload(job, payload)
             else:
-                self.recv_file.write(str(payload.Data))
-        elif tlm_msg.msg_name == 'FINISH_FOTP_TLM':
-            self.recv_state = 'FINISH'
-            print(f'Finish receive file with length {payload.FileLen}, CRC {payload.FileCrc}, Last Data Segment ID {payload.LastDataSegmentId}')
-            self.recv_file.close()
-            self.recv_file     = None
-            self.recv_bin_file = False
-            if self.gnd_file_list_refresh is not None:
-                self.gnd_file_list_refresh()
-                
-    def start_recv_file(self, flt_file, gnd_file, gnd_file_list_refresh, bin_file):
-        self.recv_flt_filename = flt_file
-        self.recv_gnd_filename = gnd_file
-        self.gnd_file_list_refresh = gnd_file_list_refresh
-        if self.recv_file is not None:
-            self.recv_file.close()
-            self.recv_file = None
-        if self.recv_state not in ('IDLE', 'FINISH'):
-            self.cancel_recv_file()
-        if bin_file:
-            data_seg_len = int(Cfe.FILE_XFER_DATA_SEG_LEN/2) # Encoding doubles the data size
-            self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'StartBinFotp', {'DataSegLen': data_seg_len, 'DataSegOffset': 0, 'SrcFilename': ''.join(flt_file)})
-        else:
-            self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'StartFotp', {'DataSegLen': Cfe.FILE_XFER_DATA_SEG_LEN, 'DataSegOffset': 0, 'SrcFilename': ''.join(flt_file)})
-
+                self.fotp_callback(tlm_msg.msg_name, payload)
+            self.changed = True
 
-    def cancel_recv_file(self):
-        self.cmd_tlm_process.send_cfs_cmd('FILE_XFER', 'CancelFotp', {})
-        self.recv_state = 'IDLE'
+    def fitp_hk_callback(self, fitp):
+        """
+        Checkpoint the acknowledged upload segments. An active upload fails
+        if FITP reports it isn't active, for example after a cFS restart.
+        """
+        job = self.upload
+        if job is None or job.state != FileXferJob.ACTIVE or job.resume_wait is not None or job.data_seg_id == 0 or job.finishing:
+            return
+        dest_file = job.flt_file if job.part_file is None else job.part_file
+        if int(fitp.FileTransferActive) and str(fitp.DestFilename) == dest_file:
+            job.fitp_idle_cnt = 0
+            job.ack_seg_cnt = job.fitp_seg_offset + int(fitp.LastDataSegmentId)
+            while len(job.seg_crc) > 1 and job.seg_crc[0][0] < job.ack_seg_cnt:
+                job.seg_crc.popleft()
+            self.write_checkpoint(job)
+        else:
+            job.fitp_idle_cnt += 1
+            if job.fitp_idle_cnt >= self.FITP_IDLE_LIM:
+                self.fail_job(job, f'FITP transaction for {job.filename()} is no longer active')
+            
+    def fotp_callback(self, msg_name, payload):
+        job = self.download
+        if job is None or job.state not in (FileXferJob.ACTIVE, FileXferJob.PAUSED):
+            return
+        job.last_activity = time.monotonic()
+        if msg_name == 'START_FOTP_TLM':
+            logger.info(f'Start receive file for {payload.SrcFilename} with length {payload.DataLen} binary flag {payload.BinFile}')
+            job.resume_wait = None
+            data_len = int(payload.DataLen)
+            if job.resume and data_len != (job.file_len - job.byte_cnt):
+                # The flight file changed so restart the transfer
+                self.add_event(job, f'{job.flt_file} length differs from its checkpoint, restarting download')
+                job.resume = False
+                job.cmd_queue.append(('FILE_XFER', 'CancelFotp', {}))
+                self.start_download(job)
+                return
+            if not job.resume:
+                job.file_len = data_len
+            job.file = open(job.gnd_file, 'ab' if job.resume else 'wb')
+        elif msg_name == 'FOTP_DATA_SEGMENT_TLM':
+            if job.file is not None:
+                if job.bin_file:
+                    data_segment = bin_hex_decode(str(payload.Data))
+                else:
+                    data_segment = bytearray(str(payload.Data), 'utf-8')
+                job.file.write(data_segment)
+                job.data_seg_id = int(payload.Id)
+                job.seg_cnt  += 1
+                job.byte_cnt += len(data_segment)
+                job.file_crc = crc_32c(job.file_crc, data_segment)
+                if (job.seg_cnt % self.CHECKPOINT_SEGMENTS) == 0:
+                    job.file.flush()
+                    self.write_checkpoint(job)
+        elif msg_name == 'FINISH_FOTP_TLM':
+            logger.info(f'Finish receive file with length {payload.FileLen}, CRC {payload.FileCrc}, Last Data Segment ID {payload.LastDataSegmentId}')
+            if job.file_crc == int(payload.FileCrc):
+                job.byte_cnt = job.file_len
+                job.set_state(FileXferJob.DONE)
+                self.delete_checkpoint(job)
+                self.add_event(job, f'Completed download of {job.filename()}, {job.byte_cnt} bytes')
+            else:
+                job.set_state(FileXferJob.FAILED)
+                self.delete_checkpoint(job)
+                self.add_event(job, f'Download of {job.filename()} failed, ground CRC {job.file_crc} flight CRC {payload.FileCrc}')
             
+    def shutdown(self):
+        """
+        Checkpoint active transfers so they can be resumed
+        """
+        self.terminate.set()
+        with self.lock:
+            for job in self.jobs:
+                if job.file is not None:
+                    if job.direction == FileXferJob.DOWNLOAD and not job.is_finished():
+                        job.file.flush()
+                        self.write_checkpoint(job)
+                    job.file.close()
+                    job.file = None
+                    
 
 ###############################################################################
 
@@ -357,6 +1179,8 @@ class FileBrowserTelemetryMonitor(TelemetryObserver):
             if tlm_msg.msg_name == 'DIR_LIST_TLM':
                 payload = tlm_msg.payload()
                 self.filemgr_callback(str(tlm_msg.sec_hdr().Seconds), payload)
+            elif tlm_msg.msg_name == 'FILE_INFO_TLM':
+                self.filexfer_callback(tlm_msg)
         
         elif tlm_msg.app_name == 'CFE_EVS':
             if tlm_msg.msg_name == 'LONG_EVENT_MSG':
@@ -367,7 +1191,7 @@ class FileBrowserTelemetryMonitor(TelemetryObserver):
                 self.event_callback(event_text)
                 
         elif tlm_msg.app_name == 'FILE_XFER':
-            if 'FOTP' in tlm_msg.msg_name:
+            if 'FOTP' in tlm_msg.msg_name or tlm_msg.msg_name == 'HK_TLM':
                 self.filexfer_callback(tlm_msg)
               
                 
@@ -378,26 +1202,65 @@ class FileBrowser(CmdTlmProcess):
     Provide a user interface for managing ground and flight directories and
     files. It also supports transferring files between the flight and ground.
     """
-    def __init__(self, mission_name, gnd_path, flt_path, gnd_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, browser_tlm_timeout):
+    XFER_PROGRESS_EVENT = '-XFER_PROGRESS-'
+
+    def __init__(self, mission_name, gnd_path, flt_path, gnd_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, browser_tlm_timeout, xfer_checkpoint_path=None, event_log_file=None,
+                 xfer_cmd_rate=FileXferManager.UPLINK_CMD_RATE):
         super().__init__(mission_name, gnd_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, browser_tlm_timeout)
 
         self.default_gnd_path = gnd_path
         self.default_flt_path = flt_path
-        self.event_history = ""
+        self.xfer_checkpoint_path = xfer_checkpoint_path
+        self.xfer_cmd_rate = xfer_cmd_rate
+        self.event_store = EventStore('FILE_BROWSER', log_file=event_log_file)
+        self.event_view  = EventView(self.event_store)
         self.init_cycle = True
+        self.xfer_job_ids = []  # Job ID for each transfer table row
             
     def event_callback(self, event_txt):
-        self.display_event(event_txt)
+        """
+        Called from the telemetry thread. The event view is refreshed by the GUI loop.
+        """
+        self.update_event_history_str(event_txt)
             
     def update_event_history_str(self, new_event_text):
-        time = datetime.now().strftime("%H:%M:%S")
-        event_str = time + " - " + new_event_text + "\n"        
-        self.event_history += event_str
+        self.event_store.add(new_event_text)
  
     def display_event(self, new_event_text):
         self.update_event_history_str(new_event_text)
-        self.window["-EVENT_TEXT-"].update(self.event_history)
+        self.event_view.refresh()
                 
+    def file_xfer_progress_callback(self):
+        """
+        Called from the FileXferManager thread
+        """
+        self.window.write_event_value(self.XFER_PROGRESS_EVENT, None)
+    
+    def display_file_xfer_progress(self):
+        for event_text, job in self.file_xfer.get_events():
+            self.display_event(event_text)
+            if job.direction == FileXferJob.UPLOAD and job.state == FileXferJob.DONE:
+                if os.path.dirname(job.flt_file) == self.flt_dir.path:
+                    self.flt_dir.refresh()
+        table_rows = self.file_xfer.get_table_rows()
+        self.xfer_job_ids = [row[0] for row in table_rows]
+        self.window['-XFER_TABLE-'].update(values=table_rows)
+        
+    def offer_xfer_resume(self):
+        """
+        Offer to resume transfers that were interrupted in a previous session
+        """
+        checkpoints = self.file_xfer.get_checkpoints()
+        if len(checkpoints) > 0:
+            xfer_list = '\n'.join([f"{c['direction']}load {c['flt-file']}: {c['byte-cnt']} of {c['file-len']} bytes" for c in checkpoints])
+            if sg.popup_yes_no(f'Resume interrupted file transfers?\n\n{xfer_list}', title='Resume File Transfers', grab_anywhere=True) == 'Yes':
+                self.file_xfer.resume_checkpoints(checkpoints)
+            else:
+                self.file_xfer.discard_checkpoints()
+                        
+    def selected_xfer_job_ids(self):
+        return [self.xfer_job_ids[i] for i in self.values['-XFER_TABLE-'] if i < len(self.xfer_job_ids)]
+        
     def get_filename(self, gui_filename):
         """
         Get the filename from a GUI file listing. Both ground and flight listing
@@ -414,7 +1277,7 @@ class FileBrowser(CmdTlmProcess):
         self.gnd_col = [
             [sg.Text('Ground', font=col_title_font)],
             [sg.Text('Folder'), sg.In(self.default_gnd_path, size=(25,1), enable_events=True ,key='-GND_FOLDER-'), sg.FolderBrowse(initial_folder=self.default_gnd_path)],
-            [sg.Listbox(values=[], font=list_font, enable_events=True, size=(50,20), key='-GND_FILE_LIST-', right_click_menu=self.gnd_file_menu)]]
+            [sg.Listbox(values=[], font=list_font, enable_events=True, size=(50,20), select_mode=sg.LISTBOX_SELECT_MODE_EXTENDED, key='-GND_FILE_LIST-', right_click_menu=self.gnd_file_menu)]]
         
         # Duplicate ground names have a trailing space to differentiate them. A little kludgy but it works
         self.flt_file_menu = ['_', [ 'Refresh ', '---', 'List Dir', 'Send Text to Ground', 'Send Binary to Ground', 'Cancel Send', '---',  'Create Dir', 'Delete Dir', '---', 'Rename File ', 'Delete File ']] 
@@ -422,32 +1285,44 @@ class FileBrowser(CmdTlmProcess):
             [sg.Text('Flight', font=col_title_font)],
             [sg.Text('Folder'), sg.In(self.default_flt_path, size=(25,1), enable_events=True ,key='-FLT_FOLDER-'),
             sg.Button('▲', font='arrow_font 7', border_width=0, pad=(2,0), key='-FLT_UP-')],
-            [sg.Listbox(values=[], font=list_font, enable_events=True, size=(50,20), key='-FLT_FILE_LIST-', right_click_menu=self.flt_file_menu)]]
+            [sg.Listbox(values=[], font=list_font, enable_events=True, size=(50,20), select_mode=sg.LISTBOX_SELECT_MODE_EXTENDED, key='-FLT_FILE_LIST-', right_click_menu=self.flt_file_menu)]]
+
+        self.xfer_menu = ['_', ['Pause Transfer', 'Resume Transfer', 'Cancel Transfer', '---', 'Clear Finished']]
+        xfer_headings  = ['ID', 'Dir', 'File', 'Progress', 'Rate', 'ETA', 'State']
 
         self.layout = [
             [sg.Column(self.gnd_col, element_justification='c'), sg.VSeperator(), sg.Column(self.flt_col, element_justification='c')],
+            [sg.Text('File Transfers', font=pri_hdr_font)],
+            [sg.Table(values=[], headings=xfer_headings, font=list_font, num_rows=4, auto_size_columns=False, col_widths=[4,5,30,9,12,7,9],
+                      justification='left', key='-XFER_TABLE-', right_click_menu=self.xfer_menu)],
             [sg.Text('Ground & Flight Events', font=pri_hdr_font), sg.Button('Clear', enable_events=True, key='-CLEAR_EVENTS-', pad=(5,1))],
-            [sg.MLine(default_text=self.event_history, font=log_font, enable_events=True, size=(105, 5), key='-EVENT_TEXT-')]]
+            [sg.MLine(default_text='', font=log_font, enable_events=True, size=(105, 5), key='-EVENT_TEXT-')]]
             
  
-        self.window = sg.Window('File Browser', self.layout, resizable=True)
+        self.window = sg.Window('File Browser', self.layout, resizable=True, finalize=True)
+        self.event_view.attach(self.window['-EVENT_TEXT-'])
         
         self.flt_dir   = FlightDir(self.default_flt_path, self, self.window['-FLT_FILE_LIST-'])
         self.gnd_dir   = GroundDir(self.default_gnd_path, self.window['-GND_FILE_LIST-'])
-        self.file_xfer = FileXfer(self)
+        self.file_xfer = FileXferManager(self, self.file_xfer_progress_callback, self.xfer_checkpoint_path, self.xfer_cmd_rate)
 
         self.tlm_monitors = {'CFE_ES': {'HK_TLM': ['Seconds']}, 'FILE_MGR': {'DIR_LIST_TLM': ['Seconds']}}        
         self.tlm_monitor = FileBrowserTelemetryMonitor(self.tlm_server, self.tlm_monitors, self.event_callback, self.flt_dir.filemgr_dir_list_callback, self.file_xfer.tlm_callback)
         self.tlm_server.execute()
+        self.flt_dir.prefetcher.start()
+        self.file_xfer.start()
 
         while True:
 
             self.event, self.values = self.window.read(timeout=100)
+            self.event_view.refresh()
         
             if self.init_cycle:
                 self.init_cycle = False
                 self.gnd_dir.create_file_list(self.default_gnd_path)
                 self.flt_dir.create_file_list(self.default_flt_path)
+                self.offer_xfer_resume()
+            self.flt_dir.check_timeout()
            
 
             ### Admin ###
@@ -456,7 +1331,7 @@ class FileBrowser(CmdTlmProcess):
                 break
 
             elif self.event == '-CLEAR_EVENTS-':
-                self.event_history = ""
+                self.event_view.clear()
                 self.display_event("Cleared event display")
 
 
@@ -464,36 +1339,50 @@ class FileBrowser(CmdTlmProcess):
 
             elif self.event in ('Send Text to Flight', 'Send Binary to Flight'):
                 if len(self.values['-GND_FILE_LIST-']) > 0:
-                    filename = self.get_filename(self.values['-GND_FILE_LIST-'][0])
-                    gnd_file = self.gnd_dir.path_filename(filename)
-                    flt_file = self.flt_dir.path_filename(filename)
-                    if self.event == 'Send Text to Flight':
-                        self.file_xfer.send_file(gnd_file, flt_file)
-                    else:
-                        self.file_xfer.send_bin_file(gnd_file, flt_file)
-                    self.flt_dir.create_file_list()
+                    for gui_filename in self.values['-GND_FILE_LIST-']:
+                        filename = self.get_filename(gui_filename)
+                        gnd_file = self.gnd_dir.path_filename(filename)
+                        flt_file = self.flt_dir.path_filename(filename)
+                        self.file_xfer.add_upload(gnd_file, flt_file, self.event == 'Send Binary to Flight')
                 else:
                     sg.popup("Please select/highlight a file to be transferred to the cFS", title='Send File to Flight', grab_anywhere=True, modal=False)
             
             elif self.event in ('Send Text to Ground', 'Send Binary to Ground'):
                 if len(self.values['-FLT_FILE_LIST-']) > 0:
-                    filename = self.get_filename(self.values['-FLT_FILE_LIST-'][0])
-                    flt_file = self.flt_dir.path_filename(filename)
-                    gnd_file = self.gnd_dir.path_filename(filename)
-                    print('>>>>flt_file: %s, gnd_file: %s' % (flt_file, gnd_file))
-                    if self.event == 'Send Text to Ground':
-                        self.file_xfer.start_recv_file(flt_file, gnd_file, self.gnd_dir.create_file_list, False)
-                    else:
-                        self.file_xfer.start_recv_file(flt_file, gnd_file, self.gnd_dir.create_file_list, True)                    
-                    #TODO - Trigger ground file list display refresh
+                    # The ground directory watcher reports received files so no refresh is needed
+                    for gui_filename in self.values['-FLT_FILE_LIST-']:
+                        filename = self.get_filename(gui_filename)
+                        flt_file = self.flt_dir.path_filename(filename)
+                        gnd_file = self.gnd_dir.path_filename(filename)
+                        self.file_xfer.add_download(flt_file, gnd_file, self.event == 'Send Binary to Ground')
                 else:
                     sg.popup("Please select/highlight a file to be transferred to the ground", title='Send File to FLight', grab_anywhere=True, modal=False)
                                
             elif self.event == 'Cancel Send':
-                self.file_xfer.cancel_recv_file()
+                self.file_xfer.cancel_download()
+
+            elif self.event == self.XFER_PROGRESS_EVENT:
+                self.display_file_xfer_progress()
+
+            elif self.event in ('Pause Transfer', 'Resume Transfer', 'Cancel Transfer'):
+                for job_id in self.selected_xfer_job_ids():
+                    if self.event == 'Pause Transfer':
+                        self.file_xfer.pause(job_id)
+                    elif self.event == 'Resume Transfer':
+                        self.file_xfer.resume(job_id)
+                    else:
+                        self.file_xfer.cancel(job_id)
+                self.display_file_xfer_progress()
+
+            elif self.event == 'Clear Finished':
+                self.file_xfer.clear_finished()
+                self.display_file_xfer_progress()
 
             ### Ground ###
                 
+            elif self.event == GroundDir.GND_DIR_DELTA_EVENT:
+                self.gnd_dir.apply_deltas(*self.values[self.event])
+
             elif self.event == '-GND_FOLDER-':                         
                 self.gnd_dir.create_file_list(self.values['-GND_FOLDER-'])
 
@@ -548,6 +1437,9 @@ class FileBrowser(CmdTlmProcess):
 
             ### Flight ###
 
+            elif self.event == FlightDir.FLT_DIR_LISTING_EVENT:
+                self.flt_dir.display_file_list(self.values[self.event])
+
             elif self.event == '-FLT_FOLDER-':
                 self.flt_dir.create_file_list(self.values['-FLT_FOLDER-'])                
 
@@ -556,7 +1448,7 @@ class FileBrowser(CmdTlmProcess):
                 self.window['-FLT_FOLDER-'].update(self.flt_dir.path)
 
             elif self.event == 'Refresh ':                         
-                self.flt_dir.create_file_list()
+                self.flt_dir.refresh()
 
             elif self.event == 'List Dir':
                 if len(self.values['-FLT_FILE_LIST-']) > 0:
@@ -605,6 +1497,9 @@ class FileBrowser(CmdTlmProcess):
         
     def shutdown(self):
 
+        self.flt_dir.prefetcher.shutdown()
+        self.gnd_dir.shutdown()
+        self.file_xfer.shutdown()
         self.window.close()       
         self.tlm_server.shutdown()    
 
@@ -630,8 +1525,11 @@ if __name__ == '__main__':
     browser_cmd_port = config.getint('NETWORK','FILE_BROWSER_CMD_PORT')
     browser_tlm_port = config.getint('NETWORK','FILE_BROWSER_TLM_PORT')
     mission_name     = config.get('CFS_TARGET','MISSION_EDS_NAME')
+    xfer_checkpoint_path = compress_abs_path(os.path.join(os.getcwd(), '..', config.get('PATHS','XFER_CHECKPOINT_PATH')))
+    event_log_file   = compress_abs_path(os.path.join(os.getcwd(), '..', '..', config.get('APP','EVENT_LOGS')))
+    xfer_cmd_rate    = config.getfloat('APP','FILE_XFER_CMD_RATE')
     
-    file_browser = FileBrowser(mission_name, gnd_path, cfs_startup_path, cfs_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, 1.0)
+    file_browser = FileBrowser(mission_name, gnd_path, cfs_startup_path, cfs_ip_addr, router_ctrl_port, browser_cmd_port, browser_tlm_port, 1.0, xfer_checkpoint_path, event_log_file, xfer_cmd_rate)
     file_browser.execute()
     
     
@@ -37,11 +37,17 @@ if __name__ == '__main__':
     from telecommand   import TelecommandScript
     from telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
     from cmdtlmprocess import CmdTlmProcess
+    from tlmhistory    import TelemetryHistory
+    from tlmderived    import DerivedTelemetry
+    from tlmcvt        import TelemetryCvtReader
 else:
     from .cfeconstants  import Cfe
     from .telecommand   import TelecommandScript
     from .telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
     from .cmdtlmprocess import CmdTlmProcess
+    from .tlmhistory    import TelemetryHistory
+    from .tlmderived    import DerivedTelemetry
+    from .tlmcvt        import TelemetryCvtReader
 from tools import crc_32c, compress_abs_path, TextEditor
 import FreeSimpleGUI as sg
 
@@ -129,10 +135,20 @@ class TelemetryCurrentValue(TelemetryObserver):
 class ScriptRunner(CmdTlmProcess):
     """
     """
-    def __init__(self, mission_name, gnd_ip_addr, router_ctrl_port, script_cmd_port, script_tlm_port, script_tlm_timeout):
+    def __init__(self, mission_name, gnd_ip_addr, router_ctrl_port, script_cmd_port, script_tlm_port, script_tlm_timeout, derived_file=None, cvt_name=None):
         super().__init__(mission_name, gnd_ip_addr, router_ctrl_port, script_cmd_port, script_tlm_port, script_tlm_timeout)
 
+        self.tlm_derived = DerivedTelemetry(self.tlm_server)
+        if derived_file is not None:
+            self.tlm_derived.load(derived_file)
         self.tlm_current_value = TelemetryCurrentValue(self.tlm_server, self.event_msg)
+        self.tlm_history = TelemetryHistory(self.tlm_server)
+        self.tlm_cvt = None
+        if cvt_name is not None:
+            try:
+                self.tlm_cvt = TelemetryCvtReader(cvt_name)
+            except (FileNotFoundError, ValueError) as e:
+                print(f'ScriptRunner telemetry CVT {cvt_name} is not available: {e}')
         self.tlm_server.execute()
         self.scrit = None
     
@@ -144,6 +160,58 @@ class ScriptRunner(CmdTlmProcess):
         Example usage: get_tlm_val("CFE_ES", "HK_TLM", "Sequence")
         """
         return self.tlm_server.get_tlm_val(app_name, tlm_msg_name, parameter)
+
+    def get_derived_val(self, point_name):
+        """
+        Return the current value of a derived telemetry point or None if it
+        hasn't been computed. Example usage: get_derived_val("CmdErrors")
+        """
+        return self.tlm_derived.get_value(point_name)
+
+    def get_cvt_obj(self, app_name, tlm_msg_name):
+        """
+        Return the EDS object of a message's most recent packet from Basecamp's
+        shared telemetry CVT. The CVT holds every topic so the packet is
+        available even if it was received before this script started. None is
+        returned if the CVT isn't available or no packet has been received.
+        """
+        if self.tlm_cvt is None:
+            return None
+        packet = self.tlm_cvt.decode(self.tlm_topic(app_name, tlm_msg_name), self.tlm_server.eds_mission)
+        return None if packet is None else packet[1]
+
+    def get_cvt_val(self, app_name, tlm_msg_name, parameter):
+        """
+        Example usage: get_cvt_val("CFE_ES", "HK_TLM", "CommandCounter")
+        """
+        eds_obj = self.get_cvt_obj(app_name, tlm_msg_name)
+        if eds_obj is None:
+            return None
+        return self.tlm_server.get_tlm_param_val(eds_obj, parameter, None)
+
+    def record_tlm(self, app_name, tlm_msg_name, element):
+        """
+        Start recording the history of a payload element. element is a dotted
+        payload path. Example usage: record_tlm("CFE_ES", "HK_TLM", "CommandCounter")
+        """
+        return self.tlm_history.add_point(self.tlm_topic(app_name, tlm_msg_name), element)
+
+    def get_tlm_stats(self, app_name, tlm_msg_name, element, window):
+        """
+        Return {min, max, mean, count} of a recorded element over the last
+        window seconds. None is returned if there's no recorded data.
+        Example usage: get_tlm_stats("CFE_ES", "HK_TLM", "CommandCounter", 60)['max']
+        """
+        return self.tlm_history.stats(self.tlm_topic(app_name, tlm_msg_name), element, window)
+
+    def get_tlm_history(self, app_name, tlm_msg_name, element, window):
+        """
+        Return (spacecraft time, value) arrays for the last window seconds
+        """
+        return self.tlm_history.get_samples(self.tlm_topic(app_name, tlm_msg_name), element, window)
+
+    def tlm_topic(self, app_name, tlm_msg_name):
+        return app_name.upper() + '/Application/' + tlm_msg_name.upper()
             
     def tlm_wait_thread(self, tlm_msg: TelemetryMessage) -> None:
         pass
@@ -188,8 +256,10 @@ if __name__ == '__main__':
     script_cmd_port  = config.getint('NETWORK', 'SCRIPT_RUNNER_CMD_PORT')
     script_tlm_port  = config.getint('NETWORK', 'SCRIPT_RUNNER_TLM_PORT')
     mission_name     = config.get('CFS_TARGET','MISSION_EDS_NAME')
+    derived_file     = compress_abs_path(os.path.join(os.getcwd(), '..', config.get('PATHS', 'TLM_DERIVED_FILE')))
+    cvt_name         = config.get('APP', 'TLM_CVT_NAME')
 
-    script_runner = ScriptRunner(mission_name, cfs_ip_addr, router_ctrl_port, script_cmd_port, script_tlm_port, 1.0)
+    script_runner = ScriptRunner(mission_name, cfs_ip_addr, router_ctrl_port, script_cmd_port, script_tlm_port, 1.0, derived_file, cvt_name)
     
     text_editor = TextEditor(demo_script, run_script_callback=script_runner.run_script)
     text_editor.execute()
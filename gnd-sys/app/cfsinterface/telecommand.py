@@ -83,6 +83,11 @@ class TelecommandInterface(CfeEdsTarget):
         self.cmd_obj   = None
     
 
+    def release_eds_objects(self):
+        self.cmd_entry = None
+        self.cmd_obj   = None
+
+
     def get_topic_id(self, topic_name):
 
         topic_id = EdsMission.NULL_ID
@@ -105,13 +110,10 @@ class TelecommandInterface(CfeEdsTarget):
         
         self.command_dict = {EdsMission.COMMAND_TITLE_KEY: EdsMission.NULL_ID}
         if topic_id != EdsMission.NULL_ID:
-            try:
-                topic_obj = self.eds_mission.interface.Topic(topic_id)
-                for command in topic_obj:
-                    self.command_dict[command[0]] = command[1]
+            command_dict = self.eds_mission.get_command_dict(topic_name)
+            if command_dict is not None:
+                self.command_dict.update(command_dict)
                 self.command_topic = topic_name
-            except RuntimeError:
-                pass
             
         return self.command_dict
 
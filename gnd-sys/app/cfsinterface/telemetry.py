@@ -52,12 +52,15 @@ if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
     from edsmission import EdsMission
     from edsmission import CfeEdsTarget
     from cmdtlmrouter  import RouterCmd
+    from tlmlink       import set_rcvbuf, udp_socket_drops
+    from tlmdecode     import DecodedContainer, find_decoded_param, decoded_entries
 else:
     from .edsmission   import EdsMission
     from .edsmission   import CfeEdsTarget
     from .cmdtlmrouter import RouterCmd
+    from .tlmlink      import set_rcvbuf, udp_socket_drops
+    from .tlmdecode    import DecodedContainer, find_decoded_param, decoded_entries
 from tools import hex_string
-import FreeSimpleGUI as sg
     
 ###############################################################################
 
@@ -71,6 +74,7 @@ class TelemetryMessage:
     Contains the most recent telemetry values. This class is intentionally kept simple and
     additional 'business' logic is performed by the observer of this packet.
     """
+    SUBSECONDS_PER_SECOND = 65536.0  # uint16 subseconds
        
     def __init__(self, app_name, msg_name, app_id):
         
@@ -103,6 +107,14 @@ class TelemetryMessage:
     def payload(self):
         return self.eds_obj.Payload
 
+    def sec_hdr_time(self):
+        """
+        Return the secondary header time in seconds. Telemetry subseconds are
+        defined by MSG_TELEMETRY_SUBSECONDS_TYPE in basecamp_defs/eds/config.xml
+        """
+        sec_hdr = self.eds_obj.Sec
+        return int(sec_hdr.Seconds) + int(sec_hdr.Subseconds)/self.SUBSECONDS_PER_SECOND
+
     def update(self, eds_entry, eds_obj) -> None:
         """
         Trigger an update in each subscriber.
@@ -153,23 +165,54 @@ class TelemetryServer(CfeEdsTarget):
       within the context of the child class's environment
     """
     
+    CCSDS_APID_MASK = 0x07FF  # 11-bit AppId in the first primary header word
+    VIRTUAL_APP_ID_BASE = 0x0800  # Virtual messages use AppIds above the CCSDS range
+    
     def __init__(self, mission, target):
-        super().__init__(mission, target, EdsMission.TELEMETRY_IF)
 
         self._recv_tlm_thread = None
         self.server_observer = None
 
         self.lookup_appid = {} # Used 'app_name-tlm_msg_name' to retrieve app_id
         self.tlm_messages = {} # The eds_obj in a tlm msg holds the most recent values
+        self.subscription = None # Set of app_ids that are decoded, None decodes all messages
+        self.virtual_inputs = {} # Virtual message app_id: app_ids of the messages it is computed from
+        self.decode_pool  = None # Optional TelemetryDecodePool for the app_ids in pool_app_ids
+        self.pool_app_ids = frozenset()
+        self.link_analytics = None # Optional LinkAnalytics stage that sees every datagram
 
+        # The base constructor calls load_topics() which creates the telemetry messages
+        super().__init__(mission, target, EdsMission.TELEMETRY_IF)
+          
+
+    def load_topics(self):
+        """
+        Create a telemetry message for each topic that doesn't have one. Existing
+        messages keep their observers when the EDS database is reloaded.
+        """
+        super().load_topics()
+        self.topic_index = self.eds_mission.get_topic_index(self.id)
         for topic in self.topic_dict:
             if topic != EdsMission.TOPIC_TLM_TITLE_KEY:
                 (app_name, tlm_msg_name) = self.parse_topic(topic)
-                app_id = self.get_app_id(app_name,tlm_msg_name)
-                logger.info("TelemetryServer constructor adding App: %s, Msg %s, Id: %d" % (app_name, tlm_msg_name, app_id))
-                self.tlm_messages[app_id] = TelemetryMessage(app_name, tlm_msg_name, app_id)
-                self.lookup_appid[self.join_app_msg(app_name, tlm_msg_name)] = app_id
-          
+                app_id = self.topic_index.get_app_id(topic)
+                if app_id == EdsMission.NULL_ID:
+                    logger.error(f'TelemetryServer could not map topic {topic} to a CCSDS AppId')
+                elif app_id not in self.tlm_messages:
+                    logger.info("TelemetryServer adding App: %s, Msg %s, Id: %d" % (app_name, tlm_msg_name, app_id))
+                    self.tlm_messages[app_id] = TelemetryMessage(app_name, tlm_msg_name, app_id)
+                    self.lookup_appid[self.join_app_msg(app_name, tlm_msg_name)] = app_id
+
+
+    def release_eds_objects(self):
+        """
+        Virtual messages don't hold EDS objects so they keep their values
+        """
+        for app_id, tlm_msg in self.tlm_messages.items():
+            if app_id <= self.CCSDS_APID_MASK:
+                tlm_msg.eds_entry = None
+                tlm_msg.eds_obj   = None
+
 
     def get_tlm_param_val(self, base_object, parameter, obj_name):
         """
@@ -181,7 +224,10 @@ class TelemetryServer(CfeEdsTarget):
         obj_name    - Name of EDS object currently being processed. Initially None
                       and gets filled in by the recursive calls. Assumes top-level 
                       object is a container.
+        Messages decoded by the decode pool are DecodedContainers.
         """
+        if isinstance(base_object, DecodedContainer):
+            return find_decoded_param(base_object, parameter, obj_name)
         #TODO: print("\n\n***get_tlm_param_val()***")
         if obj_name is None:
             return_value = None
@@ -244,12 +290,12 @@ class TelemetryServer(CfeEdsTarget):
 
     def get_tlm_msg_from_topic(self, topic_name):
     
-        app_name, tlm_msg_name = self.parse_topic(topic_name)    
-        app_id = self.get_app_id(app_name, tlm_msg_name)
-        tlm_msg = None
-        if app_id in self.tlm_messages:
-            tlm_msg = self.tlm_messages[app_id]
-        return tlm_msg
+        app_id = self.topic_index.get_app_id(topic_name)
+        if app_id == EdsMission.NULL_ID:
+            # Virtual messages aren't EDS topics
+            app_name, tlm_msg_name = self.parse_topic(topic_name)    
+            app_id = self.lookup_appid.get(self.join_app_msg(app_name, tlm_msg_name), EdsMission.NULL_ID)
+        return self.tlm_messages.get(app_id)
             
  
     def get_app_name_from_topic(self, topic_name):
@@ -263,6 +309,24 @@ class TelemetryServer(CfeEdsTarget):
             self.tlm_messages[tlm_msg_dict[msg].app_id] = tlm_msg_dict[msg]
             
 
+    def add_virtual_msg(self, tlm_msg: TelemetryMessage, input_app_ids):
+        """
+        Add a message that is computed on the ground from the messages in
+        input_app_ids, such as derived telemetry. Virtual messages are looked
+        up and observed like messages received from the target.
+        """
+        self.tlm_messages[tlm_msg.app_id] = tlm_msg
+        self.lookup_appid[self.join_app_msg(tlm_msg.app_name, tlm_msg.msg_name)] = tlm_msg.app_id
+        self.virtual_inputs[tlm_msg.app_id] = frozenset(input_app_ids)
+
+
+    def remove_virtual_msg(self, tlm_msg: TelemetryMessage):
+    
+        self.tlm_messages.pop(tlm_msg.app_id, None)
+        self.lookup_appid.pop(self.join_app_msg(tlm_msg.app_name, tlm_msg.msg_name), None)
+        self.virtual_inputs.pop(tlm_msg.app_id, None)
+
+
     def add_msg_observer(self, tlm_msg: TelemetryMessage, tlm_msg_observer: TelemetryObserver):
     
         if tlm_msg.app_id in self.tlm_messages:
@@ -283,18 +347,76 @@ class TelemetryServer(CfeEdsTarget):
 
     def get_app_id(self, app_name, tlm_msg_name):
         """
-        #todo: Define a  global invalid app ID value 
-        #todo: Where should XML dependencies be defined?
-        #todo: Can self.lookup_appid replace this?
+        Return the CCSDS AppId of an EDS telemetry message or EdsMission.NULL_ID.
+        The AppId is mapped from the message's topic ID by the mission library,
+        see EdsMission.get_app_id_dict().
         """
-        topic_name = app_name.upper() + '/Application/' + tlm_msg_name.upper()
-        app_id = -1 
-        if topic_name in self.topic_dict:
-            app_id = self.topic_dict[topic_name] + 3 #todo: Clueless on the '+3' but that's what gets generated during runtime
-                 
-        return app_id
+        return self.topic_index.get_app_id_from_names(app_name, tlm_msg_name)
         
         
+    def set_subscription(self, app_ids):
+        """
+        Limit decoding to datagrams with an AppId in app_ids. The AppId is read
+        from the raw CCSDS primary header so unsubscribed datagrams are never
+        decoded. Server observers still receive every datagram. None restores
+        decoding all messages. Virtual message AppIds are replaced by the
+        AppIds of their inputs.
+        """
+        if app_ids is None:
+            self.subscription = None
+        else:
+            subscription = set()
+            for app_id in app_ids:
+                subscription |= self.virtual_inputs.get(app_id, {app_id})
+            self.subscription = frozenset(subscription)
+
+    def is_subscribed(self, datagram):
+        if self.subscription is None:
+            return True
+        return (((datagram[0] << 8) | datagram[1]) & self.CCSDS_APID_MASK) in self.subscription
+
+    def set_link_analytics(self, link_analytics):
+        """
+        Pass every received datagram to a LinkAnalytics stage before it's
+        filtered and decoded. None removes the stage.
+        """
+        self.link_analytics = link_analytics
+
+    def set_decode_pool(self, decode_pool, app_ids):
+        """
+        Decode the messages in app_ids with a started TelemetryDecodePool. The
+        pool's results are delivered to the message observers by the receive
+        thread so observers are always called from one thread. Observers of
+        these messages receive DecodedContainers instead of EDS objects and
+        get_tlm_val() searches them without the EDS database. None decodes all
+        messages in the receive thread.
+        """
+        self.decode_pool  = decode_pool
+        self.pool_app_ids = frozenset() if decode_pool is None else frozenset(app_ids)
+
+    def submit_to_pool(self, datagram):
+        """
+        Return True if the datagram is decoded or dropped by the decode pool
+        """
+        app_id = ((datagram[0] << 8) | datagram[1]) & self.CCSDS_APID_MASK
+        if self.decode_pool is None or app_id not in self.pool_app_ids:
+            return False
+        if self.decode_pool.submit(datagram):
+            return True
+        return not self.decode_pool.worker_failed(app_id)  # Decode a failed worker's AppIds in this thread
+
+    def update_pool_msgs(self):
+        """
+        Update the messages decoded by the decode pool. Called by the receive thread.
+        """
+        decode_pool = self.decode_pool
+        if decode_pool is not None:
+            for app_id, eds_entry, eds_obj in decode_pool.get_results():
+                if eds_obj is None:
+                    logger.error(f'Decode pool EDS datagram decode exception for AppId {app_id}')
+                elif app_id in self.tlm_messages:
+                    self.tlm_messages[app_id].update(eds_entry, eds_obj)
+        
     def add_server_observer(self, server_observer):
         """
         """
@@ -331,7 +453,7 @@ class TelemetrySocketServer(TelemetryServer):
     Manage a socket-based telemetry server.
     """
     
-    def __init__(self, mission, target, ip_addr, router_ctrl_port, server_tlm_port, server_tlm_timeout):
+    def __init__(self, mission, target, ip_addr, router_ctrl_port, server_tlm_port, server_tlm_timeout, rcvbuf_size=0):
         """
         router_ctrl_port:
           CmdTlmRouter prot that is used to command the router itself. This is not the
@@ -343,6 +465,8 @@ class TelemetrySocketServer(TelemetryServer):
                period value has elapsed before the operation has completed
          == 0: Socket is put in non-blocking mode
          None: Socket is put in blocking mode    
+        rcvbuf_size:
+          Requested socket receive buffer size in bytes, 0 uses the OS default
         """
         super().__init__(mission, target)
 
@@ -351,6 +475,7 @@ class TelemetrySocketServer(TelemetryServer):
         self.server_tlm_port = server_tlm_port
         self.server_tlm_socket_addr = (self.ip_addr, self.server_tlm_port)
         self.server_tlm_timeout = server_tlm_timeout
+        self.server_tlm_rcvbuf_size = rcvbuf_size
         self.router_ctrl_socket_addr = (self.ip_addr, self.router_ctrl_port)
         
         self.server_tlm_socket = None
@@ -373,22 +498,29 @@ class TelemetrySocketServer(TelemetryServer):
         # Constructor sets a timeout so the thread will terminate if no packets
         while not self._recv_tlm_thread.kill:
             try:
+                self.update_pool_msgs()
                 datagram, host = self.server_tlm_socket.recvfrom(4096) #TODO: Allow configurable buffer size
 
                 # Only accept datagrams with mimimum length of a telemetry header
                 if len(datagram) > 6:
+                    if self.link_analytics is not None:
+                        self.link_analytics.update(datagram)
                     if self.server_observer != None:
                         self.server_observer(datagram, host)
+                    if not self.is_subscribed(datagram) or self.submit_to_pool(datagram):
+                        continue
                     
                     try:
-                        eds_entry, eds_obj = self.eds_mission.decode_message(datagram)
+                        with self.eds_lock:
+                            eds_entry, eds_obj = self.eds_mission.decode_message(datagram)
                     
-                        #self.eds_objects[eds_entry.Name] = eds_obj
-                        app_id = int(eds_obj.CCSDS.AppId)
-                        print("Msg name: %s, Msg Id: %d " % (eds_entry.Name,app_id))
-                        if app_id in self.tlm_messages:
-                            print("Calling tlm message update()...")
-                            self.tlm_messages[app_id].update(eds_entry, eds_obj)
+                            #self.eds_objects[eds_entry.Name] = eds_obj
+                            app_id = int(eds_obj.CCSDS.AppId)
+                            print("Msg name: %s, Msg Id: %d " % (eds_entry.Name,app_id))
+                            if app_id in self.tlm_messages:
+                                print("Calling tlm message update()...")
+                                self.tlm_messages[app_id].update(eds_entry, eds_obj)
+                            del eds_entry, eds_obj  # Don't hold the EDS database between packets
                     
                     except RuntimeError:
                         print("EDS datagram decode exception. Datagram  = \n %s\n", str(datagram))
@@ -408,6 +540,7 @@ class TelemetrySocketServer(TelemetryServer):
         try:
             self.server_tlm_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.server_tlm_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            set_rcvbuf(self.server_tlm_socket, self.server_tlm_rcvbuf_size)
             self.server_tlm_socket.bind(self.server_tlm_socket_addr)
             self.server_tlm_socket.setblocking(False)
             self.server_tlm_socket.settimeout(self.server_tlm_timeout)
@@ -425,7 +558,15 @@ class TelemetrySocketServer(TelemetryServer):
             str_len = len(err_str)
             if len(help_str) > str_len:
                 str_len = len(help_str)
+            import FreeSimpleGUI as sg  # Only needed to report errors so scripts don't load the GUI
             sg.Popup(f'{err_str}\n\n{help_str}', title='Telemetry Server Creation Error', line_width=str_len+1, keep_on_top=True, non_blocking=True, grab_anywhere=True, modal=False)
+
+    def get_kernel_drops(self):
+        """
+        Return the datagrams the OS dropped because the server's receive
+        buffer was full or None if it isn't available
+        """
+        return None if self.server_tlm_socket is None else udp_socket_drops(self.server_tlm_socket)
             
     def shutdown(self):
         logger.info('TelemetrySocketServer shutdown started')
@@ -460,26 +601,34 @@ class TelemetryQueueServer(TelemetryServer):
 
             while not self.tlm_router_queue.empty():
             
+                self.update_pool_msgs()
                 datagram, host = self.tlm_router_queue.get()
                 
                 # Only accept datagrams with mimimum length of a telemetry header
                 if len(datagram) > 6:
+                    if self.link_analytics is not None:
+                        self.link_analytics.update(datagram)
                     if self.server_observer != None:
                         self.server_observer(datagram, host)
+                    if not self.is_subscribed(datagram) or self.submit_to_pool(datagram):
+                        continue
                     
                     try:
-                        eds_entry, eds_obj = self.eds_mission.decode_message(datagram)
+                        with self.eds_lock:
+                            eds_entry, eds_obj = self.eds_mission.decode_message(datagram)
                     
-                        app_id = int(eds_obj.CCSDS.AppId)
-                        logger.debug("Msg name: %s, Msg Id: %d " % (eds_entry.Name,app_id))
-                        if app_id in self.tlm_messages:
-                            logger.debug("Calling tlm message update()...")
-                            self.tlm_messages[app_id].update(eds_entry, eds_obj)
+                            app_id = int(eds_obj.CCSDS.AppId)
+                            logger.debug("Msg name: %s, Msg Id: %d " % (eds_entry.Name,app_id))
+                            if app_id in self.tlm_messages:
+                                logger.debug("Calling tlm message update()...")
+                                self.tlm_messages[app_id].update(eds_entry, eds_obj)
+                            del eds_entry, eds_obj  # Don't hold the EDS database between packets
                     
                     except RuntimeError:
                         logger.error("EDS datagram decode exception. Datagram  = \n %s\n", str(datagram))
                         logger.error(traceback.print_exc())
             
+            self.update_pool_msgs()
             time.sleep(0.5)            
         
         logger.info("TelemetryQueueServer terminating receive telemetry handler thread")
@@ -525,8 +674,12 @@ class TelemetryCmdLineClient(TelemetryObserver):
         base_object - The EDS object to iterate over
         base_name - The base name for the sub-entities printed to the screen
         """
+        # Messages decoded by the decode pool
+        if isinstance(base_object, DecodedContainer):
+            for name, value in decoded_entries(base_object, base_name):
+                print('{:<60} = {}'.format(name, value))
         # Array display string
-        if (self.tlm_server.eds_mission.lib_db.IsArray(base_object)):
+        elif (self.tlm_server.eds_mission.lib_db.IsArray(base_object)):
             #print("@DEBUG@display_entries()-array: base_object = " + str(base_object))
             #print("@DEBUG@display_entries()-array: base_name = " + str(base_name))
             for i in range(len(base_object)):
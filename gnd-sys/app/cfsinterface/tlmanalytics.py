@@ -0,0 +1,395 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Analyze telemetry link quality per AppId
+
+    Notes:
+      1. LinkAnalytics is a telemetry server stage that sees every datagram
+         before subscription filtering. It only reads the CCSDS primary and
+         telemetry secondary headers so it doesn't decode packets:
+           - Ground time when the server processes the packet
+           - 14 bit sequence counter
+           - Spacecraft time, seconds and 16 bit subseconds
+      2. Each AppId records its packets in fixed size NumPy arrays. When a
+         window is full or WINDOW_PERIOD seconds old its statistics are
+         computed with array operations and appended to a HistoryRing:
+           rate     - Packets per second
+           lost     - Sequence counters skipped and never received
+           dup      - Sequence counters received more than once
+           reorder  - Packets received after a higher sequence counter
+           resync   - Backward counter jumps beyond REORDER_WINDOW, usually
+                      a cFS restart
+           jitter   - Mean absolute change in transit time between packets
+                      (RFC 3550 style) so the flight schedule isn't jitter
+           skew     - Ground time minus spacecraft time
+           latency  - Window mean skew minus the AppId's minimum skew
+         Skew includes the epoch and clock offset between the cFS and the
+         ground so only its changes are meaningful. A rising latency is
+         queuing in the router or a slow telemetry consumer.
+      3. The server's sequence gaps include packets dropped by ground queues.
+         Compare them with the router's LinkMonitor, which counts gaps before
+         packets are queued, to separate ground system drops from RF/UDP
+         loss. A packet that arrives late across a window boundary is
+         counted lost in the earlier window and reordered in the later one.
+      4. update() is called from the telemetry server thread. Queries and
+         exports can be called from any thread.
+"""
+
+import os
+import sys
+import csv
+import time
+import struct
+import threading
+
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    sys.path.append('..')
+    from tlmhistory import HistoryRing
+else:
+    from .tlmhistory import HistoryRing
+from tools import lazy_import
+
+np = lazy_import('numpy')
+
+import logging
+logger = logging.getLogger(__name__)
+
+CCSDS_APID_MASK  = 0x07FF
+CCSDS_IDLE_APID  = 0x07FF
+CCSDS_SEQ_MASK   = 0x3FFF
+CCSDS_SEQ_HALF   = 0x2000
+CCSDS_PRI_HDR    = struct.Struct('>HH')
+CCSDS_TLM_SEC_HDR = struct.Struct('>IH')  # Seconds, subseconds following the primary header
+CCSDS_TLM_HDR_LEN = CCSDS_PRI_HDR.size + 2 + CCSDS_TLM_SEC_HDR.size
+SUBSECONDS_PER_SECOND = 65536.0
+
+WINDOW_DTYPE = [('gnd_time', 'f8'), ('duration', 'f8'), ('rx_cnt', 'u4'), ('rate', 'f8'),
+                ('lost_cnt', 'u4'), ('dup_cnt', 'u4'), ('reorder_cnt', 'u4'), ('resync_cnt', 'u4'),
+                ('interval', 'f8'), ('jitter', 'f8'), ('skew_mean', 'f8'), ('skew_min', 'f8'), ('skew_max', 'f8')]
+WINDOW_COUNTERS = ('rx_cnt', 'lost_cnt', 'dup_cnt', 'reorder_cnt', 'resync_cnt')
+
+
+###############################################################################
+
+def sequence_stats(seq, ref_seq, has_ref, reorder_window):
+    """
+    Count the lost, duplicate, reordered and resynced packets of a window's
+    sequence counters. ref_seq is the highest counter received before the
+    window and has_ref is False for an AppId's first window. Returns
+    (lost, dup, reorder, resync, high_seq).
+    """
+    step = np.diff(seq, prepend=ref_seq)
+    step = ((step + CCSDS_SEQ_HALF) & CCSDS_SEQ_MASK) - CCSDS_SEQ_HALF  # Signed change from the previous packet
+    resyncs = np.flatnonzero(step < -reorder_window)
+    lost = dup = reorder = 0
+    for i, segment in enumerate(np.split(np.arange(len(seq)), resyncs)):
+        if len(segment) == 0:
+            continue
+        seg_step = step[segment]
+        if i > 0:
+            # A resync starts a new counter sequence at the resync packet
+            ref_seq = (int(seq[segment[0]]) - 1) & CCSDS_SEQ_MASK
+            seg_step[0] = 1
+        pos = np.cumsum(seg_step)  # Counter position relative to ref_seq
+        unique_pos, first_index = np.unique(pos, return_index=True)
+        is_first = np.zeros(len(pos), dtype=bool)
+        is_first[first_index] = True
+        high = max(int(pos.max()), 0)
+        lost    += high - int(np.count_nonzero(unique_pos > 0))
+        dup     += int(np.count_nonzero(~is_first))
+        reorder += int(np.count_nonzero((seg_step < 0) & is_first & (pos != 0)))
+        if i == 0 and has_ref:
+            dup += int(np.count_nonzero(is_first & (pos == 0)))  # Repeats the previous window's highest counter
+        ref_seq = (int(ref_seq) + high) & CCSDS_SEQ_MASK
+    return (lost, dup, reorder, len(resyncs), ref_seq)
+
+
+###############################################################################
+
+class AppIdWindow():
+    """
+    Collect one AppId's packets in fixed size arrays and reduce each full
+    window to a WINDOW_DTYPE record
+    """
+    def __init__(self, app_id, window_size, depth):
+
+        self.app_id   = app_id
+        self.gnd_time = np.zeros(window_size, dtype='f8')
+        self.sc_time  = np.zeros(window_size, dtype='f8')
+        self.seq      = np.zeros(window_size, dtype='i8')
+        self.count    = 0
+        self.windows  = HistoryRing(depth, WINDOW_DTYPE)
+        self.totals   = dict.fromkeys(WINDOW_COUNTERS, 0)
+        self.skew_min = np.inf
+
+        # Last packet of the previous window
+        self.prev_time    = None
+        self.prev_transit = None
+        self.high_seq     = 0
+
+    def add(self, gnd_time, sc_time, seq):
+        i = self.count
+        self.gnd_time[i] = gnd_time
+        self.sc_time[i]  = sc_time
+        self.seq[i]      = seq
+        self.count += 1
+
+    def is_full(self):
+        return self.count == len(self.seq)
+
+    def close(self, reorder_window):
+        n = self.count
+        if n == 0:
+            return None
+        gnd_time = self.gnd_time[:n]
+        transit  = gnd_time - self.sc_time[:n]
+        has_ref  = self.prev_time is not None
+        if has_ref:
+            intervals     = np.diff(gnd_time, prepend=self.prev_time)
+            transit_diffs = np.diff(transit, prepend=self.prev_transit)
+            ref_seq = self.high_seq
+        else:
+            intervals     = np.diff(gnd_time)
+            transit_diffs = np.diff(transit)
+            ref_seq = (int(self.seq[0]) - 1) & CCSDS_SEQ_MASK
+        lost, dup, reorder, resync, self.high_seq = sequence_stats(self.seq[:n], ref_seq, has_ref, reorder_window)
+
+        duration = float(intervals.sum())
+        rate     = len(intervals)/duration if duration > 0.0 else 0.0
+        interval = float(intervals.mean()) if len(intervals) > 0 else 0.0
+        jitter   = float(np.abs(transit_diffs).mean()) if len(transit_diffs) > 0 else 0.0
+        record = (float(gnd_time[-1]), duration, n, rate, lost, dup, reorder, resync, interval, jitter,
+                  float(transit.mean()), float(transit.min()), float(transit.max()))
+        self.windows.append(record)
+        for counter, value in zip(WINDOW_COUNTERS, (n, lost, dup, reorder, resync)):
+            self.totals[counter] += value
+        self.skew_min = min(self.skew_min, record[-2])
+        self.prev_time    = float(gnd_time[-1])
+        self.prev_transit = float(transit[-1])
+        self.count = 0
+        return record
+
+
+###############################################################################
+
+class LinkAnalytics():
+    """
+    Telemetry server stage that computes per AppId link statistics over
+    fixed size packet windows:
+        tlm_server.set_link_analytics(LinkAnalytics(tlm_server.topic_index.app_id_topics))
+    topics is an optional {app_id: topic} dictionary used to label the
+    statistics.
+    """
+    WINDOW_SIZE    = 64     # Packets per window
+    WINDOW_PERIOD  = 10.0   # Maximum seconds a window stays open
+    WINDOW_DEPTH   = 360    # Windows kept per AppId
+    REORDER_WINDOW = 64     # Largest backward counter jump that isn't a resync
+
+    def __init__(self, topics=None, window_size=WINDOW_SIZE, window_period=WINDOW_PERIOD, depth=WINDOW_DEPTH):
+
+        self.topics = {} if topics is None else dict(topics)
+        self.window_size   = window_size
+        self.window_period = window_period
+        self.depth   = depth
+        self.lock    = threading.Lock()
+        self.app_ids = {}  # app_id: AppIdWindow
+        self.short_cnt = 0
+
+    def update(self, datagram, gnd_time=None):
+        """
+        Record a telemetry datagram. gnd_time defaults to the current time.
+        """
+        if len(datagram) < CCSDS_TLM_HDR_LEN:
+            self.short_cnt += 1
+            return
+        stream_id, seq = CCSDS_PRI_HDR.unpack_from(datagram, 0)
+        app_id = stream_id & CCSDS_APID_MASK
+        if app_id == CCSDS_IDLE_APID:
+            return
+        seconds, subseconds = CCSDS_TLM_SEC_HDR.unpack_from(datagram, CCSDS_PRI_HDR.size + 2)
+        if gnd_time is None:
+            gnd_time = time.time()
+        with self.lock:
+            window = self.app_ids.get(app_id)
+            if window is None:
+                window = self.app_ids[app_id] = AppIdWindow(app_id, self.window_size, self.depth)
+            window.add(gnd_time, seconds + subseconds/SUBSECONDS_PER_SECOND, seq & CCSDS_SEQ_MASK)
+            if window.is_full() or (gnd_time - window.gnd_time[0]) >= self.window_period:
+                window.close(self.REORDER_WINDOW)
+
+    def flush(self, now=None):
+        """
+        Close the windows that have been open longer than the window period
+        so low rate and stopped AppIds are reported
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            for window in self.app_ids.values():
+                if window.count > 0 and (now - window.gnd_time[0]) >= self.window_period:
+                    window.close(self.REORDER_WINDOW)
+
+    def get_topic(self, app_id):
+        return self.topics.get(app_id, f'AppId {app_id}')
+
+    def get_summary(self):
+        """
+        Return a list of dictionaries with each AppId's totals and the
+        statistics of its most recent window, sorted by AppId
+        """
+        self.flush()
+        summary = []
+        with self.lock:
+            for app_id in sorted(self.app_ids):
+                window = self.app_ids[app_id]
+                stats = {'app-id': app_id, 'topic': self.get_topic(app_id)}
+                stats.update({counter.replace('_', '-'): value for counter, value in window.totals.items()})
+                if window.windows.count > 0:
+                    record = window.windows.data[(window.windows.head - 1) % window.windows.depth]
+                    stats.update({'rate': float(record['rate']), 'jitter': float(record['jitter']),
+                                  'skew': float(record['skew_mean']), 'latency': float(record['skew_mean']) - window.skew_min})
+                else:
+                    stats.update({'rate': 0.0, 'jitter': 0.0, 'skew': 0.0, 'latency': 0.0})
+                summary.append(stats)
+        return summary
+
+    def get_windows(self, app_id, window=None):
+        """
+        Return the WINDOW_DTYPE records of an AppId that ended in the last
+        window seconds or all of its records if window is None
+        """
+        end = time.time()
+        start = 0.0 if window is None else end - window
+        with self.lock:
+            if app_id not in self.app_ids:
+                return np.zeros(0, dtype=WINDOW_DTYPE)
+            return self.app_ids[app_id].windows.query(start, end)
+
+    def export_csv(self, filename):
+        """
+        Write every stored window of every AppId to a CSV file. Returns the
+        number of windows written.
+        """
+        self.flush()
+        with self.lock:
+            app_ids = sorted(self.app_ids)
+        fields = [field for field, dtype in WINDOW_DTYPE]
+        row_cnt = 0
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['app_id', 'topic'] + fields)
+            for app_id in app_ids:
+                topic = self.get_topic(app_id)
+                for record in self.get_windows(app_id):
+                    writer.writerow([app_id, topic] + [record[field].item() for field in fields])
+                    row_cnt += 1
+        logger.info(f'Exported {row_cnt} telemetry link windows to {filename}')
+        return row_cnt
+
+    def reset(self):
+        with self.lock:
+            self.app_ids = {}
+            self.short_cnt = 0
+
+
+###############################################################################
+
+class LinkQualityPanel():
+    """
+    Display LinkAnalytics statistics in a window. link_stats is an optional
+    function that returns CmdTlmRouter.get_link_stats() so the router's
+    counts can be compared with the server's.
+
+    gui() runs its own event loop and returns when the window is closed. An
+    application with its own event loop calls create_window(), passes the
+    window's events to handle_event() and calls refresh() periodically so
+    the panel doesn't block the application.
+    """
+    HEADINGS = ['AppId', 'Topic', 'Rate (Hz)', 'Rx', 'Lost', 'Dup', 'Reorder', 'Resync', 'Jitter (ms)', 'Latency (ms)']
+    REFRESH_MS = 1000
+
+    def __init__(self, link_analytics: LinkAnalytics, link_stats=None, export_path=None):
+
+        self.link_analytics = link_analytics
+        self.link_stats  = link_stats
+        self.export_path = os.getcwd() if export_path is None else export_path
+        self.window = None
+
+    def table_values(self):
+        rows = []
+        for stats in self.link_analytics.get_summary():
+            rows.append([f"{stats['app-id']}", stats['topic'], f"{stats['rate']:.2f}", stats['rx-cnt'], stats['lost-cnt'],
+                         stats['dup-cnt'], stats['reorder-cnt'], stats['resync-cnt'],
+                         f"{stats['jitter']*1000.0:.1f}", f"{stats['latency']*1000.0:.1f}"])
+        return rows
+
+    def router_text(self, rows):
+        server_lost = sum(row[4] for row in rows)
+        if self.link_stats is None:
+            return f'Server sequence gaps: {server_lost}'
+        link_stats = self.link_stats()
+        kernel_drops = '--' if link_stats['kernel-drops'] is None else link_stats['kernel-drops']
+        return (f"Router sequence gaps: {link_stats['lost-cnt']}, Server sequence gaps: {server_lost}, "
+                f"Ground queue drops: {link_stats['gnd-tlm-queue']['drop-cnt']}, Kernel drops: {kernel_drops}")
+
+    def create_window(self):
+        import FreeSimpleGUI as sg
+        rows = self.table_values()
+        layout = [[sg.Text(self.router_text(rows), key='-ROUTER-', font=('Arial',12))],
+                  [sg.Table(rows, headings=self.HEADINGS, key='-TABLE-', auto_size_columns=False,
+                            col_widths=[6, 36, 9, 9, 7, 6, 8, 7, 11, 12], num_rows=20, justification='right',
+                            font=('Courier',11), expand_x=True, expand_y=True)],
+                  [sg.Text('Sequence gaps seen by the server but not the router were dropped by the ground system.', font=('Arial',11))],
+                  [sg.Button('Export', button_color=('SpringGreen4'), pad=(2,1)),
+                   sg.Button('Reset', pad=(2,1)), sg.Button('Close', pad=(2,1))]]
+        self.window = sg.Window('Telemetry Link Quality', layout, resizable=True, finalize=True)
+        return self.window
+
+    def refresh(self):
+        if self.window is not None:
+            rows = self.table_values()
+            self.window['-TABLE-'].update(values=rows)
+            self.window['-ROUTER-'].update(self.router_text(rows))
+
+    def handle_event(self, event, values):
+        """
+        Process a window event. Return False after the window is closed.
+        """
+        import FreeSimpleGUI as sg
+        if event in (sg.WIN_CLOSED, 'Close'):
+            self.window.close()
+            self.window = None
+            return False
+        if event == 'Export':
+            filename = sg.popup_get_file('Export link windows to a CSV file', title='Export Link Quality', save_as=True,
+                                         default_extension='.csv', initial_folder=self.export_path,
+                                         file_types=(('CSV Files', '*.csv'),), keep_on_top=True)
+            if filename:
+                try:
+                    row_cnt = self.link_analytics.export_csv(filename)
+                    sg.popup(f'Exported {row_cnt} windows to\n{filename}', title='Export Link Quality', keep_on_top=True)
+                except OSError as e:
+                    sg.popup(f'Error exporting link windows to {filename}: {e}', title='Export Link Quality', keep_on_top=True)
+        elif event == 'Reset':
+            self.link_analytics.reset()
+        self.refresh()
+        return True
+
+    def gui(self):
+        self.create_window()
+        while True:
+            event, values = self.window.read(timeout=self.REFRESH_MS)
+            if not self.handle_event(event, values):
+                break
+
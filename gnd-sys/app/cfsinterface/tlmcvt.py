@@ -0,0 +1,279 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Share the most recent telemetry packets between Basecamp processes
+
+    Notes:
+      1. The main Basecamp process publishes a current value table (CVT) in a
+         shared memory segment. Each telemetry topic has a fixed slot that
+         holds the most recent raw packet, its ground receive time and a
+         sequence counter. Tool processes and scripts read a topic's latest
+         packet without a socket, a router registration or decoding packets
+         they don't need.
+      2. Segment layout:
+           Header:    magic, version, slot count, slot data size, create time
+           Directory: (AppId, topic) for each slot
+           Slots:     sequence, receive time, length, packet bytes
+         Slots are assigned in the order of the telemetry server's messages
+         when the segment is created. Readers resolve topics using the
+         directory so they don't need the EDS database unless they decode.
+      3. Slots use seqlock consistency. The writer makes the sequence odd,
+         writes the packet, then makes the sequence even. A reader copies the
+         slot and retries if the sequence was odd or changed during the copy.
+         There is only one writer so writes are never blocked by readers.
+      4. This module doesn't import the EDS dependent modules so plain python
+         scripts can use TelemetryCvtReader. decode() uses a caller supplied
+         EdsMission.
+      5. Run 'python3 tlmcvt.py [segment_name]' to list the slots of a running
+         Basecamp.
+"""
+
+import sys
+import time
+import struct
+from multiprocessing import shared_memory
+
+import logging
+logger = logging.getLogger(__name__)
+
+CVT_MAGIC   = b'BCVT'
+CVT_VERSION = 1
+
+CVT_HEADER    = struct.Struct('<4sHHId12x')  # magic, version, slot_cnt, data_size, create_time
+CVT_DIR_ENTRY = struct.Struct('<H62s')       # app_id, topic
+CVT_SLOT_SEQ  = struct.Struct('<Q')
+CVT_SLOT_DATA = struct.Struct('<dI4x')       # rx_time, length
+CVT_SLOT_HDR_SIZE = CVT_SLOT_SEQ.size + CVT_SLOT_DATA.size
+
+CVT_DATA_SIZE = 4096  # Matches the telemetry servers' receive buffer size
+CVT_ALIGN     = 64
+
+CCSDS_APID_MASK = 0x07FF
+
+
+def cvt_align(size):
+    return (size + CVT_ALIGN - 1) & ~(CVT_ALIGN - 1)
+
+
+def cvt_layout(slot_cnt, data_size):
+    """
+    Return (slot_offset, slot_size, segment_size)
+    """
+    slot_offset = cvt_align(CVT_HEADER.size + slot_cnt*CVT_DIR_ENTRY.size)
+    slot_size   = cvt_align(CVT_SLOT_HDR_SIZE + data_size)
+    return (slot_offset, slot_size, slot_offset + slot_cnt*slot_size)
+
+
+def attach_shared_memory(name):
+    """
+    Attach to an existing segment without registering it with this process's
+    resource tracker. Python versions prior to 3.13 unlink a tracked segment
+    when the attaching process exits which would remove Basecamp's CVT.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+###############################################################################
+
+class TelemetryCvt():
+    """
+    Publish the telemetry server's packets to a shared memory CVT. publish()
+    has the signature of a telemetry server observer so it sees every packet
+    regardless of the server's subscription:
+        tlm_server.add_server_observer(tlm_cvt.publish)
+    Virtual messages (AppIds above the CCSDS range) aren't given slots.
+    """
+    def __init__(self, name, tlm_server, data_size=CVT_DATA_SIZE):
+
+        self.name = name
+        self.data_size = data_size
+        self.topics = []  # (app_id, topic) in slot order
+        for app_id, tlm_msg in tlm_server.tlm_messages.items():
+            if app_id <= CCSDS_APID_MASK:
+                self.topics.append((app_id, f'{tlm_msg.app_name}/Application/{tlm_msg.msg_name}'))
+
+        slot_offset, self.slot_size, segment_size = cvt_layout(len(self.topics), data_size)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=segment_size)
+        except FileExistsError:
+            # Left behind by a Basecamp that didn't shut down cleanly
+            logger.info(f'Replacing stale telemetry CVT segment {name}')
+            stale_shm = shared_memory.SharedMemory(name=name)
+            stale_shm.close()
+            stale_shm.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=segment_size)
+        self.buf = self.shm.buf
+
+        self.slots = {}  # app_id: slot offset
+        self.seqs  = {}  # slot offset: sequence, the writer is the only process that changes it
+        self.drop_cnt = 0
+        for i, (app_id, topic) in enumerate(self.topics):
+            CVT_DIR_ENTRY.pack_into(self.buf, CVT_HEADER.size + i*CVT_DIR_ENTRY.size, app_id, topic.encode('utf-8')[:CVT_DIR_ENTRY.size-2])
+            offset = slot_offset + i*self.slot_size
+            CVT_SLOT_SEQ.pack_into(self.buf, offset, 0)
+            self.slots[app_id] = offset
+            self.seqs[offset] = 0
+        # The header is written last so readers never see a partially built directory
+        CVT_HEADER.pack_into(self.buf, 0, CVT_MAGIC, CVT_VERSION, len(self.topics), data_size, time.time())
+        logger.info(f'Created telemetry CVT {name} with {len(self.topics)} slots, {segment_size} bytes')
+
+    def publish(self, datagram, host=None):
+        """
+        Write a raw telemetry packet to its topic's slot. Called from the
+        telemetry server thread.
+        """
+        buf = self.buf
+        offset = self.slots.get(((datagram[0] << 8) | datagram[1]) & CCSDS_APID_MASK)
+        if offset is None or buf is None:
+            return
+        length = len(datagram)
+        if length > self.data_size:
+            self.drop_cnt += 1
+            return
+        seq = self.seqs[offset]
+        CVT_SLOT_SEQ.pack_into(buf, offset, seq + 1)
+        CVT_SLOT_DATA.pack_into(buf, offset + CVT_SLOT_SEQ.size, time.time(), length)
+        data_offset = offset + CVT_SLOT_HDR_SIZE
+        buf[data_offset:data_offset+length] = datagram
+        CVT_SLOT_SEQ.pack_into(buf, offset, seq + 2)
+        self.seqs[offset] = seq + 2
+
+    def close(self):
+        """
+        Remove the segment. Attached readers keep their mapping until they
+        close it.
+        """
+        if self.shm is not None:
+            self.buf = None
+            self.shm.close()
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = None
+
+
+###############################################################################
+
+class TelemetryCvtReader():
+    """
+    Read the most recent telemetry packets from a CVT published by Basecamp.
+    The constructor raises FileNotFoundError if Basecamp isn't running and
+    ValueError if the segment isn't a compatible CVT.
+    """
+    READ_RETRIES = 100
+
+    def __init__(self, name):
+
+        self.name = name
+        self.shm  = attach_shared_memory(name)
+        self.buf  = self.shm.buf
+        magic, version, slot_cnt, self.data_size, self.create_time = CVT_HEADER.unpack_from(self.buf, 0)
+        if magic != CVT_MAGIC or version != CVT_VERSION:
+            self.close()
+            raise ValueError(f'Shared memory segment {name} is not a version {CVT_VERSION} telemetry CVT')
+
+        slot_offset, slot_size, segment_size = cvt_layout(slot_cnt, self.data_size)
+        self.topic_slots  = {}  # topic: slot offset
+        self.app_id_slots = {}  # app_id: slot offset
+        for i in range(slot_cnt):
+            app_id, topic = CVT_DIR_ENTRY.unpack_from(self.buf, CVT_HEADER.size + i*CVT_DIR_ENTRY.size)
+            offset = slot_offset + i*slot_size
+            self.topic_slots[topic.rstrip(b'\0').decode('utf-8')] = offset
+            self.app_id_slots[app_id] = offset
+
+    def get_topics(self):
+        return list(self.topic_slots.keys())
+
+    def get_seq(self, topic):
+        """
+        Return a topic's sequence counter. It changes each time a packet is
+        written so it can be polled to detect new packets. Zero means no
+        packet has been received.
+        """
+        return CVT_SLOT_SEQ.unpack_from(self.buf, self.topic_slots[topic])[0]
+
+    def read(self, topic):
+        """
+        Return (datagram, rx_time, seq) for the topic's most recent packet or
+        None if no packet has been received. rx_time is the ground receive
+        time in seconds since the epoch. KeyError is raised for an unknown
+        topic.
+        """
+        return self.read_slot(self.topic_slots[topic])
+
+    def read_app_id(self, app_id):
+        return self.read_slot(self.app_id_slots[app_id])
+
+    def read_slot(self, offset):
+        buf = self.buf
+        data_offset = offset + CVT_SLOT_HDR_SIZE
+        for retry in range(self.READ_RETRIES):
+            seq = CVT_SLOT_SEQ.unpack_from(buf, offset)[0]
+            if seq == 0:
+                return None
+            if seq & 1:
+                time.sleep(0)
+                continue
+            rx_time, length = CVT_SLOT_DATA.unpack_from(buf, offset + CVT_SLOT_SEQ.size)
+            datagram = bytes(buf[data_offset:data_offset+min(length, self.data_size)])
+            if CVT_SLOT_SEQ.unpack_from(buf, offset)[0] == seq:
+                return (datagram, rx_time, seq)
+        logger.error(f'Telemetry CVT {self.name} slot at {offset} was not readable after {self.READ_RETRIES} retries')
+        return None
+
+    def decode(self, topic, eds_mission):
+        """
+        Return (eds_entry, eds_obj, rx_time) for the topic's most recent packet
+        or None if no packet has been received
+        """
+        packet = self.read(topic)
+        if packet is None:
+            return None
+        eds_entry, eds_obj = eds_mission.decode_message(packet[0])
+        return (eds_entry, eds_obj, packet[1])
+
+    def close(self):
+        if self.shm is not None:
+            self.buf = None
+            self.shm.close()
+            self.shm = None
+
+
+###############################################################################
+
+if __name__ == '__main__':
+
+    cvt_name = sys.argv[1] if len(sys.argv) > 1 else 'basecamp_cvt'
+    tlm_cvt = TelemetryCvtReader(cvt_name)
+    now = time.time()
+    print(f'Telemetry CVT {cvt_name}: {len(tlm_cvt.topic_slots)} slots')
+    for topic in sorted(tlm_cvt.get_topics()):
+        packet = tlm_cvt.read(topic)
+        if packet is None:
+            print(f'  {topic:<48} --')
+        else:
+            print(f'  {topic:<48} seq {packet[2]//2:>8}, {len(packet[0]):>5} bytes, age {now - packet[1]:8.1f}s')
+    tlm_cvt.close()
+
@@ -0,0 +1,425 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Decode high rate telemetry topics in a pool of worker processes
+
+    Notes:
+      1. EdsLib decoding holds the GIL so a telemetry server thread decodes
+         one packet at a time. TelemetryDecodePool decodes selected AppIds in
+         worker processes that each load the EDS database.
+      2. AppIds are sharded to workers by AppId modulo the worker count so an
+         AppId is always decoded by the same worker. A worker decodes its
+         packets in the order they're submitted and all workers return results
+         on one queue which keeps the order of each worker's results. Packets
+         of one topic are delivered in the order they were received. Packets
+         of different topics may be reordered.
+      3. Each worker has a shared memory ring of datagram slots. The worker's
+         queue only carries the slot index and length and the worker frees the
+         slot as soon as it has copied the datagram. If a worker's ring is full
+         the datagram is dropped and counted so the server thread never blocks.
+      4. Workers return the decoded message as nested DecodedContainer
+         dictionaries that support attribute access like EDS objects so
+         observers receive them through TelemetryMessage.update() unchanged.
+         Values are python numbers and strings and enumerations are
+         DecodedEnum ints that display their label. Code that walks an EDS
+         object with lib_db.IsArray()/IsContainer() must use
+         find_decoded_param() and decoded_entries() for decoded objects.
+      5. submit() restarts a worker that has exited so its AppIds aren't
+         dropped. After MAX_WORKER_RESTARTS the worker isn't restarted and
+         worker_failed() tells the telemetry server to decode its AppIds in
+         the server thread.
+      6. Workers load the EDS database when they start so the pool must be
+         restarted after the EDS definitions are reloaded.
+      7. Run 'python3 tlmdecode.py [mission] [target] [packets]' to benchmark
+         decoding in the server thread and with 1 to os.cpu_count() workers.
+"""
+
+import sys
+import os
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    sys.path.append('..')
+    from edsmission import EdsMission
+    from tlmcvt     import CVT_DATA_SIZE
+else:
+    from .edsmission import EdsMission
+    from .tlmcvt     import CVT_DATA_SIZE
+
+import logging
+logger = logging.getLogger(__name__)
+
+CCSDS_APID_MASK = 0x07FF
+
+
+###############################################################################
+
+class DecodedEntry():
+    """
+    Stands in for the EDS entry of a decoded message
+    """
+    def __init__(self, name):
+        self.Name = name
+
+
+class DecodedContainer(dict):
+    """
+    Decoded EDS container. Elements can be accessed as items or attributes.
+    """
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class DecodedEnum(int):
+    """
+    Decoded EDS enumeration that displays its label like an EDS enumeration
+    """
+    def __new__(cls, value, label):
+        obj = super().__new__(cls, value)
+        obj.label = label
+        return obj
+
+    def __str__(self):
+        return self.label
+
+    def __reduce__(self):
+        return (DecodedEnum, (int(self), self.label))
+
+
+def decode_eds_obj(lib_db, eds_obj):
+    """
+    Recursively convert an EDS object to DecodedContainers, lists and
+    python values
+    """
+    if lib_db.IsArray(eds_obj):
+        return [decode_eds_obj(lib_db, eds_obj[i]) for i in range(len(eds_obj))]
+    elif lib_db.IsContainer(eds_obj):
+        return DecodedContainer((item[0], decode_eds_obj(lib_db, item[1])) for item in eds_obj)
+    elif lib_db.IsNumber(eds_obj):
+        if lib_db.IsEnum(type(eds_obj)):
+            return DecodedEnum(int(eds_obj), str(eds_obj))
+        int_value, float_value = int(eds_obj), float(eds_obj)
+        return int_value if int_value == float_value else float_value
+    return str(eds_obj)
+
+
+def find_decoded_param(decoded_obj, parameter, obj_name=None):
+    """
+    Recursive function that returns the value of the first element named
+    parameter in a decoded object or None if it isn't found. Array elements
+    are matched by the array's name like TelemetryServer.get_tlm_param_val().
+    """
+    if isinstance(decoded_obj, list):
+        for element in decoded_obj:
+            value = find_decoded_param(element, parameter, obj_name)
+            if value is not None:
+                return value
+    elif isinstance(decoded_obj, DecodedContainer):
+        for name, element in decoded_obj.items():
+            value = find_decoded_param(element, parameter, name)
+            if value is not None:
+                return value
+    elif obj_name is not None and obj_name == parameter:
+        return decoded_obj
+    return None
+
+
+def decoded_entries(decoded_obj, base_name):
+    """
+    Recursive generator that yields the (name, value) of each number,
+    enumeration and string in a decoded object
+    """
+    if isinstance(decoded_obj, list):
+        for i, element in enumerate(decoded_obj):
+            yield from decoded_entries(element, f"{base_name}[{i}]")
+    elif isinstance(decoded_obj, DecodedContainer):
+        for name, element in decoded_obj.items():
+            yield from decoded_entries(element, f"{base_name}.{name}")
+    else:
+        yield base_name, decoded_obj
+
+
+def decode_worker(mission, target, shm_name, slot_size, in_queue, free_slots, out_queue):
+    """
+    Worker process loop. Decodes the datagrams in its ring until None is
+    received. Results are (app_id, eds_entry_name, decoded_obj) and a packet
+    that can't be decoded returns (app_id, None, None).
+    """
+    # Workers share the pool's resource tracker so the segment stays registered to the pool
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buf = shm.buf
+    eds_mission = EdsMission.acquire(mission, EdsMission.TELEMETRY_IF)
+    lib_db = eds_mission.lib_db
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+        slot, length = item
+        offset = slot*slot_size
+        datagram = bytes(buf[offset:offset+length])
+        free_slots.release()
+        app_id = ((datagram[0] << 8) | datagram[1]) & CCSDS_APID_MASK
+        try:
+            eds_entry, eds_obj = eds_mission.decode_message(datagram)
+            out_queue.put((app_id, eds_entry.Name, decode_eds_obj(lib_db, eds_obj)))
+        except RuntimeError:
+            out_queue.put((app_id, None, None))
+    del buf
+    shm.close()
+    eds_mission.release()
+
+
+###############################################################################
+
+class TelemetryDecodePool():
+    """
+    Decode telemetry datagrams in worker processes. submit() is called from
+    the telemetry server thread and get_results() returns the decoded
+    messages to the observer thread:
+        pool.start()
+        pool.submit(datagram)
+        for app_id, eds_entry, eds_obj in pool.get_results():
+    eds_entry is a DecodedEntry with the EDS entry Name and eds_obj is a
+    DecodedContainer. eds_entry and eds_obj are None if a packet couldn't be
+    decoded.
+    """
+    MAX_WORKER_RESTARTS = 3
+
+    def __init__(self, mission, target, worker_cnt, ring_slots=256, data_size=CVT_DATA_SIZE):
+
+        self.mission    = mission
+        self.target     = target
+        self.worker_cnt = max(worker_cnt, 1)
+        self.ring_slots = ring_slots
+        self.data_size  = data_size
+        self.context    = multiprocessing.get_context('spawn')  # Don't fork the GUI and server threads
+        self.workers    = []  # [process, shm, in_queue, free_slots, next slot], None if failed
+        self.restart_cnt = [0]*self.worker_cnt
+        self.out_queue  = None
+        self.entries    = {}  # EDS entry name: DecodedEntry
+
+        self.submit_cnt = 0
+        self.drop_cnt   = 0
+        self.result_cnt = 0
+        self.error_cnt  = 0
+
+    def start(self):
+        """
+        The workers are replaced as a unit so start() can be called while the
+        server thread is submitting datagrams
+        """
+        out_queue = self.context.Queue()
+        workers = [self.start_worker(i, out_queue) for i in range(self.worker_cnt)]
+        self.out_queue   = out_queue
+        self.workers     = workers
+        self.restart_cnt = [0]*self.worker_cnt
+        logger.info(f'Started {self.worker_cnt} telemetry decode workers with {self.ring_slots} slot rings')
+
+    def start_worker(self, index, out_queue):
+        shm = shared_memory.SharedMemory(create=True, size=self.ring_slots*self.data_size)
+        in_queue   = self.context.Queue()
+        free_slots = self.context.Semaphore(self.ring_slots)
+        process = self.context.Process(target=decode_worker, name=f'tlm-decode-{index}', daemon=True,
+                                       args=(self.mission, self.target, shm.name, self.data_size, in_queue, free_slots, out_queue))
+        process.start()
+        return [process, shm, in_queue, free_slots, 0]
+
+    def restart_worker(self, workers, index):
+        """
+        Replace a worker that has exited. The datagrams in its ring are lost.
+        Return the new worker or None if the worker has been restarted
+        MAX_WORKER_RESTARTS times.
+        """
+        if self.workers is not workers:
+            return None  # The pool was restarted or stopped
+        prev_worker = workers[index]
+        logger.error(f'Telemetry decode worker {prev_worker[0].name} exited with code {prev_worker[0].exitcode}')
+        new_workers = list(workers)
+        if self.restart_cnt[index] < self.MAX_WORKER_RESTARTS:
+            self.restart_cnt[index] += 1
+            new_workers[index] = self.start_worker(index, self.out_queue)
+            logger.info(f'Restarted telemetry decode worker {index}, restart {self.restart_cnt[index]} of {self.MAX_WORKER_RESTARTS}')
+        else:
+            new_workers[index] = None
+            logger.error(f'Telemetry decode worker {index} failed, its AppIds are decoded in the telemetry server thread')
+        self.workers = new_workers
+        self.stop_workers([prev_worker])
+        return new_workers[index]
+
+    def worker_failed(self, app_id):
+        """
+        Return True if the AppId's worker failed and it must be decoded by the caller
+        """
+        workers = self.workers
+        return len(workers) > 0 and workers[app_id % len(workers)] is None
+
+    def submit(self, datagram):
+        """
+        Return False if the datagram was dropped because its worker's ring is
+        full, it's too long or the pool is stopped. A worker that has exited is
+        restarted and False is returned without a drop if it failed.
+        """
+        length = len(datagram)
+        app_id = ((datagram[0] << 8) | datagram[1]) & CCSDS_APID_MASK
+        workers = self.workers
+        if len(workers) == 0:
+            self.drop_cnt += 1
+            return False
+        index = app_id % len(workers)
+        worker = workers[index]
+        if worker is None:
+            return False
+        if not worker[0].is_alive():
+            worker = self.restart_worker(workers, index)
+            if worker is None:
+                return False
+        if length > self.data_size or not worker[3].acquire(block=False):
+            self.drop_cnt += 1
+            return False
+        slot = worker[4]
+        offset = slot*self.data_size
+        worker[1].buf[offset:offset+length] = datagram
+        worker[4] = (slot + 1) % self.ring_slots
+        worker[2].put((slot, length))
+        self.submit_cnt += 1
+        return True
+
+    def get_results(self, timeout=None):
+        """
+        Return the available results. If timeout is not None wait up to
+        timeout seconds for the first result.
+        """
+        results = []
+        try:
+            result = self.out_queue.get(timeout=timeout) if timeout is not None else self.out_queue.get_nowait()
+            while True:
+                app_id, entry_name, eds_obj = result
+                if entry_name is None:
+                    self.error_cnt += 1
+                    results.append((app_id, None, None))
+                else:
+                    eds_entry = self.entries.get(entry_name)
+                    if eds_entry is None:
+                        eds_entry = self.entries[entry_name] = DecodedEntry(entry_name)
+                    results.append((app_id, eds_entry, eds_obj))
+                result = self.out_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.result_cnt += len(results)
+        return results
+
+    def stop(self):
+        workers = self.workers
+        self.workers = []
+        self.stop_workers(workers)
+        logger.info(f'Stopped telemetry decode workers: {self.submit_cnt} submitted, {self.drop_cnt} dropped, {self.error_cnt} decode errors')
+
+    def stop_workers(self, workers, timeout=2.0):
+        workers = [worker for worker in workers if worker is not None]
+        for worker in workers:
+            worker[2].put(None)
+        for process, shm, in_queue, free_slots, slot in workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+            shm.close()
+            shm.unlink()
+
+    def restart(self):
+        """
+        Replace the workers so they load the current EDS database. Results of
+        the previous workers that haven't been read are discarded.
+        """
+        prev_workers = self.workers
+        self.start()
+        self.stop_workers(prev_workers)
+
+
+###############################################################################
+
+def benchmark_datagrams(eds_mission, topic_index):
+    """
+    Create a packed default message for each telemetry topic
+    """
+    datagrams = []
+    for topic_name, app_id in topic_index.app_ids.items():
+        try:
+            eds_entry = eds_mission.get_database_entry(eds_mission.get_eds_id_from_topic(topic_name))
+            datagram = bytearray(bytes(eds_mission.get_packed_obj(eds_entry())))
+        except RuntimeError:
+            continue
+        datagram[0:2] = topic_index.get_stream_id(app_id).to_bytes(2, byteorder='big')
+        datagram[4:6] = (len(datagram)-7).to_bytes(2, byteorder='big')
+        datagrams.append(bytes(datagram))
+    return datagrams
+
+
+def benchmark(mission, target, packet_cnt):
+    """
+    Compare decoding in one thread with decoding in pools of 1 to
+    os.cpu_count() workers
+    """
+    eds_mission = EdsMission.acquire(mission, EdsMission.TELEMETRY_IF)
+    instance_id = eds_mission.has_target(target)[1]
+    datagrams = benchmark_datagrams(eds_mission, eds_mission.get_topic_index(instance_id))
+    if len(datagrams) == 0:
+        print(f'No {mission} telemetry topics can be packed')
+        return
+    packets = [datagrams[i % len(datagrams)] for i in range(packet_cnt)]
+    print(f'Decoding {packet_cnt} packets of {len(datagrams)} topics')
+
+    start = time.perf_counter()
+    for datagram in packets:
+        eds_mission.decode_message(datagram)
+    base_rate = packet_cnt/(time.perf_counter() - start)
+    print(f'Server thread: {base_rate:10.0f} packets/s')
+
+    worker_cnt = 1
+    while worker_cnt <= (os.cpu_count() or 1):
+        pool = TelemetryDecodePool(mission, target, worker_cnt)
+        pool.start()
+        # Start timing after the workers have loaded the EDS database
+        for datagram in datagrams:
+            pool.submit(datagram)
+        result_cnt = 0
+        while result_cnt < len(datagrams):
+            result_cnt += len(pool.get_results(timeout=60.0))
+        start = time.perf_counter()
+        result_cnt = 0
+        for datagram in packets:
+            while not pool.submit(datagram):
+                pool.drop_cnt -= 1
+                result_cnt += len(pool.get_results(timeout=0.01))
+        while result_cnt < packet_cnt:
+            result_cnt += len(pool.get_results(timeout=1.0))
+        rate = packet_cnt/(time.perf_counter() - start)
+        print(f'{worker_cnt:2d} workers:    {rate:10.0f} packets/s, {rate/base_rate:5.2f}x')
+        pool.stop()
+        worker_cnt *= 2
+    eds_mission.release()
+
+
+if __name__ == '__main__':
+
+    mission = sys.argv[1] if len(sys.argv) > 1 else 'basecamp'
+    target  = sys.argv[2] if len(sys.argv) > 2 else 'cpu1'
+    packet_cnt = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    benchmark(mission, target, packet_cnt)
@@ -0,0 +1,403 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Compute derived telemetry points from expressions over telemetry
+
+    Notes:
+      1. Derived points are defined in a JSON file and grouped into virtual
+         telemetry messages:
+           {
+             "messages": [
+               {"name": "CMD_HEALTH",
+                "points": [
+                  {"name": "EsCmdRate", "expression": "rate({CFE_ES/Application/HK_TLM:CommandCounter})"},
+                  {"name": "CmdErrors", "expression": "{CFE_ES/Application/HK_TLM:CommandErrorCounter} + {CFE_SB/Application/HK_TLM:CommandErrorCounter}"},
+                  {"name": "CmdHealthy", "expression": "CmdErrors == 0"}
+                ]}
+             ]
+           }
+         {topic:element} references a telemetry payload element and a bare
+         name references another derived point.
+      2. Expressions are parsed once with the Python ast module and limited
+         to arithmetic, comparisons, boolean logic, conditional expressions
+         and the functions in FUNCTIONS. rate(x) and delta(x) keep state
+         between evaluations and use the spacecraft time of the packet that
+         triggered the evaluation.
+      3. The points form a DAG that is checked for cycles and sorted when
+         loaded. When a packet arrives only the points that depend on it,
+         directly or through other points, are evaluated. A point is None
+         until all of its inputs have values.
+      4. Each message is published as a virtual TelemetryMessage with the
+         topic DERIVED/Application/<name> and an AppId above the CCSDS range.
+         Observers subscribe to it like any other message and the payload
+         elements are the point names.
+"""
+
+import os
+import sys
+import ast
+import math
+import json
+import re
+
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    sys.path.append('..')
+    from telemetry  import TelemetryMessage, TelemetryObserver, TelemetryServer
+    from tlmhistory import compile_accessor
+else:
+    from .telemetry  import TelemetryMessage, TelemetryObserver, TelemetryServer
+    from .tlmhistory import compile_accessor
+
+import logging
+logger = logging.getLogger(__name__)
+
+DERIVED_APP_NAME = 'DERIVED'
+
+FUNCTIONS = {'abs': abs, 'min': min, 'max': max, 'round': round, 'int': int, 'float': float, 'bool': bool,
+             'sqrt': math.sqrt, 'exp': math.exp, 'log': math.log, 'log10': math.log10,
+             'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'atan2': math.atan2,
+             'degrees': math.degrees, 'radians': math.radians}
+
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call,
+                 ast.Name, ast.Load, ast.Constant,
+                 ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+                 ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift,
+                 ast.UAdd, ast.USub, ast.Not, ast.Invert, ast.And, ast.Or,
+                 ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+TLM_REF_PATTERN = re.compile(r'\{([^{}:]+):([^{}]+)\}')
+
+
+###############################################################################
+
+class DerivedError(Exception):
+    pass
+
+
+###############################################################################
+
+class StatefulFunction():
+    """
+    Base class for functions that need the previous evaluation
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.prev_value = None
+        self.prev_time  = None
+
+
+class RateFunction(StatefulFunction):
+    """
+    Rate of change per second of spacecraft time
+    """
+    def __call__(self, value):
+        now = self.engine.eval_time
+        rate = None
+        if self.prev_value is not None and now > self.prev_time:
+            rate = (value - self.prev_value)/(now - self.prev_time)
+        self.prev_value = value
+        self.prev_time  = now
+        return rate
+
+
+class DeltaFunction(StatefulFunction):
+    """
+    Change since the previous evaluation
+    """
+    def __call__(self, value):
+        delta = None if self.prev_value is None else value - self.prev_value
+        self.prev_value = value
+        return delta
+
+
+STATEFUL_FUNCTIONS = {'rate': RateFunction, 'delta': DeltaFunction}
+
+
+###############################################################################
+
+class StatefulCallTransformer(ast.NodeTransformer):
+    """
+    Replace each stateful function call with a call to its own instance
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.names  = []
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in STATEFUL_FUNCTIONS:
+            name = f'_{node.func.id}_{len(self.engine.namespace)}'
+            self.engine.namespace[name] = STATEFUL_FUNCTIONS[node.func.id](self.engine)
+            self.names.append(name)
+            node.func = ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node.func)
+        return node
+
+
+###############################################################################
+
+class DerivedPoint():
+    """
+    A compiled derived point expression
+    """
+    def __init__(self, name, expression, msg_name):
+        self.name       = name
+        self.expression = expression
+        self.msg_name   = msg_name
+        self.code   = None
+        self.refs   = set()   # Namespace names this point reads
+        self.derived_refs = set()
+        self.app_ids = set()  # AppIds of all raw inputs, including those of referenced points
+
+
+###############################################################################
+
+class DerivedPayload(dict):
+    """
+    Payload elements can be accessed as items or attributes
+    """
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class DerivedPriHdr():
+    def __init__(self, app_id, sequence, length):
+        self.AppId    = app_id
+        self.Sequence = sequence
+        self.Length   = length
+
+
+class DerivedEntry():
+    def __init__(self, name):
+        self.Name = name
+
+
+class DerivedTlmObj():
+    """
+    Minimal stand-in for a decoded EDS telemetry object. Sec is the secondary
+    header of the packet that triggered the evaluation.
+    """
+    def __init__(self, pri_hdr, sec_hdr, payload):
+        self.CCSDS   = pri_hdr
+        self.Sec     = sec_hdr
+        self.Payload = payload
+
+
+###############################################################################
+
+class DerivedTelemetry(TelemetryObserver):
+    """
+    Derived point engine. update() runs in the telemetry server thread and
+    the virtual messages notify their observers from the same thread.
+    """
+
+    def __init__(self, tlm_server: TelemetryServer):
+        super().__init__(tlm_server)
+
+        self.raw_inputs = {}      # app_id: [(namespace name, accessor)]
+        self.virtual_msgs = {}    # msg_name: TelemetryMessage
+        self.clear()
+
+    def clear(self):
+        """
+        Remove the loaded points, their raw message observers and their
+        virtual messages
+        """
+        for app_id in self.raw_inputs:
+            tlm_msg = self.tlm_server.tlm_messages.get(app_id)
+            if tlm_msg is not None and self in tlm_msg.observers:
+                self.tlm_server.remove_msg_observer(tlm_msg, self)
+        for tlm_msg in self.virtual_msgs.values():
+            self.tlm_server.remove_virtual_msg(tlm_msg)
+
+        self.namespace = dict(FUNCTIONS)
+        self.namespace['__builtins__'] = {}
+        self.points = {}          # name: DerivedPoint
+        self.raw_inputs = {}      # app_id: [(namespace name, accessor)]
+        self.eval_order = {}      # app_id: (DerivedPoint, ...) in topological order
+        self.virtual_msgs = {}    # msg_name: TelemetryMessage
+        self.msg_points = {}      # msg_name: [DerivedPoint]
+        self.msg_seq_cnt = {}
+        self.eval_time = 0.0
+
+    def load(self, derived_file):
+        """
+        Load and compile a derived point file. The previously loaded points
+        are replaced. Returns a list of error strings, if any errors occur
+        nothing is loaded.
+        """
+        self.clear()
+        try:
+            with open(derived_file) as f:
+                msg_defs = json.load(f).get('messages', [])
+            self.compile(msg_defs)
+        except (OSError, ValueError, KeyError, SyntaxError, DerivedError) as e:
+            error = f'Error loading derived telemetry file {derived_file}: {e}'
+            logger.error(error)
+            return [error]
+        logger.info(f'Loaded {len(self.points)} derived telemetry points from {derived_file}')
+        return []
+
+    def compile(self, msg_defs):
+        self.clear()
+        raw_refs = {}  # (topic, element): namespace name
+        points = {}
+        for msg_def in msg_defs:
+            msg_name = msg_def['name']
+            for point_def in msg_def['points']:
+                name = point_def['name']
+                if not name.isidentifier() or name in FUNCTIONS or name in points:
+                    raise DerivedError(f'Invalid or duplicate point name {name}')
+                points[name] = self.compile_point(name, point_def['expression'], msg_name, raw_refs)
+
+        # Resolve references and the raw inputs of each point
+        raw_inputs = {}
+        raw_names  = {}
+        for (topic, element), ref_name in raw_refs.items():
+            tlm_msg = self.tlm_server.get_tlm_msg_from_topic(topic)
+            if tlm_msg is None or tlm_msg.app_id >= TelemetryServer.VIRTUAL_APP_ID_BASE:
+                raise DerivedError(f'Telemetry topic {topic} is not defined')
+            raw_inputs.setdefault(tlm_msg.app_id, []).append((ref_name, compile_accessor(element)))
+            raw_names[ref_name] = tlm_msg.app_id
+        for point in points.values():
+            for ref in point.refs:
+                if ref in points:
+                    point.derived_refs.add(ref)
+                elif ref in raw_names:
+                    point.app_ids.add(raw_names[ref])
+                elif ref not in self.namespace:
+                    raise DerivedError(f'Point {point.name} references undefined name {ref}')
+
+        order = self.sort_points(points)
+        for point in order:
+            for ref in point.derived_refs:
+                point.app_ids |= points[ref].app_ids
+            self.namespace[point.name] = None
+        for ref_name in raw_names:
+            self.namespace[ref_name] = None
+
+        self.points = points
+        self.raw_inputs = raw_inputs
+        for app_id in self.raw_inputs:
+            self.eval_order[app_id] = tuple(point for point in order if app_id in point.app_ids)
+            self.tlm_server.add_msg_observer(self.tlm_server.tlm_messages[app_id], self)
+
+        for point in order:
+            self.msg_points.setdefault(point.msg_name, []).append(point)
+        for i, msg_name in enumerate(self.msg_points):
+            tlm_msg = TelemetryMessage(DERIVED_APP_NAME, msg_name, TelemetryServer.VIRTUAL_APP_ID_BASE + i)
+            input_app_ids = set()
+            for point in self.msg_points[msg_name]:
+                input_app_ids |= point.app_ids
+            self.tlm_server.add_virtual_msg(tlm_msg, input_app_ids)
+            self.virtual_msgs[msg_name] = tlm_msg
+            self.msg_seq_cnt[msg_name] = 0
+
+    def compile_point(self, name, expression, msg_name, raw_refs):
+        point = DerivedPoint(name, expression, msg_name)
+
+        def replace_tlm_ref(match):
+            key = (match.group(1).strip(), match.group(2).strip())
+            if key not in raw_refs:
+                raw_refs[key] = f'_tlm_{len(raw_refs)}'
+            return raw_refs[key]
+
+        tree = ast.parse(TLM_REF_PATTERN.sub(replace_tlm_ref, expression), mode='eval')
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise DerivedError(f'Point {name} expression uses unsupported syntax {type(node).__name__}')
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and
+                                                   (node.func.id in FUNCTIONS or node.func.id in STATEFUL_FUNCTIONS)):
+                raise DerivedError(f'Point {name} expression calls an unsupported function')
+        transformer = StatefulCallTransformer(self)
+        tree = ast.fix_missing_locations(transformer.visit(tree))
+        point.refs = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} - set(FUNCTIONS) - set(transformer.names)
+        point.code = compile(tree, f'<derived {name}>', 'eval')
+        return point
+
+    def sort_points(self, points):
+        """
+        Return the points in dependency order. Raises DerivedError for cycles.
+        """
+        order = []
+        state = {}  # name: 1 visiting, 2 done
+
+        def visit(name, path):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise DerivedError(f"Derived point cycle: {' -> '.join(path + [name])}")
+            state[name] = 1
+            for ref in sorted(points[name].derived_refs):
+                visit(ref, path + [name])
+            state[name] = 2
+            order.append(points[name])
+
+        for name in points:
+            visit(name, [])
+        return order
+
+    def update(self, tlm_msg: TelemetryMessage) -> None:
+        """
+        Receive telemetry updates. Update the raw inputs from the message and
+        evaluate the dependent points.
+        """
+        inputs = self.raw_inputs.get(tlm_msg.app_id)
+        if inputs is None:
+            return
+        namespace = self.namespace
+        payload = tlm_msg.payload()
+        for ref_name, accessor in inputs:
+            try:
+                namespace[ref_name] = float(accessor(payload))
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+                namespace[ref_name] = None
+
+        self.eval_time = tlm_msg.sec_hdr_time()
+        updated_msgs = set()
+        for point in self.eval_order.get(tlm_msg.app_id, ()):
+            value = None
+            if all(namespace[ref] is not None for ref in point.refs):
+                try:
+                    value = eval(point.code, namespace)
+                except (ArithmeticError, TypeError, ValueError):
+                    value = None
+            namespace[point.name] = value
+            updated_msgs.add(point.msg_name)
+
+        for msg_name in updated_msgs:
+            self.publish(msg_name, tlm_msg.sec_hdr())
+
+    def publish(self, msg_name, sec_hdr):
+        virtual_msg = self.virtual_msgs[msg_name]
+        points = self.msg_points[msg_name]
+        self.msg_seq_cnt[msg_name] = (self.msg_seq_cnt[msg_name] + 1) & 0x3FFF
+        payload = DerivedPayload((point.name, self.namespace[point.name]) for point in points)
+        pri_hdr = DerivedPriHdr(virtual_msg.app_id, self.msg_seq_cnt[msg_name], len(points))
+        virtual_msg.update(DerivedEntry(f'{DERIVED_APP_NAME}/{msg_name}'), DerivedTlmObj(pri_hdr, sec_hdr, payload))
+
+    def get_value(self, name):
+        """
+        Return the current value of a derived point
+        """
+        if name not in self.points:
+            return None
+        return self.namespace[name]
+
+    def get_topics(self):
+        return [f'{DERIVED_APP_NAME}/Application/{msg_name}' for msg_name in self.virtual_msgs]
+
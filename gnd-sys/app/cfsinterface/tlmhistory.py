@@ -0,0 +1,393 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Maintain a bounded history of selected telemetry points
+
+    Notes:
+      1. TelemetryMessage only holds the most recent eds_obj. TelemetryHistory
+         observes the telemetry server once and records (ground time,
+         spacecraft time, value) samples for the points that have been added.
+      2. Each point has three tiers stored in fixed size NumPy ring buffers:
+         raw samples, 1 second and 1 minute aggregates. Aggregates hold the
+         min, max, mean and sample count for the period so memory is bounded
+         regardless of the telemetry rate.
+      3. Points are identified by topic and a dotted payload element path
+         such as 'CommandCounter' or 'Imu.Rate[0]'.
+      4. Range queries use ground time (time.time()) because scripts ask
+         questions like "max over the last 60 seconds". Spacecraft time is
+         stored with each sample for plotting.
+"""
+
+import os
+import sys
+import time
+import threading
+
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    sys.path.append('..')
+    from telemetry import TelemetryMessage, TelemetryObserver, TelemetryServer
+else:
+    from .telemetry import TelemetryMessage, TelemetryObserver, TelemetryServer
+from tools import lazy_import
+
+# Most importers only need compile_accessor() so NumPy is loaded when the first history is created
+np = lazy_import('numpy')
+
+TIER_RAW = 'raw'
+TIER_SEC = '1s'
+TIER_MIN = '1m'
+
+RAW_DTYPE = [('gnd_time', 'f8'), ('sc_time', 'f8'), ('value', 'f8')]
+AGG_DTYPE = [('gnd_time', 'f8'), ('sc_time', 'f8'), ('min', 'f8'), ('max', 'f8'), ('mean', 'f8'), ('count', 'u4')]
+
+
+###############################################################################
+
+def parse_element_path(tlm_element):
+    """
+    Convert a dotted payload path into a list of (name, index) tuples. index
+    is None for non-array elements.
+    """
+    path = []
+    for name in tlm_element.split('.'):
+        if '[' in name:
+            name, index = name.rstrip(']').split('[')
+            path.append((name, int(index)))
+        else:
+            path.append((name, None))
+    return path
+
+
+def get_element_value(payload, path):
+    value = payload
+    for name, index in path:
+        value = value[name]
+        if index is not None:
+            value = value[index]
+    return float(value)
+
+
+def compile_accessor(tlm_element):
+    """
+    Return a function that retrieves the element from a payload object
+    """
+    keys = []
+    for name, index in parse_element_path(tlm_element):
+        keys.append(name)
+        if index is not None:
+            keys.append(index)
+    keys = tuple(keys)
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda payload: payload[key]
+    def accessor(payload):
+        value = payload
+        for key in keys:
+            value = value[key]
+        return value
+    return accessor
+
+
+###############################################################################
+
+class HistoryRing():
+    """
+    Fixed depth ring of records with a NumPy structured dtype. Records must be
+    appended in ground time order so each of the two stored segments is sorted
+    and can be searched without reordering the ring.
+    """
+    def __init__(self, depth, dtype):
+        self.depth = depth
+        self.data  = np.zeros(depth, dtype=dtype)
+        self.head  = 0   # Next write index
+        self.count = 0
+
+    def append(self, record):
+        self.data[self.head] = record
+        self.head = (self.head + 1) % self.depth
+        if self.count < self.depth:
+            self.count += 1
+
+    def oldest_time(self):
+        if self.count == 0:
+            return None
+        return float(self.data['gnd_time'][self.head if self.count == self.depth else 0])
+
+    def segments(self):
+        if self.count < self.depth:
+            return (self.data[:self.count],)
+        return (self.data[self.head:], self.data[:self.head])
+
+    def query(self, start, end):
+        """
+        Return a copy of the records with start <= gnd_time <= end
+        """
+        records = []
+        for segment in self.segments():
+            gnd_time = segment['gnd_time']
+            i = np.searchsorted(gnd_time, start, side='left')
+            j = np.searchsorted(gnd_time, end, side='right')
+            if j > i:
+                records.append(segment[i:j])
+        if len(records) == 0:
+            return np.zeros(0, dtype=self.data.dtype)
+        return np.concatenate(records)
+
+
+###############################################################################
+
+class HistoryAggregator():
+    """
+    Accumulate samples for one aggregate period and append the aggregate to
+    a ring when the period ends.
+    """
+    def __init__(self, period, depth):
+        self.period = period
+        self.ring   = HistoryRing(depth, AGG_DTYPE)
+        self.bin    = None
+        self.reset()
+
+    def reset(self):
+        self.gnd_time = 0.0
+        self.sc_time  = 0.0
+        self.min   = np.inf
+        self.max   = -np.inf
+        self.sum   = 0.0
+        self.count = 0
+
+    def add(self, gnd_time, sc_time, value):
+        sample_bin = int(gnd_time // self.period)
+        if sample_bin != self.bin:
+            self.flush()
+            self.bin = sample_bin
+            self.gnd_time = sample_bin*self.period
+            self.sc_time  = sc_time
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sum   += value
+        self.count += 1
+
+    def flush(self):
+        if self.count > 0:
+            self.ring.append((self.gnd_time, self.sc_time, self.min, self.max, self.sum/self.count, self.count))
+        self.reset()
+
+    def open_record(self):
+        """
+        Return the partially filled period as an AGG_DTYPE array
+        """
+        if self.count == 0:
+            return np.zeros(0, dtype=AGG_DTYPE)
+        return np.array([(self.gnd_time, self.sc_time, self.min, self.max, self.sum/self.count, self.count)], dtype=AGG_DTYPE)
+
+    def query(self, start, end):
+        records = self.ring.query(start, end)
+        if self.count > 0 and start <= self.gnd_time + self.period and self.gnd_time <= end:
+            records = np.concatenate((records, self.open_record()))
+        return records
+
+
+###############################################################################
+
+class PointHistory():
+    """
+    Raw, 1 second and 1 minute history tiers for one telemetry point
+    """
+    RAW_DEPTH = 20000
+    SEC_DEPTH = 3600   # 1 hour
+    MIN_DEPTH = 1440   # 1 day
+
+    def __init__(self, tlm_topic, tlm_element, raw_depth=RAW_DEPTH, sec_depth=SEC_DEPTH, min_depth=MIN_DEPTH):
+        self.tlm_topic   = tlm_topic
+        self.tlm_element = tlm_element
+        self.path = parse_element_path(tlm_element)
+        self.raw  = HistoryRing(raw_depth, RAW_DTYPE)
+        self.tiers = {TIER_SEC: HistoryAggregator(1.0, sec_depth),
+                      TIER_MIN: HistoryAggregator(60.0, min_depth)}
+
+    def add(self, gnd_time, sc_time, value):
+        self.raw.append((gnd_time, sc_time, value))
+        for aggregator in self.tiers.values():
+            aggregator.add(gnd_time, sc_time, value)
+
+    def select_tier(self, start):
+        """
+        Return the finest tier that still covers start
+        """
+        oldest = self.raw.oldest_time()
+        if oldest is None or oldest <= start or self.raw.count < self.raw.depth:
+            return TIER_RAW
+        for tier in (TIER_SEC, TIER_MIN):
+            oldest = self.tiers[tier].ring.oldest_time()
+            if oldest is None or oldest <= start or self.tiers[tier].ring.count < self.tiers[tier].ring.depth:
+                return tier
+        return TIER_MIN
+
+    def query(self, start, end, tier=None):
+        if tier is None:
+            tier = self.select_tier(start)
+        if tier == TIER_RAW:
+            return self.raw.query(start, end)
+        return self.tiers[tier].query(start, end)
+
+    def stats(self, start, end):
+        """
+        Return a dictionary with the min, max, mean and count over the time
+        range or None if there are no samples in the range
+        """
+        tier = self.select_tier(start)
+        records = self.query(start, end, tier)
+        if len(records) == 0:
+            return None
+        if tier == TIER_RAW:
+            values = records['value']
+            return {'min': float(values.min()), 'max': float(values.max()),
+                    'mean': float(values.mean()), 'count': len(values)}
+        count = records['count'].astype(np.float64)
+        return {'min': float(records['min'].min()), 'max': float(records['max'].max()),
+                'mean': float((records['mean']*count).sum()/count.sum()), 'count': int(count.sum())}
+
+
+###############################################################################
+
+class TelemetryHistory(TelemetryObserver):
+    """
+    Record the history of selected telemetry points. update() is called from
+    the telemetry server thread and the query methods may be called from any
+    thread.
+    """
+
+    def __init__(self, tlm_server: TelemetryServer):
+        super().__init__(tlm_server)
+
+        self.lock = threading.Lock()
+        self.points = {}         # (topic, element): PointHistory
+        self.app_id_points = {}  # app_id: [PointHistory]
+
+    def add_point(self, tlm_topic, tlm_element, **kwargs):
+        """
+        Start recording a point. kwargs may override the PointHistory tier
+        depths. Returns False if the topic is not defined.
+        """
+        key = (tlm_topic, tlm_element)
+        if key in self.points:
+            return True
+        tlm_msg = self.tlm_server.get_tlm_msg_from_topic(tlm_topic)
+        if tlm_msg is None:
+            print(f'TelemetryHistory ignoring unknown telemetry topic {tlm_topic}')
+            return False
+        with self.lock:
+            point = PointHistory(tlm_topic, tlm_element, **kwargs)
+            self.points[key] = point
+            if tlm_msg.app_id not in self.app_id_points:
+                self.app_id_points[tlm_msg.app_id] = []
+                self.tlm_server.add_msg_observer(tlm_msg, self)
+            self.app_id_points[tlm_msg.app_id].append(point)
+        return True
+
+    def remove_point(self, tlm_topic, tlm_element):
+        with self.lock:
+            point = self.points.pop((tlm_topic, tlm_element), None)
+            if point is None:
+                return
+            for app_id, points in self.app_id_points.items():
+                if point in points:
+                    points.remove(point)
+                    if len(points) == 0:
+                        del self.app_id_points[app_id]
+                        self.tlm_server.remove_msg_observer(self.tlm_server.tlm_messages[app_id], self)
+                    break
+
+    def has_point(self, tlm_topic, tlm_element):
+        return (tlm_topic, tlm_element) in self.points
+
+    def update(self, tlm_msg: TelemetryMessage) -> None:
+        """
+        Receive telemetry updates
+        """
+        points = self.app_id_points.get(tlm_msg.app_id)
+        if points is None:
+            return
+        gnd_time = time.time()
+        sc_time  = tlm_msg.sec_hdr_time()
+        payload  = tlm_msg.payload()
+        with self.lock:
+            for point in points:
+                try:
+                    point.add(gnd_time, sc_time, get_element_value(payload, point.path))
+                except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+                    pass
+
+    def query(self, tlm_topic, tlm_element, start, end=None, tier=None):
+        """
+        Return a copy of the records in the ground time range. Raw records
+        have RAW_DTYPE fields and aggregate records have AGG_DTYPE fields. If
+        tier is None the finest tier that covers start is used.
+        """
+        if end is None:
+            end = time.time()
+        with self.lock:
+            point = self.points.get((tlm_topic, tlm_element))
+            if point is None:
+                return None
+            return point.query(start, end, tier)
+
+    def get_samples(self, tlm_topic, tlm_element, window):
+        """
+        Return (sc_time, value) arrays for the most recent window seconds. This
+        is intended for pre-filling plots so aggregate tiers return the mean.
+        """
+        records = self.query(tlm_topic, tlm_element, time.time() - window)
+        if records is None or len(records) == 0:
+            return np.zeros(0), np.zeros(0)
+        values = records['value'] if 'value' in records.dtype.names else records['mean']
+        return records['sc_time'].copy(), values.copy()
+
+    def stats(self, tlm_topic, tlm_element, window):
+        """
+        Return {min, max, mean, count} over the last window seconds or None
+        """
+        end = time.time()
+        with self.lock:
+            point = self.points.get((tlm_topic, tlm_element))
+            if point is None:
+                return None
+            return point.stats(end - window, end)
+
+    def max(self, tlm_topic, tlm_element, window):
+        stats = self.stats(tlm_topic, tlm_element, window)
+        return None if stats is None else stats['max']
+
+    def min(self, tlm_topic, tlm_element, window):
+        stats = self.stats(tlm_topic, tlm_element, window)
+        return None if stats is None else stats['min']
+
+    def mean(self, tlm_topic, tlm_element, window):
+        stats = self.stats(tlm_topic, tlm_element, window)
+        return None if stats is None else stats['mean']
+
+    def latest(self, tlm_topic, tlm_element):
+        """
+        Return the most recent (gnd_time, sc_time, value) or None
+        """
+        with self.lock:
+            point = self.points.get((tlm_topic, tlm_element))
+            if point is None or point.raw.count == 0:
+                return None
+            record = point.raw.data[(point.raw.head - 1) % point.raw.depth]
+            return (float(record['gnd_time']), float(record['sc_time']), float(record['value']))
+
@@ -0,0 +1,344 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Check telemetry points against red/yellow limits and stale timeouts
+
+    Notes:
+      1. Limits are defined in a JSON file:
+           {
+             "limits": [
+               {"topic": "CFE_ES/Application/HK_TLM", "element": "CommandErrorCounter",
+                "yellow-high": 1, "red-high": 5, "hysteresis": 0, "debounce": 1, "stale": 10},
+               ...
+             ]
+           }
+         All limit values are optional. "hysteresis" is the amount a value
+         must move back inside a limit before the limit state is relaxed.
+         "debounce" is the number of consecutive samples a new limit state
+         must persist before it's declared. "stale" is the number of seconds
+         without a packet before a previously received point is declared
+         stale.
+      2. Limits are compiled into a table indexed by AppId so a packet is
+         checked in O(number of limits on that packet). update() runs in the
+         telemetry server thread and only limit state transitions generate
+         events, which are written to the caller's event queue.
+      3. check_stale() is called periodically by the owner, typically from an
+         existing 1Hz poll.
+      4. Run 'python3 tlmlimits.py [limit_cnt] [packet_cnt]' to benchmark the
+         per-packet overhead using synthetic payloads.
+"""
+
+import os
+import sys
+import time
+import json
+import threading
+
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    sys.path.append('..')
+    from telemetry  import TelemetryMessage, TelemetryObserver, TelemetryServer
+    from tlmhistory import compile_accessor
+else:
+    from .telemetry  import TelemetryMessage, TelemetryObserver, TelemetryServer
+    from .tlmhistory import compile_accessor
+
+import logging
+logger = logging.getLogger(__name__)
+
+LIMIT_NOMINAL     = 'NOMINAL'
+LIMIT_YELLOW_LOW  = 'YELLOW LOW'
+LIMIT_YELLOW_HIGH = 'YELLOW HIGH'
+LIMIT_RED_LOW     = 'RED LOW'
+LIMIT_RED_HIGH    = 'RED HIGH'
+LIMIT_STALE       = 'STALE'
+LIMIT_INVALID     = 'INVALID'  # Value couldn't be retrieved or converted
+
+
+###############################################################################
+
+class LimitPoint():
+    """
+    Compiled limit definition and its current state. Missing limits are set
+    to +/- infinity so classify() doesn't need to test for them.
+    """
+    INF = float('inf')
+
+    def __init__(self, limit_def, app_id):
+        self.topic   = limit_def['topic']
+        self.element = limit_def['element']
+        self.app_id  = app_id
+        self.accessor = compile_accessor(self.element)
+
+        self.red_low     = float(limit_def.get('red-low', -self.INF))
+        self.yellow_low  = float(limit_def.get('yellow-low', -self.INF))
+        self.yellow_high = float(limit_def.get('yellow-high', self.INF))
+        self.red_high    = float(limit_def.get('red-high', self.INF))
+        self.hysteresis  = float(limit_def.get('hysteresis', 0.0))
+        self.debounce    = max(1, int(limit_def.get('debounce', 1)))
+        self.stale_timeout = limit_def.get('stale', None)
+
+        self.state   = LIMIT_NOMINAL
+        self.value   = None
+        self.pending_state = None
+        self.pending_cnt   = 0
+        self.last_rx_time  = None  # Points aren't declared stale until they've been received
+
+    def name(self):
+        return f"{self.topic.split('/')[0]}/{self.topic.split('/')[-1]} {self.element}"
+
+    def classify(self, value):
+        """
+        Return the limit state for value. A limit that is currently violated
+        is relaxed by the hysteresis so a value hovering at a limit doesn't
+        toggle the state.
+        """
+        h_red_low  = h_yellow_low  = 0.0
+        h_red_high = h_yellow_high = 0.0
+        state = self.state
+        if state == LIMIT_RED_LOW:
+            h_red_low = h_yellow_low = self.hysteresis
+        elif state == LIMIT_YELLOW_LOW:
+            h_yellow_low = self.hysteresis
+        elif state == LIMIT_RED_HIGH:
+            h_red_high = h_yellow_high = self.hysteresis
+        elif state == LIMIT_YELLOW_HIGH:
+            h_yellow_high = self.hysteresis
+
+        if value <= self.red_low + h_red_low:
+            return LIMIT_RED_LOW
+        if value >= self.red_high - h_red_high:
+            return LIMIT_RED_HIGH
+        if value <= self.yellow_low + h_yellow_low:
+            return LIMIT_YELLOW_LOW
+        if value >= self.yellow_high - h_yellow_high:
+            return LIMIT_YELLOW_HIGH
+        return LIMIT_NOMINAL
+
+    def check(self, payload, rx_time):
+        """
+        Check the point's value and return the new state if a transition is
+        declared, otherwise None
+        """
+        self.last_rx_time = rx_time
+        try:
+            self.value = float(self.accessor(payload))
+            new_state = self.classify(self.value)
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+            self.value = None
+            new_state = LIMIT_INVALID
+
+        if new_state == self.state:
+            self.pending_state = None
+            self.pending_cnt   = 0
+            return None
+        if new_state != self.pending_state:
+            self.pending_state = new_state
+            self.pending_cnt   = 0
+        self.pending_cnt += 1
+        # A stale point is declared fresh on the first packet
+        if self.pending_cnt >= self.debounce or self.state == LIMIT_STALE:
+            self.state = new_state
+            self.pending_state = None
+            self.pending_cnt   = 0
+            return new_state
+        return None
+
+    def limit_str(self):
+        if self.state == LIMIT_RED_LOW:
+            return f'red low {self.red_low}'
+        if self.state == LIMIT_RED_HIGH:
+            return f'red high {self.red_high}'
+        if self.state == LIMIT_YELLOW_LOW:
+            return f'yellow low {self.yellow_low}'
+        if self.state == LIMIT_YELLOW_HIGH:
+            return f'yellow high {self.yellow_high}'
+        return ''
+
+
+###############################################################################
+
+class TelemetryLimits(TelemetryObserver):
+    """
+    Limit checking engine. Events are strings written to event_queue using
+    put_nowait() which is safe from the telemetry thread.
+    """
+
+    def __init__(self, tlm_server: TelemetryServer, event_queue):
+        super().__init__(tlm_server)
+
+        self.event_queue = event_queue
+        self.lock = threading.Lock()
+        self.limit_table = {}  # app_id: (LimitPoint, ...)
+        self.points = []
+        self.event_cnt = 0
+
+    def load(self, limits_file):
+        """
+        Replace the current limits with the definitions in limits_file. Returns
+        a list of error strings.
+        """
+        errors = []
+        try:
+            with open(limits_file) as f:
+                limit_defs = json.load(f).get('limits', [])
+        except (OSError, ValueError) as e:
+            return [f'Error loading limits file {limits_file}: {e}']
+
+        points = []
+        for i, limit_def in enumerate(limit_defs):
+            try:
+                tlm_msg = self.tlm_server.get_tlm_msg_from_topic(limit_def['topic'])
+                if tlm_msg is None:
+                    errors.append(f"Limit {i} topic {limit_def['topic']} is not defined")
+                    continue
+                points.append(LimitPoint(limit_def, tlm_msg.app_id))
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                errors.append(f'Limit {i} definition error: {e}')
+        self.set_points(points)
+        for error in errors:
+            logger.error(error)
+        logger.info(f'Loaded {len(points)} telemetry limits from {limits_file}')
+        return errors
+
+    def set_points(self, points):
+        """
+        Compile the points into the AppId table and observe only the messages
+        that have limits
+        """
+        limit_table = {}
+        for point in points:
+            limit_table.setdefault(point.app_id, []).append(point)
+        with self.lock:
+            for app_id in self.limit_table:
+                if app_id not in limit_table:
+                    self.tlm_server.remove_msg_observer(self.tlm_server.tlm_messages[app_id], self)
+            for app_id in limit_table:
+                if app_id not in self.limit_table:
+                    self.tlm_server.add_msg_observer(self.tlm_server.tlm_messages[app_id], self)
+            self.limit_table = {app_id: tuple(app_points) for app_id, app_points in limit_table.items()}
+            self.points = points
+
+    def update(self, tlm_msg: TelemetryMessage) -> None:
+        """
+        Receive telemetry updates. Runs in the telemetry server thread.
+        """
+        self.check_payload(tlm_msg.app_id, tlm_msg.payload())
+
+    def check_payload(self, app_id, payload):
+        points = self.limit_table.get(app_id)
+        if points is None:
+            return
+        rx_time = time.monotonic()
+        with self.lock:
+            for point in points:
+                new_state = point.check(payload, rx_time)
+                if new_state is not None:
+                    self.send_event(point, new_state)
+
+    def check_stale(self):
+        """
+        Declare points stale that haven't been received within their timeout
+        """
+        now = time.monotonic()
+        with self.lock:
+            for point in self.points:
+                if point.stale_timeout is not None and point.last_rx_time is not None and point.state != LIMIT_STALE:
+                    if (now - point.last_rx_time) > point.stale_timeout:
+                        point.state = LIMIT_STALE
+                        point.pending_state = None
+                        point.pending_cnt   = 0
+                        self.send_event(point, LIMIT_STALE)
+
+    def send_event(self, point, new_state):
+        if new_state == LIMIT_NOMINAL:
+            event_text = f'Limit cleared: {point.name()} = {point.value}'
+        elif new_state == LIMIT_STALE:
+            event_text = f'Limit STALE: {point.name()} not received for {point.stale_timeout} seconds'
+        elif new_state == LIMIT_INVALID:
+            event_text = f'Limit INVALID: {point.name()} value could not be checked'
+        else:
+            event_text = f'Limit {new_state}: {point.name()} = {point.value} ({point.limit_str()})'
+        self.event_cnt += 1
+        self.event_queue.put_nowait(event_text)
+
+    def get_states(self):
+        """
+        Return a list of (name, state, value) for all of the points
+        """
+        with self.lock:
+            return [(point.name(), point.state, point.value) for point in self.points]
+
+
+###############################################################################
+
+def benchmark(limit_cnt=1000, packet_cnt=100000, app_id_cnt=50):
+    """
+    Measure the per-packet limit checking overhead using dictionary payloads.
+    The payload accessors index dictionaries the same way they index EDS
+    containers so the engine's overhead is measured without EDS decoding.
+    """
+    import queue
+
+    class BenchmarkServer():
+        def __init__(self):
+            self.tlm_messages = {app_id: None for app_id in range(app_id_cnt)}
+        def add_msg_observer(self, tlm_msg, observer):
+            pass
+        def remove_msg_observer(self, tlm_msg, observer):
+            pass
+
+    limits = TelemetryLimits(BenchmarkServer(), queue.Queue())
+    points = []
+    for i in range(limit_cnt):
+        limit_def = {'topic': f'APP_{i%app_id_cnt}/Application/HK_TLM', 'element': f'Counter{i//app_id_cnt}',
+                     'yellow-high': 80, 'red-high': 90, 'hysteresis': 2, 'debounce': 2}
+        points.append(LimitPoint(limit_def, i%app_id_cnt))
+    limits.set_points(points)
+
+    payloads = []
+    for app_id in range(app_id_cnt):
+        payload = {f'Counter{j}': 0 for j in range((limit_cnt + app_id_cnt - 1)//app_id_cnt)}
+        payloads.append(payload)
+
+    start = time.perf_counter()
+    for i in range(packet_cnt):
+        app_id  = i % app_id_cnt
+        payload = payloads[app_id]
+        for element in payload:
+            payload[element] = (i//app_id_cnt) % 100
+        limits.check_payload(app_id, payload)
+    elapsed = time.perf_counter() - start
+
+    # Time the payload updates alone so they can be subtracted
+    start = time.perf_counter()
+    for i in range(packet_cnt):
+        payload = payloads[i % app_id_cnt]
+        for element in payload:
+            payload[element] = (i//app_id_cnt) % 100
+    baseline = time.perf_counter() - start
+
+    per_packet = (elapsed - baseline)/packet_cnt
+    print(f'{limit_cnt} limits on {app_id_cnt} AppIds, {packet_cnt} packets, {limits.event_cnt} events')
+    print(f'Limit checking overhead: {1e6*per_packet:.2f} us/packet, {1e6*per_packet*app_id_cnt/limit_cnt:.3f} us/limit')
+
+
+###############################################################################
+
+if __name__ == '__main__':
+
+    limit_cnt  = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    packet_cnt = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    benchmark(limit_cnt, packet_cnt)
+
@@ -0,0 +1,225 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Account for telemetry lost between the cFS and the ground system
+
+    Notes:
+      1. Packets can be lost in three places and each has its own counter:
+           Link   - CCSDS sequence counter gaps seen by LinkMonitor
+           Kernel - UDP receive buffer overflows reported by the OS
+           Queue  - BoundedQueue drops when a consumer can't keep up
+         Comparing them separates a slow router or GUI from real UDP loss.
+      2. LinkMonitor only reads the CCSDS primary header so it doesn't need
+         the EDS database and can run in the router thread before packets are
+         queued. Each AppId's 14 bit sequence counter is compared with the
+         next expected value:
+           - A forward gap of less than half the counter range is counted as
+             lost packets
+           - A repeated counter is a duplicate
+           - A counter up to REORDER_WINDOW behind is out of order and fills
+             one of the gaps previously counted as lost
+           - A larger backward jump is a resync, typically a cFS restart
+      3. Kernel drops are read from /proc/net/udp so they're only available
+         on Linux. None is returned when they can't be read.
+      4. SO_RCVBUF is a request. The kernel may double it or limit it to
+         net.core.rmem_max so set_rcvbuf() returns the size actually granted.
+"""
+
+import os
+import socket
+import threading
+from queue import Queue
+
+import logging
+logger = logging.getLogger(__name__)
+
+CCSDS_APID_MASK  = 0x07FF
+CCSDS_IDLE_APID  = 0x07FF
+CCSDS_SEQ_MASK   = 0x3FFF
+CCSDS_SEQ_MODULO = 0x4000
+
+PROC_NET_UDP = '/proc/net/udp'
+
+
+def set_rcvbuf(sock, rcvbuf_size):
+    """
+    Request a socket receive buffer size in bytes. Zero keeps the OS default.
+    Returns the size reported by the kernel.
+    """
+    if rcvbuf_size > 0:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf_size)
+        except OSError as e:
+            logger.error(f'Error setting socket receive buffer size to {rcvbuf_size}: {e}')
+    actual_size = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    if rcvbuf_size > 0:
+        logger.info(f'Socket {sock.getsockname()} receive buffer requested {rcvbuf_size}, granted {actual_size} bytes')
+    return actual_size
+
+
+def udp_socket_drops(sock):
+    """
+    Return the number of datagrams the kernel dropped because the socket's
+    receive buffer was full or None if it isn't available
+    """
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+        with open(PROC_NET_UDP) as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 13 and fields[9] == inode:
+                    return int(fields[12])
+    except (OSError, ValueError, StopIteration):
+        pass
+    return None
+
+
+###############################################################################
+
+class BoundedQueue(Queue):
+    """
+    Queue with an optional bound whose put() never blocks. When the queue is
+    full the policy selects which item is discarded:
+      DROP_OLDEST - Discard the oldest queued item, used for telemetry where
+                    the most recent data matters
+      DROP_NEWEST - Discard the new item, used for commands so queued commands
+                    are sent in order
+    maxsize <= 0 is unbounded and only tracks the high water mark.
+    """
+    DROP_OLDEST = 'drop-oldest'
+    DROP_NEWEST = 'drop-newest'
+
+    def __init__(self, maxsize=0, policy=DROP_OLDEST, name='queue'):
+        if policy not in (self.DROP_OLDEST, self.DROP_NEWEST):
+            raise ValueError(f"Invalid {name} drop policy '{policy}', must be '{self.DROP_OLDEST}' or '{self.DROP_NEWEST}'")
+        super().__init__(maxsize)
+        self.policy = policy
+        self.name   = name
+        self.drop_cnt   = 0
+        self.high_water = 0
+
+    def put(self, item, block=True, timeout=None):
+        """
+        block and timeout are accepted for compatibility with Queue and are
+        ignored. Returns False if an item was dropped.
+        """
+        with self.not_full:
+            dropped = False
+            if 0 < self.maxsize <= self._qsize():
+                if self.drop_cnt == 0:
+                    logger.warning(f'{self.name} is full with {self.maxsize} items, applying {self.policy} policy')
+                self.drop_cnt += 1
+                dropped = True
+                if self.policy == self.DROP_NEWEST:
+                    return False
+                self._get()
+                self.unfinished_tasks -= 1  # The dropped item will never be marked done
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.high_water = max(self.high_water, self._qsize())
+            self.not_empty.notify()
+        return not dropped
+
+    def get_stats(self):
+        with self.mutex:
+            return {'size': self._qsize(), 'max-size': self.maxsize, 'high-water': self.high_water, 'drop-cnt': self.drop_cnt}
+
+
+###############################################################################
+
+class AppIdLink():
+    """
+    Sequence counter state and counters of one AppId
+    """
+    __slots__ = ('seq', 'rx_cnt', 'lost_cnt', 'dup_cnt', 'reorder_cnt', 'resync_cnt')
+
+    def __init__(self, seq):
+        self.seq         = seq  # Most recent in order sequence counter
+        self.rx_cnt      = 1
+        self.lost_cnt    = 0
+        self.dup_cnt     = 0
+        self.reorder_cnt = 0
+        self.resync_cnt  = 0
+
+    def get_stats(self):
+        return {'rx-cnt': self.rx_cnt, 'lost-cnt': self.lost_cnt, 'dup-cnt': self.dup_cnt,
+                'reorder-cnt': self.reorder_cnt, 'resync-cnt': self.resync_cnt}
+
+
+class LinkMonitor():
+    """
+    Count CCSDS sequence counter gaps per AppId. update() is called with
+    every received telemetry datagram and the counters can be read from any
+    thread.
+    """
+    REORDER_WINDOW = 64
+    COUNTERS = ('rx-cnt', 'lost-cnt', 'dup-cnt', 'reorder-cnt', 'resync-cnt')
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.app_ids = {}  # app_id: AppIdLink
+        self.short_cnt = 0
+
+    def update(self, datagram):
+        if len(datagram) < 6:
+            self.short_cnt += 1
+            return
+        app_id = ((datagram[0] << 8) | datagram[1]) & CCSDS_APID_MASK
+        if app_id == CCSDS_IDLE_APID:
+            return
+        seq = ((datagram[2] << 8) | datagram[3]) & CCSDS_SEQ_MASK
+        with self.lock:
+            link = self.app_ids.get(app_id)
+            if link is None:
+                self.app_ids[app_id] = AppIdLink(seq)
+                return
+            link.rx_cnt += 1
+            gap = (seq - link.seq - 1) & CCSDS_SEQ_MASK
+            if gap == 0:
+                link.seq = seq
+            elif gap < CCSDS_SEQ_MODULO//2:
+                link.lost_cnt += gap
+                link.seq = seq
+            elif seq == link.seq:
+                link.dup_cnt += 1
+            elif CCSDS_SEQ_MODULO - gap <= self.REORDER_WINDOW:
+                link.reorder_cnt += 1
+                if link.lost_cnt > 0:
+                    link.lost_cnt -= 1
+            else:
+                link.resync_cnt += 1
+                link.seq = seq
+
+    def get_stats(self):
+        """
+        Return {app_id: counter dictionary}
+        """
+        with self.lock:
+            return {app_id: link.get_stats() for app_id, link in self.app_ids.items()}
+
+    def get_totals(self):
+        totals = dict.fromkeys(self.COUNTERS, 0)
+        for stats in self.get_stats().values():
+            for counter in self.COUNTERS:
+                totals[counter] += stats[counter]
+        return totals
+
+    def reset(self):
+        with self.lock:
+            self.app_ids = {}
+            self.short_cnt = 0
+
@@ -0,0 +1,235 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Display telemetry pages defined in JSON page definition files
+
+    Notes:
+      1. A page selects points from any number of telemetry topics. Each
+         point has a label, a dotted payload element path and optional
+         units, format, limits and state colors. State color keys may be
+         a value's text or its number. For example:
+           {
+             "title": "cFE Status",
+             "refresh-rate": 2,
+             "columns": 1,
+             "points": [
+               {"label": "ES Cmd Cnt", "topic": "CFE_ES/Application/HK_TLM", "element": "CommandCounter"},
+               {"label": "MET", "topic": "CFE_TIME/Application/HK_TLM", "element": "SecondsMET",
+                "units": "sec", "format": "{:d}"},
+               {"label": "Temp", "topic": "APP_C_DEMO/Application/STATUS_TLM", "element": "DeviceData",
+                "format": "{:.1f}", "limits": {"red-low": 0, "yellow-low": 1, "yellow-high": 4, "red-high": 5}},
+               {"label": "Clock", "topic": "CFE_TIME/Application/HK_TLM", "element": "ClockStateAPI",
+                "colors": {"VALID": "green", "FLYWHEEL": "dark orange", "INVALID": "red"}}
+             ]
+           }
+      2. Pages are compiled when loaded. Topics are resolved to AppIds and
+         element paths to accessor functions so rendering never searches the
+         EDS objects by name.
+      3. The page's subscription set is the AppIds of its topics. TlmViewer
+         limits the telemetry server's decoding to the union of its views'
+         subscriptions so packets no page needs are not decoded.
+"""
+
+import sys
+import time
+import os
+import json
+import threading
+
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
+    sys.path.append('..')
+    from telemetry  import TelemetryMessage, TelemetrySocketServer
+    from tlmhistory import compile_accessor
+else:
+    from .telemetry  import TelemetryMessage, TelemetrySocketServer
+    from .tlmhistory import compile_accessor
+import FreeSimpleGUI as sg
+
+
+###############################################################################
+
+class PagePoint():
+    """
+    A compiled page point
+    """
+    DEFAULT_COLOR = 'black'
+    LIMIT_COLORS  = {'red': 'red', 'yellow': 'dark orange', 'green': 'green'}
+
+    def __init__(self, point_def, app_id, key):
+        self.label    = point_def['label']
+        self.topic    = point_def['topic']
+        self.element  = point_def['element']
+        self.units    = point_def.get('units', '')
+        self.format   = point_def.get('format', '{}')
+        self.limits   = point_def.get('limits', None)
+        self.colors   = point_def.get('colors', {})
+        self.app_id   = app_id
+        self.key      = key
+        self.accessor = compile_accessor(self.element)
+        self.text  = None
+        self.color = None
+
+    def evaluate(self, payload):
+        """
+        Return (text, color) for the point's current value
+        """
+        try:
+            raw_value = self.accessor(payload)
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return ('?', self.DEFAULT_COLOR)
+        raw_text = str(raw_value)
+        number = None
+        try:
+            number = float(raw_value)
+            if number.is_integer():
+                number = int(number)
+        except (TypeError, ValueError):
+            pass
+        try:
+            text = self.format.format(raw_text if number is None else number)
+        except (ValueError, TypeError):
+            text = raw_text
+        return (text, self.get_color(raw_text, number))
+
+    def get_color(self, raw_text, number):
+        if raw_text in self.colors:
+            return self.colors[raw_text]
+        if number is not None and str(number) in self.colors:
+            return self.colors[str(number)]
+        if self.limits is not None and number is not None:
+            if number <= self.limits.get('red-low', float('-inf')) or number >= self.limits.get('red-high', float('inf')):
+                return self.LIMIT_COLORS['red']
+            if number <= self.limits.get('yellow-low', float('-inf')) or number >= self.limits.get('yellow-high', float('inf')):
+                return self.LIMIT_COLORS['yellow']
+            return self.LIMIT_COLORS['green']
+        return self.DEFAULT_COLOR
+
+
+###############################################################################
+
+class TlmPage():
+    """
+    Compiled page definition. Points whose topics aren't defined are reported
+    and skipped.
+    """
+    def __init__(self, page_file, tlm_server: TelemetrySocketServer):
+        self.page_file = page_file
+        with open(page_file) as f:
+            page_def = json.load(f)
+
+        self.title   = page_def.get('title', os.path.basename(page_file))
+        self.refresh_rate = page_def.get('refresh-rate', 2)
+        self.columns = max(1, page_def.get('columns', 1))
+        self.points  = []
+        self.app_id_points = {}  # app_id: [PagePoint]
+        self.tlm_msgs = {}       # app_id: TelemetryMessage
+        self.errors   = []
+
+        for i, point_def in enumerate(page_def.get('points', [])):
+            try:
+                tlm_msg = tlm_server.get_tlm_msg_from_topic(point_def['topic'])
+                if tlm_msg is None:
+                    self.errors.append(f"Point {i} topic {point_def['topic']} is not defined")
+                    continue
+                point = PagePoint(point_def, tlm_msg.app_id, f'-POINT_{i}-')
+            except (KeyError, IndexError, ValueError) as e:
+                self.errors.append(f'Point {i} definition error: {e}')
+                continue
+            self.points.append(point)
+            self.app_id_points.setdefault(tlm_msg.app_id, []).append(point)
+            self.tlm_msgs[tlm_msg.app_id] = tlm_msg
+
+    def subscription(self):
+        return set(self.app_id_points.keys())
+
+
+###############################################################################
+
+class TlmPageView():
+    """
+    Window that displays a TlmPage. The view interface is the same as
+    TlmScreenView so pages can be hosted by TlmViewer.
+    """
+    NULL_STR = '--'
+
+    def __init__(self, tlm_server: TelemetrySocketServer):
+
+        self.tlm_server = tlm_server
+        self.page   = None
+        self.window = None
+
+        self.lock = threading.Lock()
+        self.payloads = {}       # app_id: latest payload not yet displayed
+        self.last_refresh = 0.0
+
+    def create_window(self):
+        label_font = ('Arial bold',12)
+        value_font = ('Courier',12)
+        sg.theme('LightGreen')
+        label_len = max([len(point.label) for point in self.page.points], default=10)
+        point_rows = [[sg.Text(point.label, font=label_font, size=(label_len,1)),
+                       sg.Text(self.NULL_STR, font=value_font, size=(16,1), key=point.key),
+                       sg.Text(point.units, font=value_font, size=(8,1))] for point in self.page.points]
+        rows_per_col = (len(point_rows) + self.page.columns - 1)//self.page.columns
+        columns = [sg.Column(point_rows[i:i+rows_per_col], vertical_alignment='top') for i in range(0, len(point_rows), max(1, rows_per_col))]
+        layout = [columns,
+                  [sg.Button('Close')]]
+        return sg.Window(self.page.title, layout, resizable=True, grab_anywhere=True, finalize=True)
+
+    def open(self, page_file):
+        self.page = TlmPage(page_file, self.tlm_server)
+        for error in self.page.errors:
+            print(f'TlmPageView {page_file}: {error}')
+        self.window = self.create_window()
+        return self.window
+
+    def get_tlm_msgs(self):
+        return list(self.page.tlm_msgs.values())
+
+    def update(self, tlm_msg: TelemetryMessage):
+        """
+        Called from the telemetry thread. Only the payload reference is saved.
+        """
+        if tlm_msg.app_id in self.page.app_id_points:
+            with self.lock:
+                self.payloads[tlm_msg.app_id] = tlm_msg.eds_obj.Payload
+
+    def handle_event(self, event, values):
+        return event not in (sg.WIN_CLOSED, 'Close', None)
+
+    def refresh(self):
+        """
+        Evaluate the points of the messages received since the last refresh and
+        update the value elements that changed
+        """
+        if (time.monotonic() - self.last_refresh) < 1.0/self.page.refresh_rate:
+            return
+        self.last_refresh = time.monotonic()
+        with self.lock:
+            payloads = self.payloads
+            self.payloads = {}
+        for app_id, payload in payloads.items():
+            for point in self.page.app_id_points[app_id]:
+                text, color = point.evaluate(payload)
+                if text != point.text or color != point.color:
+                    self.window[point.key].update(text, text_color=color)
+                    point.text  = text
+                    point.color = color
+
+    def close(self):
+        if self.window is not None:
+            self.window.close()
+            self.window = None
+
@@ -13,12 +13,23 @@
     GNU Affero General Public License for more details.
 
     Purpose:
-      Plot a single telemetry data item in a linear plot
-      
+      Plot one or more telemetry data items in a linear time plot
+
     Notes:
-      1. This is a simple single integer plot utility that only supports
-         linear time plots. If more sophisticated plotting becomess
-         necessary then a package such as matplot will be used.      
+      1. Each series is stored in a NumPy ring buffer so appending a sample
+         is O(1) regardless of the buffer depth.
+      2. The x-axis is the spacecraft time from the CCSDS secondary header.
+         Spacecraft time goes backward when the cFS restarts or its time is
+         reset so a sample older than its series' last sample starts a new
+         segment: the view's series are cleared because they share the
+         x-axis. Each series' times are always increasing.
+      3. The telemetry thread only appends samples. Drawing is performed by
+         the GUI thread at a fixed frame rate and only when new data has
+         arrived. Each series is decimated to the canvas pixel width using
+         min/max pairs so spikes are preserved and the number of line
+         points drawn is independent of the buffer depth.
+      4. If more sophisticated plotting becomes necessary then a package such
+         as matplotlib will be used.
 """
 
 import sys
@@ -26,70 +37,128 @@ import time
 import os
 import socket
 import configparser
-import io
-import math
-from contextlib import redirect_stdout
+import threading
 import numpy as np
 
-if __name__ == '__main__':
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
     sys.path.append('..')
     from cfeconstants  import Cfe
-    from telecommand   import TelecommandScript
     from telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
-    from cmdtlmprocess import CmdTlmProcess
+    from tlmhistory    import parse_element_path, get_element_value
 else:
     from .cfeconstants  import Cfe
-    from .telecommand   import TelecommandScript
     from .telemetry     import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
-    from .cmdtlmprocess import CmdTlmProcess
-from tools import crc_32c, compress_abs_path, TextEditor
+    from .tlmhistory    import parse_element_path, get_element_value
 import FreeSimpleGUI as sg
 
-CCSDS   = 0
-TIME    = 1
-PAYLOAD = 2
 
 ###############################################################################
 
-class TelemetryCurrentValue(TelemetryObserver):
+class RingBuffer():
     """
-    callback_functions
-       [app_name] : {packet: [item list]} 
-    
+    Fixed depth circular buffer of (time, value) samples
     """
+    def __init__(self, depth):
+        self.depth = depth
+        self.time  = np.zeros(depth, dtype=np.float64)
+        self.value = np.zeros(depth, dtype=np.float64)
+        self.head  = 0   # Next write index
+        self.count = 0
+
+    def append(self, sample_time, value):
+        self.time[self.head]  = sample_time
+        self.value[self.head] = value
+        self.head = (self.head + 1) % self.depth
+        if self.count < self.depth:
+            self.count += 1
+
+    def extend(self, sample_times, values):
+        """
+        Append arrays of samples, for example from a telemetry history. Only
+        the samples after the last backward time step are used.
+        """
+        sample_times = np.asarray(sample_times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        backward = np.flatnonzero(np.diff(sample_times) < 0)
+        start = backward[-1] + 1 if len(backward) > 0 else 0
+        start = max(start, len(sample_times) - self.depth)
+        sample_times, values = sample_times[start:], values[start:]
+        for sample_time, value in zip(sample_times, values):
+            self.append(sample_time, value)
+
+    def clear(self):
+        self.head  = 0
+        self.count = 0
+
+    def last_time(self):
+        return self.time[self.head-1] if self.count > 0 else None
+
+    def get(self):
+        """
+        Return copies of the samples in time order
+        """
+        if self.count < self.depth:
+            return self.time[:self.count].copy(), self.value[:self.count].copy()
+        return np.roll(self.time, -self.head), np.roll(self.value, -self.head)
+
+
+###############################################################################
 
-    def __init__(self, tlm_server: TelemetrySocketServer, data_callback): 
+def decimate_min_max(x, y, x_min, x_max, width):
+    """
+    Reduce the samples to at most two points per pixel column: the column's
+    minimum and maximum values. x must be sorted.
+    """
+    if len(x) <= 2*width or x_max <= x_min:
+        return x, y
+    column = ((x - x_min) * ((width - 1)/(x_max - x_min))).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], column[1:] != column[:-1])))
+    dec_x = np.repeat(x[starts], 2)
+    dec_y = np.empty(2*len(starts))
+    dec_y[0::2] = np.minimum.reduceat(y, starts)
+    dec_y[1::2] = np.maximum.reduceat(y, starts)
+    return dec_x, dec_y
+
+
+###############################################################################
+
+class PlotSeries():
+    """
+    A telemetry point plotted as a line. element may be a dotted payload path
+    such as 'Imu.Rate[0]'.
+    """
+    DEFAULT_DEPTH = 20000
+
+    def __init__(self, tlm_topic, tlm_element, color, depth=DEFAULT_DEPTH):
+        self.tlm_topic   = tlm_topic
+        self.tlm_element = tlm_element
+        self.color  = color
+        self.buffer = RingBuffer(depth)
+        self.path   = parse_element_path(tlm_element)
+
+    def label(self):
+        return self.tlm_topic.split('/')[0] + '/' + self.tlm_element
+
+    def get_value(self, payload):
+        return get_element_value(payload, self.path)
+
+
+###############################################################################
+
+class TelemetryPlotObserver(TelemetryObserver):
+    """
+    Only observe the messages that contain plotted series
+    """
+
+    def __init__(self, tlm_server: TelemetrySocketServer, tlm_msgs, data_callback):
         super().__init__(tlm_server)
 
         self.data_callback = data_callback
-        
-        for msg in self.tlm_server.tlm_messages:
-            tlm_msg = self.tlm_server.tlm_messages[msg]
-            self.tlm_server.add_msg_observer(tlm_msg, self)        
-            print("TelemetryCurrentValue adding observer for %s: %s" % (tlm_msg.app_name, tlm_msg.msg_name))
-        
-        """
-        # Debug to help determine how to structure current value data       
-        topics = self.tlm_server.get_topics()
-        for topic in topics:
-            #if topic != self.tlm_server.eds_mission.TOPIC_TLM_TITLE_KEY:
-            if 'APP_C_DEMO' in topic:
-                print('***********topic: ' + str(topic))
-                eds_id = self.tlm_server.eds_mission.get_eds_id_from_topic(topic)
-                tlm_entry = self.tlm_server.eds_mission.get_database_entry(eds_id)
-                tlm_obj = tlm_entry()
-                print('***********tlm_entry = ' + str(tlm_obj))
-                print('>>>> CCSDS: = ')
-                for entry in tlm_obj.CCSDS:
-                    print(str(entry))
-                print('>>>> Sec: = ')
-                for entry in tlm_obj.Sec:
-                    print(str(entry))
-                print('>>>> Payload: = ')
-                for entry in tlm_obj.Payload:
-                    print(str(entry))
-        """
-        
+
+        for tlm_msg in tlm_msgs:
+            self.tlm_server.add_msg_observer(tlm_msg, self)
+            print("TelemetryPlotObserver adding observer for %s: %s" % (tlm_msg.app_name, tlm_msg.msg_name))
+
     def update(self, tlm_msg: TelemetryMessage) -> None:
         """
         Receive telemetry updates
@@ -99,145 +168,244 @@ class TelemetryCurrentValue(TelemetryObserver):
 
 ###############################################################################
 
-class TlmPlot():
+class TlmPlotView():
     """
-    Manage a linear plot that can plot up to self.plot_x_range data points. The
-    update rate depends upon the telemetry point that is being plotted so the
-    x-axis doesn't have a time scale, it is simple a data sample count.
-    
-    The y-axis is scaled based upon the data min/max values and the number of
-    points on the gragh.
-    
-    self.tlm_server.get_tlm_val(app_name, tlm_msg_name, parameter)
-        Example current value usage: get_tlm_val("CFE_ES", "HK_TLM", "Sequence")
+    Manage a linear time plot of one or more telemetry series. The x-axis
+    spans the most recent time_span seconds of spacecraft time. The y-axis
+    uses the min/max values if they differ otherwise it autoscales to the
+    visible data.
+
+    Samples are appended by the telemetry thread under self.lock and the
+    GUI thread redraws at most FRAME_RATE times per second when self.dirty
+    is set.
+
+    The view doesn't own a telemetry server so multiple views can share one,
+    see TlmViewer. The owner must route updates for get_tlm_msgs() to
+    update_plot() and call handle_event() and refresh() from the GUI thread.
     """
-    def __init__(self, mission_name, gnd_ip_addr, router_ctrl_port, plot_tlm_port, plot_tlm_timeout, min_value, max_value):
+    FRAME_RATE  = 10   # Redraws per second
+    CANVAS_SIZE = (800, 500)
+    MARGIN_LEFT, MARGIN_BOTTOM, MARGIN_TOP, MARGIN_RIGHT = 70, 40, 20, 20
+    TIME_SPANS  = (10, 30, 60, 300, 600, 3600)  # Seconds
+    COLORS      = ('#1f77b4', '#d62728', '#2ca02c', '#ff7f0e', '#9467bd', '#8c564b', '#e377c2', '#17becf')
+    TICK_CNT    = 5
 
-        self.tlm_server = TelemetrySocketServer(mission_name, 'cpu1', gnd_ip_addr, router_ctrl_port, plot_tlm_port, plot_tlm_timeout)
+    def __init__(self, tlm_server: TelemetrySocketServer, min_value, max_value, depth=PlotSeries.DEFAULT_DEPTH, tlm_history=None):
 
-        self.app_name    = ''
-        self.tlm_topic   = ''
-        self.tlm_payload = ''
-        self.tlm_element = ''
+        self.tlm_server  = tlm_server
+        self.tlm_history = tlm_history  # Optional TelemetryHistory used to pre-fill series
 
-        self.plot_x_range = 100
-        self.plot_y_range = 100
-      
-        self.data_points  = 40
-        self.data_max_idx = self.data_points-1
+        self.depth  = depth
+        self.series = []
+        self.app_id_series = {}  # app_id: [PlotSeries]
 
         self.data_min_value = min_value
         self.data_max_value = max_value
-        self.data_range     = max_value - min_value
-        
-        self.y_data = np.zeros(self.data_points)
-        self.linear_space = np.linspace(self.data_min_value, self.data_max_value, num=self.data_points, dtype=int)
-
-        # Create 5 tick marks per axis
-        self.x_tick_step       = int(self.plot_x_range/5)
-        self.x_tick_step_value = int(self.data_points/5)
-        self.x_scale_factor    = self.plot_x_range/self.data_points
-        self.y_tick_step       = int(self.plot_y_range/5)
-        self.y_tick_step_value = self.data_range/5.0
-        self.y_scale_factor    = self.plot_y_range/self.data_range
+        self.time_span = 60
+
+        self.plot_width  = self.CANVAS_SIZE[0] - self.MARGIN_LEFT - self.MARGIN_RIGHT
+        self.plot_height = self.CANVAS_SIZE[1] - self.MARGIN_BOTTOM - self.MARGIN_TOP
+
+        self.lock   = threading.Lock()
+        self.dirty  = False
+        self.paused = False
+        self.last_draw = 0.0
+
+    def add_series(self, tlm_topic, tlm_element):
+        """
+        Series must be added before open() is called
+        """
+        tlm_msg = self.tlm_server.get_tlm_msg_from_topic(tlm_topic)
+        if tlm_msg is None:
+            print(f'TlmPlot ignoring unknown telemetry topic {tlm_topic}')
+            return None
+        series = PlotSeries(tlm_topic, tlm_element, self.COLORS[len(self.series) % len(self.COLORS)], self.depth)
+        if self.tlm_history is not None:
+            if self.tlm_history.has_point(tlm_topic, tlm_element):
+                series.buffer.extend(*self.tlm_history.get_samples(tlm_topic, tlm_element, max(self.TIME_SPANS)))
+            else:
+                self.tlm_history.add_point(tlm_topic, tlm_element)
+        self.series.append(series)
+        self.app_id_series.setdefault(tlm_msg.app_id, []).append(series)
+        return series
 
     def create_window(self, title):
         """
         """
         sg.theme('LightGreen')
-        layout = [[sg.Graph(canvas_size=(600, 600),
-                   graph_bottom_left=(-20, -20),
-                   graph_top_right=(110, 110),
-                   key='graph')]]
+        legend = [sg.Text('■ ' + series.label(), text_color=series.color, font=('Arial', 11)) for series in self.series]
+        layout = [[sg.Graph(canvas_size=self.CANVAS_SIZE, graph_bottom_left=(0, 0), graph_top_right=self.CANVAS_SIZE,
+                            background_color='white', key='graph')],
+                  legend,
+                  [sg.Text('Time Span (s)'), sg.Combo(self.TIME_SPANS, default_value=self.time_span, readonly=True, enable_events=True, key='-TIME_SPAN-'),
+                   sg.Button('Pause'), sg.Button('Resume'), sg.Button('Clear'), sg.Button('Exit')]]
 
         self.window = sg.Window(title, layout, grab_anywhere=True, finalize=True)
         self.graph = self.window['graph']
-        self.draw_axes()
         self.draw_plot()
 
-    def draw_axes(self):
-        self.graph.DrawLine((0, 0), (self.plot_x_range, 0))
-        self.graph.DrawLine((0, 0), (0, self.plot_y_range))
-        
-        i = 1
-        for x in range(0, self.plot_x_range+1, self.x_tick_step):
-            self.graph.DrawLine((x, -3), (x, 3))
-            if x != 0:
-                text = self.x_tick_step_value * i
-                self.graph.DrawText(text, (x, -10), color='black')
-                i += 1
-        i=1
-        for y in range(0, self.plot_y_range+1, self.y_tick_step):
-            print('y=',y)
-            self.graph.DrawLine((-3, y), (3, y))
-            if y != 0:
-                text = "{:5.1f} ".format(self.y_tick_step_value * i)
-                self.graph.DrawText(text, (-10, y), color='black')
-                i += 1
+    def plot_x(self, t, t_start):
+        return self.MARGIN_LEFT + (t - t_start)*(self.plot_width/self.time_span)
+
+    def plot_y(self, value, y_min, y_max):
+        return self.MARGIN_BOTTOM + (value - y_min)*(self.plot_height/(y_max - y_min))
+
+    def draw_axes(self, t_start, y_min, y_max):
+        x0, y0 = self.MARGIN_LEFT, self.MARGIN_BOTTOM
+        x1, y1 = x0 + self.plot_width, y0 + self.plot_height
+        self.graph.draw_line((x0, y0), (x1, y0))
+        self.graph.draw_line((x0, y0), (x0, y1))
+        for i in range(self.TICK_CNT+1):
+            x = x0 + i*self.plot_width/self.TICK_CNT
+            self.graph.draw_line((x, y0-3), (x, y0+3))
+            self.graph.draw_text(f'{t_start + i*self.time_span/self.TICK_CNT:.1f}', (x, y0-15), color='black', font=('Arial', 9))
+            y = y0 + i*self.plot_height/self.TICK_CNT
+            self.graph.draw_line((x0-3, y), (x0+3, y))
+            self.graph.draw_text(f'{y_min + i*(y_max-y_min)/self.TICK_CNT:.4g}', (x0-30, y), color='black', font=('Arial', 9))
 
     def draw_plot(self):
-        prev_x = prev_y = None
-        for i, x_coord in enumerate(self.linear_space):
-            x_coord = int(i * self.x_scale_factor)
-            y_coord = int(self.y_data[i] * self.y_scale_factor)
-            if prev_x is not None:
-                self.graph.draw_line((prev_x, prev_y), (x_coord, y_coord),
-                                     color='#595959', width=1.8)
-            prev_x, prev_y = x_coord, y_coord
-
-    def add_data(self, data):
-        data = int(data)
-        if data < self.data_min_value:
-            data = self.data_min_value
-        elif data > self.data_max_value:
-            data = self.data_max_value
-        self.y_data[0:self.data_max_idx] = self.y_data[1:self.data_points]
-        self.y_data[self.data_max_idx]   = data
-        
+        """
+        Called from the GUI thread. The series snapshots are taken under the
+        lock and the drawing is done after it's released.
+        """
+        with self.lock:
+            snapshots = [(series, *series.buffer.get()) for series in self.series]
+            self.dirty = False
+        t_end = max([t[-1] for series, t, y in snapshots if len(t) > 0], default=0.0)
+        t_start = t_end - self.time_span
+
+        visible = []
+        for series, t, y in snapshots:
+            i = np.searchsorted(t, t_start)
+            visible.append((series, t[i:], y[i:]))
+
+        if self.data_max_value > self.data_min_value:
+            y_min, y_max = self.data_min_value, self.data_max_value
+        else:
+            y_values = [y for series, t, y in visible if len(y) > 0]
+            if len(y_values) > 0:
+                y_min = min([y.min() for y in y_values])
+                y_max = max([y.max() for y in y_values])
+            else:
+                y_min, y_max = 0.0, 1.0
+            if y_max <= y_min:
+                y_min, y_max = y_min - 1.0, y_max + 1.0
+
+        self.graph.erase()
+        self.draw_axes(t_start, y_min, y_max)
+        for series, t, y in visible:
+            if len(t) < 2:
+                continue
+            t, y = decimate_min_max(t, y, t_start, t_end, self.plot_width)
+            x_points = self.plot_x(t, t_start)
+            y_points = self.plot_y(np.clip(y, y_min, y_max), y_min, y_max)
+            self.graph.draw_lines(list(zip(x_points.tolist(), y_points.tolist())), color=series.color, width=1)
+        self.last_draw = time.monotonic()
+
     def update_plot(self, tlm_msg: TelemetryMessage):
-        if tlm_msg.app_name == self.app_name:
-            payload = tlm_msg.payload()
-            #print('payload = ', payload)
-            if self.tlm_payload in str(type(payload)):
-                has_element = False
-                for p in payload:
-                    if self.tlm_element in p[0]:
-                        has_element = True
-                        break
-                if has_element:
-                    data = payload[self.tlm_element]
-                    self.add_data(data)
-                    self.graph.erase()
-                    self.draw_axes()
-                    self.draw_plot()
-
-    def execute(self, app_name, tlm_topic, tlm_payload, tlm_element):
         """
-        The current value observer must be created after the GUI window is created
+        Called from the telemetry thread
         """
-        self.app_name    = app_name
-        self.tlm_topic   = tlm_topic
-        self.tlm_payload = tlm_payload
-        self.tlm_element = tlm_element 
+        series_list = self.app_id_series.get(tlm_msg.app_id)
+        if series_list is None:
+            return
+        sample_time = tlm_msg.sec_hdr_time()
+        payload = tlm_msg.payload()
+        with self.lock:
+            if any(series.buffer.count > 0 and sample_time < series.buffer.last_time() for series in series_list):
+                # Spacecraft time went backward so start a new segment
+                for series in self.series:
+                    series.buffer.clear()
+            for series in series_list:
+                try:
+                    series.buffer.append(sample_time, series.get_value(payload))
+                    self.dirty = True
+                except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+                    pass
+
+    def open(self):
+        """
+        Create the window and return it
+        """
+        self.create_window(', '.join([series.label() for series in self.series]))
+        return self.window
+
+    def get_tlm_msgs(self):
+        return [self.tlm_server.tlm_messages[app_id] for app_id in self.app_id_series]
+
+    def update(self, tlm_msg: TelemetryMessage):
+        self.update_plot(tlm_msg)
+
+    def handle_event(self, event, values):
+        """
+        Process a window event. Returns False when the window should be closed.
+        """
+        if event in (sg.WIN_CLOSED, 'Exit') or event is None:
+            return False
+        elif event == '-TIME_SPAN-':
+            self.time_span = int(values['-TIME_SPAN-'])
+            self.dirty = True
+        elif event == 'Pause':
+            self.paused = True
+        elif event == 'Resume':
+            self.paused = False
+            self.dirty  = True
+        elif event == 'Clear':
+            with self.lock:
+                for series in self.series:
+                    series.buffer.clear()
+            self.dirty = True
+        return True
+
+    def refresh(self):
+        if self.dirty and not self.paused and (time.monotonic() - self.last_draw) >= 1.0/self.FRAME_RATE:
+            self.draw_plot()
+
+    def close(self):
+        self.window.close()
 
-        self.create_window(app_name+'/'+tlm_payload+'/'+tlm_element)
 
-        self.tlm_current_value = TelemetryCurrentValue(self.tlm_server, self.update_plot)
+###############################################################################
+
+class TlmPlot(TlmPlotView):
+    """
+    Plot telemetry series using its own telemetry server
+    """
+    def __init__(self, mission_name, gnd_ip_addr, router_ctrl_port, plot_tlm_port, plot_tlm_timeout, min_value, max_value,
+                 depth=PlotSeries.DEFAULT_DEPTH, tlm_history=None):
+
+        super().__init__(TelemetrySocketServer(mission_name, 'cpu1', gnd_ip_addr, router_ctrl_port, plot_tlm_port, plot_tlm_timeout),
+                         min_value, max_value, depth, tlm_history)
+
+    def execute(self):
+        """
+        The current value observer must be created after the GUI window is created
+        """
+        self.open()
+
+        self.tlm_plot_observer = TelemetryPlotObserver(self.tlm_server, self.get_tlm_msgs(), self.update_plot)
+        self.tlm_server.set_subscription([tlm_msg.app_id for tlm_msg in self.get_tlm_msgs()])
         self.tlm_server.execute()
 
         while True: # Event Loop
-            event, values = self.window.read(timeout=200)
-            if event in (sg.WIN_CLOSED, 'Exit'):
+            event, values = self.window.read(timeout=int(1000/self.FRAME_RATE))
+            if not self.handle_event(event, values):
                 break
-        
-        self.window.close()
+            self.refresh()
+
+        self.close()
         self.tlm_server.shutdown()
 
 
 ###############################################################################
 
 if __name__ == '__main__':
-    
+    """
+    The first series is defined by app topic payload element min max. The
+    payload parameter is retained for compatibility. Additional series can be
+    appended as topic:element pairs. If min equals max the y-axis autoscales.
+    """
+    extra_series = []
     if len(sys.argv) > 1:
         app_name    = sys.argv[1]
         tlm_topic   = sys.argv[2]
@@ -245,6 +413,7 @@ if __name__ == '__main__':
         tlm_element = sys.argv[4]
         min_value   = int(sys.argv[5])
         max_value   = int(sys.argv[6])
+        extra_series = [arg.split(':') for arg in sys.argv[7:]]
     else:
         app_name    = 'APP_C_DEMO'
         tlm_topic   = 'APP_C_DEMO/Application/STATUS_TLM'
@@ -252,7 +421,7 @@ if __name__ == '__main__':
         tlm_element = 'DeviceData'
         min_value   = 0
         max_value   = 6
-    
+
     config = configparser.ConfigParser()
     config.read('../basecamp.ini')
 
@@ -262,5 +431,8 @@ if __name__ == '__main__':
     mission_name     = config.get('CFS_TARGET','MISSION_EDS_NAME')
 
     tlm_plot = TlmPlot(mission_name, cfs_ip_addr, router_ctrl_port, plot_tlm_port, 1.0, min_value, max_value)
-    tlm_plot.execute(app_name, tlm_topic, tlm_payload, tlm_element) 
-    
+    tlm_plot.add_series(tlm_topic, tlm_element)
+    for topic, element in extra_series:
+        tlm_plot.add_series(topic, element)
+    tlm_plot.execute()
+
@@ -19,6 +19,13 @@
       1. The telemetry is displayed in a text box with each row containing
          one data point. The data point labels are extracted from the EDS
          message definition. The screen layout can't be altered.
+      2. The row layout is computed once per message type. Each refresh
+         extracts the row values, compares them with the displayed values
+         and only rewrites the rows that changed.
+      3. The telemetry thread only saves a reference to the latest message.
+         The GUI thread refreshes the display at REFRESH_RATE so bursts of
+         messages are coalesced. While paused messages are counted but not
+         formatted.
                 
 """
 
@@ -28,8 +35,9 @@ import os
 import socket
 import configparser
 import io
+import threading
 
-if __name__ == '__main__':
+if __name__ == '__main__' or 'cfsinterface' in os.getcwd():
     sys.path.append('..')
     from cfeconstants  import Cfe
     from telecommand   import TelecommandScript
@@ -51,15 +59,17 @@ class TelemetryCurrentValue(TelemetryObserver):
     callback_functions
        [app_name] : {packet: [item list]} 
     
+    If tlm_msgs is None all telemetry messages are observed
     """
 
-    def __init__(self, tlm_server: TelemetrySocketServer, data_callback): 
+    def __init__(self, tlm_server: TelemetrySocketServer, data_callback, tlm_msgs=None): 
         super().__init__(tlm_server)
 
         self.data_callback = data_callback
         
-        for msg in self.tlm_server.tlm_messages:
-            tlm_msg = self.tlm_server.tlm_messages[msg]
+        if tlm_msgs is None:
+            tlm_msgs = self.tlm_server.tlm_messages.values()
+        for tlm_msg in tlm_msgs:
             self.tlm_server.add_msg_observer(tlm_msg, self)        
             print("TelemetryCurrentValue adding observer for %s: %s" % (tlm_msg.app_name, tlm_msg.msg_name))
 
@@ -72,25 +82,83 @@ class TelemetryCurrentValue(TelemetryObserver):
 
 ###############################################################################
 
-class TlmScreen():
+class ScreenLayout():
     """
-    Create a screen that displays a single telemetry message
+    Row layout for one telemetry message type. Each row has a label and an
+    accessor path of container names and array indices into the EDS object.
+    Only payload rows are included.
     """
-    def __init__(self, mission_name, gnd_ip_addr, router_ctrl_port, screen_tlm_port, screen_tlm_timeout):
+    def __init__(self, lib_db, eds_obj, base_name):
+        self.lib_db = lib_db
+        self.labels = []
+        self.paths  = []
+        self.add_rows(eds_obj, base_name, [])
+        self.label_len = max([len(label) for label in self.labels], default=0)
+        self.value_col = self.label_len + 2   # Text column where values start
+
+    def add_rows(self, base_object, base_name, path):
+        """
+        Recursive function that iterates over an EDS object and creates the rows
+        """
+        # Array rows
+        if (self.lib_db.IsArray(base_object)):
+            for i in range(len(base_object)):
+                self.add_rows(base_object[i], f"{base_name}[{i}]", path + [i])
+        # Container rows
+        elif (self.lib_db.IsContainer(base_object)):
+            for item in base_object:
+                self.add_rows(item[1], f"{base_name}.{item[0]}", path + [item[0]])
+        # Everything else (number, enumeration, string, etc.)
+        else:
+            if '.Payload.' in base_name:
+                self.labels.append(base_name)
+                self.paths.append(path)
+
+    def get_values(self, eds_obj):
+        values = []
+        for path in self.paths:
+            value = eds_obj
+            for key in path:
+                value = value[key]
+            values.append(str(value))
+        return values
+
+    def format_text(self, values):
+        return '\n'.join([f'{label:<{self.label_len}}: {value}' for label, value in zip(self.labels, values)])
+
+
+###############################################################################
+
+class TlmScreenView():
+    """
+    Window that displays a single telemetry message. The view doesn't own a
+    telemetry server so multiple views can share one, see TlmViewer. The
+    owner must route the message's updates to update() and call
+    handle_event() and refresh() from the GUI thread.
+    """
+    REFRESH_RATE = 4   # Display refreshes per second
 
-        self.tlm_server = TelemetrySocketServer(mission_name, 'cpu1', gnd_ip_addr, router_ctrl_port, screen_tlm_port, screen_tlm_timeout)
+    def __init__(self, tlm_server: TelemetrySocketServer):
+
+        self.tlm_server = tlm_server
 
         self.app_name  = ''
         self.tlm_topic = ''
+        self.tlm_msg   = None
+        self.window    = None
 
         self.NULL_STR = self.tlm_server.eds_mission.NULL_TLM_STR
 
-
-        self.payload_fmt_str = "{:<50}: {}\n"
-        self.payload_str_max_len = 0
-                
+        self.layouts = {}   # eds_entry.Name: ScreenLayout
+        self.layout  = None
+        self.row_values = []
+        self.hdr_values = {}
+        
+        self.lock = threading.Lock()
+        self.current_msg = None
+        self.msg_cnt     = 0    # Messages received since the last refresh
+        self.paused_cnt  = 0    # Messages received while paused
         self.paused = False
-        self.payload_text = None
 
     def create_window(self, title):
         """
@@ -105,115 +173,149 @@ class TlmScreen():
                   [sg.Text('')], 
                   [sg.Text('Payload', font = ('Arial bold',14)), sg.Text('', font=hdr_value_font, key='-PAUSED-', pad=(10,0))],
                   [sg.MLine(default_text='-- No Messages Received --', font = ('Courier',12), enable_events=True, size=(65, 20), key='-PAYLOAD_TEXT-')],
-                  [sg.Button('Pause'), sg.Button('Resume'), sg.Button('Close'), sg.Button('', key='-TLM_UPDATE-', visible=False)]]
+                  [sg.Button('Pause'), sg.Button('Resume'), sg.Button('Close')]]
 
-        window = sg.Window(title, layout, resizable=True, grab_anywhere=True)
+        window = sg.Window(title, layout, resizable=True, grab_anywhere=True, finalize=True)
         
         return window
-        
-    def execute(self, app_name, tlm_topic):
+
+    def open(self, app_name, tlm_topic):
         """
-        The current value observer must be created after the GUI window is created and the
-        first window read is performed 
+        Create the window and return it. Telemetry updates are ignored until
+        the window exists.
         """
         self.app_name  = app_name
         self.tlm_topic = tlm_topic
         self.tlm_msg   = self.tlm_server.get_tlm_msg_from_topic(tlm_topic)
 
-        self.tlm_current_value = TelemetryCurrentValue(self.tlm_server, self.update)
-        self.tlm_server.execute()
         self.window_title = f'{tlm_topic} - Port {self.tlm_server.server_tlm_port}'
-        
         self.window = self.create_window(self.window_title)
+        self.payload_widget = self.window['-PAYLOAD_TEXT-'].Widget
+        return self.window
 
-        while True:  # Event Loop
+    def get_tlm_msgs(self):
+        return [] if self.tlm_msg is None else [self.tlm_msg]
 
-            event, values = self.window.read(timeout=200)
-            
-            if event in (sg.WIN_CLOSED, 'Close') or event is None:       
-                break
-            
-            elif event == 'Pause':
+    def handle_event(self, event, values):
+        """
+        Process a window event. Returns False when the window should be closed.
+        """
+        if event in (sg.WIN_CLOSED, 'Close') or event is None:       
+            return False
+        
+        elif event == 'Pause':
+            with self.lock:
                 self.paused = True
-                self.window['-PAUSED-'].update('Display Paused')
+                self.paused_cnt = 0
+            self.window['-PAUSED-'].update('Display Paused')
 
-            elif event == 'Resume':
+        elif event == 'Resume':
+            with self.lock:
                 self.paused = False
-                self.window['-PAUSED-'].update('')
-
-            elif event == '-TLM_UPDATE-':
-                self.window['-APP_ID-'].update(self.current_msg.pri_hdr().AppId)
-                self.window['-LENGTH-'].update(self.current_msg.pri_hdr().Length)
-                self.window['-SEQ_CNT-'].update(self.current_msg.pri_hdr().Sequence)
-                self.window['-TIME-'].update(str(self.current_msg.sec_hdr().Seconds))
-                self.payload_text = ""
-                self.format_payload_text(self.current_msg.eds_obj, self.current_msg.eds_entry.Name)
-                self.window['-PAYLOAD_TEXT-'].update(self.payload_text)
-     
-        self.tlm_server.shutdown()
-        self.window.close()
+            self.window['-PAUSED-'].update('')
 
-    def update(self, tlm_msg: TelemetryMessage):
-        """
-        Receive telemetry updates. Using window['-TLM_UPDATE-'].click() synchronizes
-        the update with the window read loop. If this method wasn't used, additional
-        logic would be required to make sure the first tlm update is processed after
-        the window read() has executed at least once.
-        
-        self.payload_str_max_len is set here as opposed to the constructor because an
-        initial tlm_msg object does not have its eds_obj and eds_entry attributes set
-        """
-        if tlm_msg.app_name == self.app_name:
-            # Compute max length if it hasn't been done yet
-            if self.payload_str_max_len == 0:
-                #TODO - Resolve why eds_entry is sometimes None 
-                if self.tlm_msg.eds_entry is not None:
-                    self.payload_str_max(self.tlm_msg.eds_obj, self.tlm_msg.eds_entry.Name)
-                    if self.payload_str_max_len > 0:
-                        self.payload_fmt_str = "{:<%d}: {}\n" % self.payload_str_max_len
+        return True
 
-            if tlm_msg.app_id == self.tlm_msg.app_id:
-                self.current_msg = tlm_msg
-                if not self.paused:
-                    self.window['-TLM_UPDATE-'].click()
+    def refresh(self):
+        if self.paused:
+            if self.paused_cnt > 0:
+                self.window['-PAUSED-'].update(f'Display Paused, {self.paused_cnt} messages received')
+        else:
+            self.refresh_display()
 
+    def close(self):
+        if self.window is not None:
+            self.window.close()
+            self.window = None
 
-    def format_payload_text(self, base_object, base_name):
+    def update(self, tlm_msg: TelemetryMessage):
         """
-        Recursive function that iterates over an EDS object and creates a string that can be displayed.
+        Receive telemetry updates from the telemetry thread. Only a reference
+        to the message is saved, the formatting is done by refresh_display().
+        The telemetry server decodes each datagram into a new eds_obj so the
+        saved object isn't modified by subsequent messages.
         """
-        # Array display string
-        if (self.tlm_server.eds_mission.lib_db.IsArray(base_object)):
-            for i in range(len(base_object)):
-                self.format_payload_text(base_object[i], f"{base_name}[{i}]")
-        # Container display string
-        elif (self.tlm_server.eds_mission.lib_db.IsContainer(base_object)):
-            for item in base_object:
-                self.format_payload_text(item[1], f"{base_name}.{item[0]}")
-        # Everything else (number, enumeration, string, etc.)
+        if self.window is not None and self.tlm_msg is not None and tlm_msg.app_id == self.tlm_msg.app_id:
+            with self.lock:
+                self.current_msg = (tlm_msg.eds_entry, tlm_msg.eds_obj)
+                self.msg_cnt += 1
+                if self.paused:
+                    self.paused_cnt += 1
+
+    def refresh_display(self):
+        """
+        Called from the GUI thread. Only header fields and payload rows whose
+        values changed are rewritten.
+        """
+        with self.lock:
+            if self.msg_cnt == 0 or self.current_msg is None:
+                return
+            eds_entry, eds_obj = self.current_msg
+            self.msg_cnt = 0
+        #TODO - Resolve why eds_entry is sometimes None 
+        if eds_entry is None:
+            return
+
+        pri_hdr = eds_obj.CCSDS
+        hdr_values = {'-APP_ID-': str(pri_hdr.AppId), '-LENGTH-': str(pri_hdr.Length),
+                      '-SEQ_CNT-': str(pri_hdr.Sequence), '-TIME-': str(eds_obj.Sec.Seconds)}
+        for key, value in hdr_values.items():
+            if self.hdr_values.get(key) != value:
+                self.window[key].update(value)
+        self.hdr_values = hdr_values
+
+        layout = self.layouts.get(eds_entry.Name)
+        if layout is None:
+            layout = ScreenLayout(self.tlm_server.eds_mission.lib_db, eds_obj, eds_entry.Name)
+            self.layouts[eds_entry.Name] = layout
+
+        row_values = layout.get_values(eds_obj)
+        if layout is not self.layout:
+            self.layout = layout
+            self.window['-PAYLOAD_TEXT-'].update(layout.format_text(row_values))
         else:
-            if '.Payload.' in base_name:
-                self.payload_text += self.payload_fmt_str.format(base_name, base_object)
+            for row, value in enumerate(row_values):
+                if value != self.row_values[row]:
+                    # Tk text lines are 1-based
+                    line = row + 1
+                    self.payload_widget.delete(f'{line}.{layout.value_col}', f'{line}.end')
+                    self.payload_widget.insert(f'{line}.{layout.value_col}', value)
+        self.row_values = row_values
+
+
+###############################################################################
+
+class TlmScreen(TlmScreenView):
+    """
+    Create a screen that displays a single telemetry message using its own
+    telemetry server
+    """
+    def __init__(self, mission_name, gnd_ip_addr, router_ctrl_port, screen_tlm_port, screen_tlm_timeout):
 
-    def payload_str_max(self, base_object, base_name):
+        super().__init__(TelemetrySocketServer(mission_name, 'cpu1', gnd_ip_addr, router_ctrl_port, screen_tlm_port, screen_tlm_timeout))
+        
+    def execute(self, app_name, tlm_topic):
         """
-        Recursive function that determines the longest payload string. This
-        is helpful for formatting displayes .
+        The current value observer only observes the displayed message. The
+        display is refreshed from the window read loop so updates never
+        arrive before the window is created.
         """
-        # Array display string
-        if (self.tlm_server.eds_mission.lib_db.IsArray(base_object)):
-            for i in range(len(base_object)):
-                self.payload_str_max(base_object[i], f"{base_name}[{i}]")
-        # Container display string
-        elif (self.tlm_server.eds_mission.lib_db.IsContainer(base_object)):
-            for item in base_object:
-                self.payload_str_max(item[1], f"{base_name}.{item[0]}")
-        # Everything else (number, enumeration, string, etc.)
-        else:
-            if '.Payload.' in base_name:
-                base_name_len = len(base_name)
-                if base_name_len > self.payload_str_max_len:
-                    self.payload_str_max_len = base_name_len
+        self.open(app_name, tlm_topic)
+
+        self.tlm_current_value = TelemetryCurrentValue(self.tlm_server, self.update, self.get_tlm_msgs())
+        self.tlm_server.set_subscription([tlm_msg.app_id for tlm_msg in self.get_tlm_msgs()])
+        self.tlm_server.execute()
+
+        while True:  # Event Loop
+
+            event, values = self.window.read(timeout=int(1000/self.REFRESH_RATE))
+            if not self.handle_event(event, values):
+                break
+            self.refresh()
+     
+        self.tlm_server.shutdown()
+        self.close()
+
 
 ###############################################################################
 
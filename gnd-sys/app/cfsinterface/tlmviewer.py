@@ -0,0 +1,259 @@
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+      Host multiple telemetry screen, plot and page windows in one process
+
+    Notes:
+      1. All of the windows share one EDS database, one telemetry socket and
+         one decoder. Telemetry updates are dispatched to the windows that
+         display the message's AppId.
+      2. Basecamp launches the viewer with the first display request and
+         sends subsequent requests to the viewer's control port. A request
+         is a space separated string with the same parameters as the
+         standalone tools:
+           screen app_name tlm_topic
+           plot app_name tlm_topic payload element min max [topic:element ...]
+           page page_file
+      3. The telemetry server only decodes the AppIds that at least one view
+         subscribes to.
+      4. The viewer exits when its last window is closed. It drains its
+         control port before it exits so a request sent while the last
+         window closes opens a new window.
+      5. Derived telemetry topics (DERIVED/Application/<name>) can be used
+         in plots and pages. Their input messages are decoded while a view
+         subscribes to them.
+      6. The viewer acknowledges each request by echoing it to the sender
+         after the view is processed. The control socket is bound before
+         the EDS database is loaded so requests sent while the viewer starts
+         are queued by the socket. A sender that doesn't receive the echo
+         can launch a new viewer with the request after this viewer exits.
+         The control port isn't shared so a second viewer fails to bind it
+         and exits instead of taking over the telemetry port.
+      7. The viewer's TelemetryHistory records each plotted point from the
+         time it's first plotted until the viewer exits. A plot of a point
+         that was plotted before opens pre-filled with its history. The
+         recorded AppIds stay subscribed while no view displays them.
+"""
+
+import sys
+import os
+import socket
+import configparser
+import threading
+
+if __name__ == '__main__':
+    sys.path.append('..')
+    from telemetry  import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
+    from tlmscreen  import TlmScreenView
+    from tlmplot    import TlmPlotView
+    from tlmpage    import TlmPageView
+    from tlmderived import DerivedTelemetry
+    from tlmhistory import TelemetryHistory
+else:
+    from .telemetry  import TelemetryMessage, TelemetryObserver, TelemetrySocketServer
+    from .tlmscreen  import TlmScreenView
+    from .tlmplot    import TlmPlotView
+    from .tlmpage    import TlmPageView
+    from .tlmderived import DerivedTelemetry
+    from .tlmhistory import TelemetryHistory
+import FreeSimpleGUI as sg
+
+VIEW_SCREEN = 'screen'
+VIEW_PLOT   = 'plot'
+VIEW_PAGE   = 'page'
+
+
+###############################################################################
+
+class TelemetryDispatcher(TelemetryObserver):
+    """
+    Observe the messages displayed by at least one view and forward each
+    update to the views that display it. Views are added and removed from the
+    GUI thread while update() runs in the telemetry thread. The telemetry
+    server's subscription is kept equal to the observed AppIds plus the
+    AppIds recorded by the optional TelemetryHistory.
+    """
+
+    def __init__(self, tlm_server: TelemetrySocketServer, tlm_history=None):
+        super().__init__(tlm_server)
+
+        self.lock = threading.Lock()
+        self.app_id_views = {}  # app_id: [views]
+        self.tlm_history  = tlm_history
+        self.update_subscription()
+
+    def update_subscription(self):
+        app_ids = set(self.app_id_views.keys())
+        if self.tlm_history is not None:
+            app_ids |= set(self.tlm_history.app_id_points.keys())
+        self.tlm_server.set_subscription(app_ids)
+
+    def add_view(self, view):
+        with self.lock:
+            for tlm_msg in view.get_tlm_msgs():
+                if tlm_msg.app_id not in self.app_id_views:
+                    self.app_id_views[tlm_msg.app_id] = []
+                    self.tlm_server.add_msg_observer(tlm_msg, self)
+                self.app_id_views[tlm_msg.app_id].append(view)
+            self.update_subscription()
+
+    def remove_view(self, view):
+        with self.lock:
+            for tlm_msg in view.get_tlm_msgs():
+                views = self.app_id_views.get(tlm_msg.app_id)
+                if views is not None and view in views:
+                    views.remove(view)
+                    if len(views) == 0:
+                        del self.app_id_views[tlm_msg.app_id]
+                        self.tlm_server.remove_msg_observer(tlm_msg, self)
+            self.update_subscription()
+
+    def update(self, tlm_msg: TelemetryMessage) -> None:
+        """
+        Receive telemetry updates
+        """
+        with self.lock:
+            views = tuple(self.app_id_views.get(tlm_msg.app_id, ()))
+        for view in views:
+            view.update(tlm_msg)
+
+
+###############################################################################
+
+class TlmViewer():
+    """
+    Manage the telemetry display windows
+    """
+    REFRESH_RATE = 10   # Event loop timeouts per second. Views limit their own redraw rates.
+
+    def __init__(self, mission_name, gnd_ip_addr, router_ctrl_port, viewer_ctrl_port, viewer_tlm_port, viewer_tlm_timeout, derived_file=None):
+
+        # Bind the control port first so requests sent while the EDS database loads are queued
+        self.viewer_ctrl_socket_addr = (gnd_ip_addr, viewer_ctrl_port)
+        self.viewer_ctrl_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.viewer_ctrl_socket.bind(self.viewer_ctrl_socket_addr)
+        self.viewer_ctrl_socket.setblocking(False)
+
+        self.tlm_server = TelemetrySocketServer(mission_name, 'cpu1', gnd_ip_addr, router_ctrl_port, viewer_tlm_port, viewer_tlm_timeout)
+        self.tlm_derived = DerivedTelemetry(self.tlm_server)
+        if derived_file is not None:
+            self.tlm_derived.load(derived_file)
+        self.tlm_history = TelemetryHistory(self.tlm_server)  # Pre-fills plots of previously plotted points
+        self.dispatcher = TelemetryDispatcher(self.tlm_server, self.tlm_history)
+        self.views = {}  # window: view
+
+    def open_view(self, view_parms):
+        """
+        Create a view from a request string. Returns the view or None if the
+        request is invalid.
+        """
+        parms = view_parms.split()
+        view = None
+        try:
+            if parms[0] == VIEW_PAGE:
+                # Page filenames may contain spaces
+                page_file = view_parms.split(maxsplit=1)[1]
+                view = TlmPageView(self.tlm_server)
+                view.open(page_file)
+            elif parms[0] == VIEW_SCREEN:
+                view = TlmScreenView(self.tlm_server)
+                view.open(parms[1], parms[2])
+            elif parms[0] == VIEW_PLOT:
+                view = TlmPlotView(self.tlm_server, int(parms[5]), int(parms[6]), tlm_history=self.tlm_history)
+                view.add_series(parms[2], parms[4])
+                for series_parm in parms[7:]:
+                    topic, element = series_parm.split(':')
+                    view.add_series(topic, element)
+                if len(view.series) == 0:
+                    return None
+                view.open()
+            else:
+                print(f'TlmViewer ignoring invalid view request: {view_parms}')
+                return None
+        except (IndexError, ValueError, OSError) as e:
+            print(f'TlmViewer error processing view request "{view_parms}": {e}')
+            return None
+
+        self.views[view.window] = view
+        self.dispatcher.add_view(view)
+        return view
+
+    def close_view(self, window):
+        view = self.views.pop(window, None)
+        if view is not None:
+            self.dispatcher.remove_view(view)
+            view.close()
+
+    def read_ctrl_port(self):
+        """
+        Open the requested views and echo each request to its sender
+        """
+        while True:
+            try:
+                datagram, host = self.viewer_ctrl_socket.recvfrom(1024)
+            except (BlockingIOError, socket.timeout):
+                break
+            self.open_view(datagram.decode('utf-8'))
+            try:
+                self.viewer_ctrl_socket.sendto(datagram, host)
+            except OSError as e:
+                print(f'TlmViewer error acknowledging view request from {host}: {e}')
+
+    def execute(self, view_parms):
+
+        self.open_view(view_parms)
+        self.tlm_server.execute()
+        self.read_ctrl_port()  # Requests queued while the viewer started
+
+        while len(self.views) > 0:
+            window, event, values = sg.read_all_windows(timeout=int(1000/self.REFRESH_RATE))
+            if window in self.views:
+                if not self.views[window].handle_event(event, values):
+                    self.close_view(window)
+            self.read_ctrl_port()  # Also serves requests sent while the last window was closing
+            for view in self.views.values():
+                view.refresh()
+
+        # Requests sent after the socket is closed aren't acknowledged so the sender launches a new viewer
+        self.viewer_ctrl_socket.close()
+        self.tlm_server.shutdown()
+
+
+###############################################################################
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        view_parms = ' '.join(sys.argv[1:])
+    else:
+        view_parms = f'{VIEW_SCREEN} CFE_ES CFE_ES/Application/HK_TLM'
+
+    config = configparser.ConfigParser()
+    config.read('../basecamp.ini')
+
+    gnd_ip_addr      = config.get('NETWORK', 'GND_IP_ADDR')
+    router_ctrl_port = config.getint('NETWORK','CMD_TLM_ROUTER_CTRL_PORT')
+    viewer_ctrl_port = config.getint('NETWORK', 'TLM_VIEWER_CTRL_PORT')
+    viewer_tlm_port  = config.getint('NETWORK', 'TLM_VIEWER_TLM_PORT')
+    mission_name     = config.get('CFS_TARGET','MISSION_EDS_NAME')
+    derived_file     = os.path.join('..', config.get('PATHS', 'TLM_DERIVED_FILE'))
+
+    try:
+        tlm_viewer = TlmViewer(mission_name, gnd_ip_addr, router_ctrl_port, viewer_ctrl_port, viewer_tlm_port, 1.0, derived_file)
+    except OSError as e:
+        print(f'TlmViewer exiting, another viewer may be using control port {viewer_ctrl_port}: {e}')
+        sys.exit(1)
+    tlm_viewer.execute(view_parms)
+
@@ -23,16 +23,33 @@ import logging
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
-from .appcodetutorial import ManageCodeTutorials
-from .appstore import AppStore
-from .apptemplate import CreateApp
-from .cfstarget import AppTargetStatus, AppTopicIdStatus, Cfs, CfsStdout, ManageCfs, build_cfs_target
-from .eds import CfeTopicIds, AppEds
-from .jsonfile import JsonTblTopicMap
-from .pdfviewer import PdfViewer
-from .projtarget import CreateProject
-from .tutorial import ManageTutorials
-from .texteditor import TextEditor
-from .usrapps import AppStoreSpec, AppSpec, ManageUsrApps
+import importlib
+
 from .utils import *
 
+# The remaining modules are imported when one of their names is first used so
+# processes that only need the utilities don't import the GUI, PDF and web
+# dependencies of the other tools
+LAZY_EXPORTS = {
+    'appcodetutorial': ['ManageCodeTutorials'],
+    'appstore':        ['AppStore'],
+    'apptemplate':     ['CreateApp'],
+    'cfstarget':       ['AppTargetStatus', 'AppTopicIdStatus', 'Cfs', 'CfsStdout', 'CfsSupervisor', 'ManageCfs', 'build_cfs_target'],
+    'dirwatcher':      ['DirWatcher', 'DELTA_ADD', 'DELTA_DEL', 'DELTA_MOD'],
+    'eds':             ['CfeTopicIds', 'AppEds'],
+    'jsonfile':        ['JsonTblTopicMap'],
+    'pdfviewer':       ['PdfViewer'],
+    'projtarget':      ['CreateProject'],
+    'tutorial':        ['ManageTutorials'],
+    'texteditor':      ['TextEditor'],
+    'usrapps':         ['AppStoreSpec', 'AppSpec', 'ManageUsrApps'],
+}
+LAZY_EXPORT_MODULES = {name: module for module, names in LAZY_EXPORTS.items() for name in names}
+
+def __getattr__(name):
+    if name not in LAZY_EXPORT_MODULES:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f'.{LAZY_EXPORT_MODULES[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
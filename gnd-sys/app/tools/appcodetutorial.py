@@ -29,7 +29,6 @@ import time
 import os
 import json
 import configparser
-import fitz
 from datetime import datetime
 
 import logging
@@ -32,6 +32,10 @@ import json
 import shutil
 import subprocess
 import threading
+import selectors
+import signal
+import queue
+from collections import deque
 from enum import Enum
 
 import logging
@@ -63,15 +67,12 @@ RESERVED_APPS       = ['sample_app']
 
 ###############################################################################
 
-def build_cfs_target(cfs_build_script, cfs_abs_base_path, main_window):
-
-    build_subprocess = subprocess.Popen(f'{cfs_build_script} {cfs_abs_base_path}',
-                       stdout=subprocess.PIPE, shell=True, bufsize=1, universal_newlines=True)
-    if build_subprocess is not None:
-        cfs_stdout = CfsStdout(build_subprocess, main_window)
-        cfs_stdout.start()
-
-    return build_subprocess
+def build_cfs_target(cfs_build_script, cfs_abs_base_path, cfs_supervisor):
+    """
+    The build runs in the background and its output is displayed in the cFS
+    process window
+    """
+    cfs_supervisor.run_output_process(f'{cfs_build_script} {cfs_abs_base_path}')
 
 
 ###############################################################################
@@ -151,74 +152,345 @@ class AppTopicIdStatus():
 
 ###############################################################################
   
-class CfsStdout(threading.Thread):
+class CfsStdout():
     """
+    Console for the cFS process and cFS build output. Lines are saved in a
+    bounded ring, streamed to an optional log file and displayed by refresh()
+    which must be called from the GUI thread. refresh() limits widget updates
+    to REFRESH_RATE and only inserts the new lines and deletes the lines that
+    scroll out of the ring so the cost of an update doesn't grow with the
+    length of the run.
     """
-    def __init__(self, cfs_subprocess, window):
-        threading.Thread.__init__(self)
-        self.cfs_subprocess = cfs_subprocess
+    REFRESH_RATE = 5   # Widget updates per second
+    
+    def __init__(self, window, log_file=None, depth=2000):
         self.window = window
-        self.cfs_subprocess_log = ""
-        self.daemon = True
+        self.log_file = log_file
+        self.lines = deque(maxlen=depth)
+        self.pending_lines = []
+        self.display_line_cnt = 0
+        self.lock = threading.Lock()
+        self.last_refresh = 0.0
+        self.log = None
+        if log_file is not None:
+            try:
+                self.log = open(log_file, 'a', buffering=1)
+            except OSError as e:
+                logger.error(f'Error opening cFS stdout log file {log_file}: {e}')
         
-    def run(self):
+    def add_lines(self, lines):
         """
-        This function is invoked after a cFS process is started and it's design depends on how Popen is
-        configured when the cFS process is started. I've tried lots of different designs to make this 
-        non-blocking and easay to terminate. It assumes the the Popen parameters bufsize=1 and
-        universal_newlines=True (text output). A binary stdout would need line.decode('utf-8'). Some loop
-        design options:
-            for line in io.TextIOWrapper(self.cfs_subprocess.stdout, encoding="utf-8"):
-                self.cfs_subprocess_log += line
-            while True:
-                line = self.cfs_subprocess.stdout.readline()
-                if not line:
-                    break
-                self.cfs_subprocess_log += line
-
-            for line in iter(self.cfs_subprocess.stdout.readline, ''):
-                print(">>Line: " + line)
-                self.cfs_subprocess_log += line
-
-        Reading stdout is a blocking function. The current design does not let the process get killed and I
-        think it's because the read function is always active. I put the try block there because I'd like to
-        add an exception mechanism to allow the thread to be terminated. Subprocess communicating with a timeout
-        is not an option because the child process is terminated if a timeout occurs. I tried the pseudo terminal
-        module as an intermediator between the cFS process and stdout thinking it may be non-blocking but
-        it still blocked. 
-        
+        Lines must include their line terminator. May be called from any thread.
         """
- 
-        try:
-            logger.info("Starting cFS terminal window stdout display")
-            for line in iter(self.cfs_subprocess.stdout.readline, ''):
-                #print(">>Line: " + line)
-                self.cfs_subprocess_log += line
-                self.window["-CFS_PROCESS_TEXT-"].update(self.cfs_subprocess_log)
-                self.window["-CFS_PROCESS_TEXT-"].set_vscroll_position(1.0)  # Scroll to bottom (most recent entry)
-        except Exception as e:
-            logger.error("Starting cFS terminal window stdout display exception\n" + str(e))
+        with self.lock:
+            self.lines.extend(lines)
+            self.pending_lines.extend(lines)
+            if self.log is not None:
+                self.log.write(''.join(lines))
             
-    def get_id(self):
- 
-        # returns id of the respective thread
-        if hasattr(self, '_thread_id'):
-            return self._thread_id
-        for id, thread in threading._active.items():
-            if thread is self:
-                return id
-  
-    def terminate(self):
+    def get_lines(self):
+        with self.lock:
+            return list(self.lines)
+
+    def has_pending_lines(self):
+        return len(self.pending_lines) > 0
+
+    def refresh(self):
         """
-        Terminate the thread by rasing an exception
+        Append the lines received since the last update to the display
         """
-        logger.info("Raising CfsStdout exception to terminate thread")
-        thread_id = self.get_id()
-        res = ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id,
-              ctypes.py_object(SystemExit))
-        if res > 1:
-            ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, 0)
-            print('Exception raise failure')
+        if (time.monotonic() - self.last_refresh) < 1.0/self.REFRESH_RATE:
+            return
+        self.last_refresh = time.monotonic()
+        with self.lock:
+            pending_lines = self.pending_lines
+            self.pending_lines = []
+        if len(pending_lines) == 0:
+            return
+        depth = self.lines.maxlen
+        if len(pending_lines) > depth:
+            pending_lines = pending_lines[-depth:]
+        widget = self.window["-CFS_PROCESS_TEXT-"].Widget
+        widget.insert('end', ''.join(pending_lines))
+        self.display_line_cnt += len(pending_lines)
+        if self.display_line_cnt > depth:
+            widget.delete('1.0', f'{self.display_line_cnt - depth + 1}.0')
+            self.display_line_cnt = depth
+        widget.see('end')  # Scroll to bottom (most recent entry)
+
+    def close(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+
+###############################################################################
+
+class CfsSupervisor(threading.Thread):
+    """
+    Start, stop and monitor the cFS process without blocking the GUI. One
+    thread multiplexes the non-blocking stdout pipes of the cFS process and
+    any build processes with a selector, splits the output into lines for
+    CfsStdout and watches for cFE ES's 'entering OPERATIONAL state' line.
+
+    The GUI thread calls start(), stop() and restart() which are queued for
+    the supervisor thread. State changes are reported as (state, text) tuples
+    on status_queue so the GUI can react from its own thread:
+      STARTING - Process started
+      RUNNING  - OPERATIONAL state line or first telemetry received, or
+                 READY_TIMEOUT expired
+      IDLE     - Process stopped by the user
+      CRASHED  - Process exited without a stop request. If auto_restart_limit
+                 is non-zero, the process is restarted up to that many times
+                 within RESTART_WINDOW seconds.
+    """
+    STATE_IDLE     = 'IDLE'
+    STATE_STARTING = 'STARTING'
+    STATE_RUNNING  = 'RUNNING'
+    STATE_STOPPING = 'STOPPING'
+    STATE_CRASHED  = 'CRASHED'
+    
+    READY_PATTERN  = 'entering OPERATIONAL state'  # Printed by CFE_ES_Main() in cfe_es_start.c
+    READY_TIMEOUT  = 10.0  # Seconds
+    STOP_TIMEOUT   = 3.0   # Seconds before SIGTERM is followed by SIGKILL
+    RESTART_DELAY  = 2.0
+    RESTART_WINDOW = 60.0
+    POLL_TIMEOUT   = 0.25
+    
+    def __init__(self, cfs_stdout, status_queue, auto_restart_limit=0):
+        threading.Thread.__init__(self)
+        self.cfs_stdout   = cfs_stdout
+        self.status_queue = status_queue
+        self.auto_restart_limit = auto_restart_limit
+        self.daemon = True
+
+        self.selector = selectors.DefaultSelector()
+        self.cmd_queue = queue.Queue()
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ, None)
+        
+        self.state = self.STATE_IDLE
+        self.popen_str = None
+        self.cfs_process = None
+        self.output_processes = []  # Build processes whose output is displayed
+        self.partial_lines = {}     # fd: bytes after the last line terminator
+        self.state_time = 0.0
+        self.stop_requested = False
+        self.exit_time      = None    # Time when the cFS process exit was detected
+        self.start_pending  = None  # Time when a pending (re)start is issued
+        self.restart_times  = deque()
+        self.running = True
+
+    def start_cfs(self, popen_str):
+        self.send_cmd('start', popen_str)
+
+    def stop_cfs(self):
+        self.send_cmd('stop')
+
+    def restart_cfs(self, popen_str=None):
+        self.send_cmd('restart', popen_str)
+
+    def run_output_process(self, popen_str):
+        """
+        Run a process, such as a cFS build, and display its output
+        """
+        self.send_cmd('output', popen_str)
+
+    def notify_tlm(self):
+        """
+        Called when cFS telemetry is received, may be called from any thread
+        """
+        if self.state == self.STATE_STARTING:
+            self.send_cmd('tlm')
+
+    def is_active(self):
+        """
+        True if a cFS process is running or a restart is pending. A crashed
+        cFS isn't active so it can be rebuilt.
+        """
+        return self.state in (self.STATE_STARTING, self.STATE_RUNNING, self.STATE_STOPPING) or self.start_pending is not None
+
+    def shutdown(self):
+        self.send_cmd('shutdown')
+        self.join(self.STOP_TIMEOUT + 1.0)
+
+    def send_cmd(self, cmd, parm=None):
+        self.cmd_queue.put((cmd, parm))
+        try:
+            os.write(self.wakeup_write, b'\0')
+        except (OSError, TypeError):
+            pass  # The supervisor has shut down and closed its wakeup pipe
+
+    def set_state(self, state, text):
+        self.state = state
+        self.state_time = time.monotonic()
+        logger.info(f'cFS supervisor state {state}: {text}')
+        self.status_queue.put((state, text))
+
+    def run(self):
+        while self.running:
+            for key, mask in self.selector.select(self.POLL_TIMEOUT):
+                if key.fileobj == self.wakeup_read:
+                    try:
+                        os.read(self.wakeup_read, 1024)
+                    except BlockingIOError:
+                        pass
+                else:
+                    self.read_output(key.fileobj, key.data)
+            self.process_cmds()
+            self.check_processes()
+        self.close_wakeup_pipe()
+        self.selector.close()
+
+    def close_wakeup_pipe(self):
+        self.selector.unregister(self.wakeup_read)
+        wakeup_read, wakeup_write = self.wakeup_read, self.wakeup_write
+        self.wakeup_read = self.wakeup_write = None
+        os.close(wakeup_read)
+        os.close(wakeup_write)
+
+    def process_cmds(self):
+        while True:
+            try:
+                cmd, parm = self.cmd_queue.get_nowait()
+            except queue.Empty:
+                break
+            if cmd == 'start':
+                if self.cfs_process is None:
+                    self.popen_str = parm
+                    self.restart_times.clear()
+                    self.launch_cfs()
+            elif cmd == 'stop':
+                self.start_pending = None
+                self.terminate_cfs()
+                if self.cfs_process is None and self.state != self.STATE_IDLE:
+                    self.set_state(self.STATE_IDLE, 'cFS stopped')
+            elif cmd == 'restart':
+                if parm is not None:
+                    self.popen_str = parm
+                if self.popen_str is not None:
+                    self.terminate_cfs()
+                    self.start_pending = time.monotonic()
+            elif cmd == 'output':
+                process = self.popen(parm, nice=False)
+                if process is not None:
+                    self.output_processes.append(process)
+            elif cmd == 'tlm':
+                if self.state == self.STATE_STARTING:
+                    self.set_state(self.STATE_RUNNING, 'cFS telemetry received')
+            elif cmd == 'shutdown':
+                self.start_pending = None
+                self.terminate_cfs()
+                deadline = time.monotonic() + self.STOP_TIMEOUT
+                while self.cfs_process is not None and self.cfs_process.poll() is None and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                if self.cfs_process is not None and self.cfs_process.poll() is None:
+                    self.signal_cfs(signal.SIGKILL)
+                self.running = False
+
+    def popen(self, popen_str, nice=True):
+        preexec_fn = (lambda : (os.setsid(), os.nice(10))) if nice else os.setsid
+        try:
+            process = subprocess.Popen(popen_str, stdout=subprocess.PIPE, shell=True, bufsize=0, preexec_fn=preexec_fn)
+        except OSError as e:
+            self.cfs_stdout.add_lines([f'Error starting {popen_str}: {e}\n'])
+            return None
+        fd = process.stdout.fileno()
+        os.set_blocking(fd, False)
+        self.partial_lines[fd] = b''
+        self.selector.register(fd, selectors.EVENT_READ, process)
+        return process
+
+    def launch_cfs(self):
+        self.start_pending = None
+        self.stop_requested = False
+        self.exit_time = None
+        self.cfs_process = self.popen(self.popen_str)
+        if self.cfs_process is None:
+            self.set_state(self.STATE_CRASHED, f'cFS failed to start: {self.popen_str}')
+        else:
+            self.cfs_stdout.add_lines([f"=== cFS started {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n"])
+            self.set_state(self.STATE_STARTING, f'Started cFS process {self.cfs_process.pid}')
+
+    def terminate_cfs(self):
+        if self.cfs_process is not None and self.cfs_process.poll() is None:
+            self.stop_requested = True
+            self.signal_cfs(signal.SIGTERM)
+            self.set_state(self.STATE_STOPPING, 'Stopping cFS')
+
+    def signal_cfs(self, sig):
+        try:
+            os.killpg(os.getpgid(self.cfs_process.pid), sig)  # Send the signal to all the process groups
+        except ProcessLookupError:
+            pass
+
+    def read_output(self, fd, process):
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        if len(data) == 0:
+            self.close_output(fd)
+            return
+        data = self.partial_lines[fd] + data
+        last_eol = data.rfind(b'\n')
+        if last_eol < 0:
+            self.partial_lines[fd] = data
+            return
+        self.partial_lines[fd] = data[last_eol+1:]
+        lines = data[:last_eol+1].decode('utf-8', errors='replace').splitlines(keepends=True)
+        self.cfs_stdout.add_lines(lines)
+        if process is self.cfs_process and self.state == self.STATE_STARTING:
+            for line in lines:
+                if self.READY_PATTERN in line:
+                    self.set_state(self.STATE_RUNNING, 'cFS startup complete')
+                    break
+
+    def close_output(self, fd):
+        partial_line = self.partial_lines.pop(fd, b'')
+        if len(partial_line) > 0:
+            self.cfs_stdout.add_lines([partial_line.decode('utf-8', errors='replace') + '\n'])
+        self.selector.unregister(fd)
+
+    def check_processes(self):
+        now = time.monotonic()
+        for process in self.output_processes[:]:
+            if process.poll() is not None and process.stdout.fileno() not in self.partial_lines:
+                process.stdout.close()
+                self.output_processes.remove(process)
+        
+        if self.cfs_process is not None:
+            return_code = self.cfs_process.poll()
+            if return_code is None:
+                if self.state == self.STATE_STARTING and (now - self.state_time) > self.READY_TIMEOUT:
+                    self.set_state(self.STATE_RUNNING, f'cFE OPERATIONAL state line not received within {self.READY_TIMEOUT} seconds')
+                elif self.state == self.STATE_STOPPING and (now - self.state_time) > self.STOP_TIMEOUT:
+                    self.signal_cfs(signal.SIGKILL)
+                return
+            if self.exit_time is None:
+                self.exit_time = now
+            if self.cfs_process.stdout.fileno() not in self.partial_lines or (now - self.exit_time) > self.STOP_TIMEOUT:
+                # Process exited and its output has been drained or a child process is holding the pipe open
+                if self.cfs_process.stdout.fileno() in self.partial_lines:
+                    self.close_output(self.cfs_process.stdout.fileno())
+                self.cfs_process.stdout.close()
+                self.cfs_process = None
+                if self.stop_requested:
+                    if self.start_pending is None:
+                        self.set_state(self.STATE_IDLE, f'cFS stopped with exit code {return_code}')
+                else:
+                    self.set_state(self.STATE_CRASHED, f'cFS exited unexpectedly with exit code {return_code}')
+                    while len(self.restart_times) > 0 and (now - self.restart_times[0]) > self.RESTART_WINDOW:
+                        self.restart_times.popleft()
+                    if len(self.restart_times) < self.auto_restart_limit:
+                        self.restart_times.append(now)
+                        self.start_pending = now + self.RESTART_DELAY
+                        self.cfs_stdout.add_lines([f'=== cFS auto restart {len(self.restart_times)} of {self.auto_restart_limit} ===\n'])
+
+        if self.cfs_process is None and self.start_pending is not None and now >= self.start_pending:
+            self.launch_cfs()
 
 
 ###############################################################################
@@ -232,7 +504,7 @@ class ManageCfs():
     """
     TRI_STATE = Enum('TriState', ['NOT_APP', 'TRUE', 'FALSE'])
 
-    def __init__(self, basecamp_abs_path, cfs_abs_base_path, usr_app_rel_path, main_window, cfs_target):
+    def __init__(self, basecamp_abs_path, cfs_abs_base_path, usr_app_rel_path, main_window, cfs_target, cfs_supervisor):
         self.basecamp_abs_path      = basecamp_abs_path
         self.cfs_abs_base_path      = cfs_abs_base_path
         self.cfs_abs_defs_path      = os.path.join(self.cfs_abs_base_path, 'basecamp_defs')
@@ -240,6 +512,7 @@ class ManageCfs():
         self.usr_app_path           = compress_abs_path(os.path.join(basecamp_abs_path, usr_app_rel_path))
         self.main_window            = main_window
         self.cfs_target             = cfs_target
+        self.cfs_supervisor         = cfs_supervisor
         self.startup_scr_filename   = cfs_target + '_' + CFE_STARTUP_SCR
         self.startup_scr_file       = os.path.join(self.cfs_abs_defs_path, self.startup_scr_filename)
         self.targets_cmake_filename = 'targets.cmake'
@@ -303,13 +576,13 @@ class ManageCfs():
                   [sg.Text('', size=self.b_size), sg.Button('Submit', size=(6,1), button_color=self.b_color, font=self.b_font, pad=self.b_pad, enable_events=True, key='-3_AUTO-'),
                    sg.InputText(password_char='*', size=(15,1), font=self.t_font, pad=self.b_pad, key='-PASSWORD-')],
 
-                  [sg.Text('4. Exit and restart Basecamp', font=self.step_font, pad=self.b_pad)],
-                  [sg.Text('', size=self.b_size), sg.Button('Restart', size=(6,1), button_color=('SpringGreen4'), font=self.b_font, pad=self.b_pad, enable_events=True, key='-4_AUTO-')],
+                  [sg.Text("4. Reload Basecamp's EDS definitions", font=self.step_font, pad=self.b_pad)],
+                  [sg.Text('', size=self.b_size), sg.Button('Reload', size=(6,1), button_color=('SpringGreen4'), font=self.b_font, pad=self.b_pad, enable_events=True, key='-4_AUTO-'),
+                   sg.Text("Basecamp offers a restart if the definitions can't be reloaded", font=self.t_font)],
                  ]
         # sg.Button('Exit', enable_events=True, key='-EXIT-')
         window = sg.Window('Add App to Target', layout, resizable=True, finalize=True) # modal=True)
 
-        restart_main_window = False
         while True:
         
             self.event, self.values = window.read(timeout=200)
@@ -399,16 +672,13 @@ class ManageCfs():
                 popup_text = f"Open a terminal window and kill any running cFS processes. See '{Cfs.SH_STOP_CFS}' for guidance" 
                 sg.popup(popup_text, title='Stop the cFS', keep_on_top=True, non_blocking=True, grab_anywhere=True, modal=False)
 
-            ## Step 4 - Restart Basecamp
+            ## Step 4 - Reload Basecamp's EDS definitions
 
             elif self.event == '-4_AUTO-': # Reload cFS python EDS definitions
-                if self.restart_main_gui(''):
-                    restart_main_window = True
+                self.main_window.write_event_value('-RELOAD_EDS-', None)
                 break
                 
         window.close()       
-        if restart_main_window:
-            self.main_window['-RESTART-'].click()
 
     def add_usr_app(self, usr_app, quiet_ops=False):
         self.selected_app = usr_app
@@ -563,7 +833,7 @@ class ManageCfs():
                 
     def build_target(self):
         build_cfs_script = os.path.join(self.basecamp_abs_path, Cfs.SH_BUILD_CFS_TOPICIDS)
-        build_cfs_target(build_cfs_script, self.cfs_abs_base_path, self.main_window)
+        build_cfs_target(build_cfs_script, self.cfs_abs_base_path, self.cfs_supervisor)
                 
     def restart_popup(self, instructions):
         """
@@ -592,8 +862,8 @@ class ManageCfs():
         
     def restart_main_gui(self, instructions):
         """
-        This performs the same functionality as the '-4_AUTO-' window event. It is provided for 
-        non-GUI situations. 
+        Restart Basecamp to load a new cFS build's EDS definitions. It is provided for 
+        non-GUI situations, the '-4_AUTO-' window event reloads the definitions without a restart. 
         """
         restart = False
         button = self.restart_popup(instructions)
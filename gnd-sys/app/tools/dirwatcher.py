@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+    Copyright 2022 bitValence, Inc.
+    All Rights Reserved.
+
+    This program is free software; you can modify and/or redistribute it
+    under the terms of the GNU Affero General Public License
+    as published by the Free Software Foundation; version 3 with
+    attribution addendums as found in the LICENSE.txt.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    Purpose:
+        Watch a ground directory and report file changes as deltas
+
+    Notes:
+      1. Linux inotify is accessed through ctypes so no additional packages
+         are required. If inotify isn't available the directory is polled
+         using os.scandir() and a stat cache.
+      2. Only regular files are reported. Subdirectories are ignored which
+         is consistent with the FileBrowser ground listing.
+      3. Deltas are a list of (action, filename, stat) tuples where action
+         is DELTA_ADD, DELTA_DEL, or DELTA_MOD and stat is a (size, mtime)
+         tuple or None for deletions.
+"""
+
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import stat
+import struct
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+DELTA_ADD = 'ADD'
+DELTA_DEL = 'DEL'
+DELTA_MOD = 'MOD'
+
+###############################################################################
+
+class Inotify():
+    """
+    Minimal ctypes wrapper for a single inotify watch
+    """
+    IN_MODIFY      = 0x00000002
+    IN_ATTRIB      = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM  = 0x00000040
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF   = 0x00000800
+    IN_Q_OVERFLOW  = 0x00004000
+    IN_IGNORED     = 0x00008000
+    IN_ISDIR       = 0x40000000
+    IN_NONBLOCK    = 0x00000800
+    IN_CLOEXEC     = 0x00080000
+
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    EVENT_HDR     = struct.Struct('iIII')  # wd, mask, cookie, len
+    READ_BUF_LEN  = 64*1024
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.libc.inotify_init1.argtypes = [ctypes.c_int]
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.wd = -1
+
+    def add_watch(self, path):
+        self.rm_watch()
+        self.wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if self.wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+
+    def rm_watch(self):
+        if self.wd >= 0:
+            self.libc.inotify_rm_watch(self.fd, self.wd)
+            self.wd = -1
+
+    def read_events(self, timeout):
+        """
+        Return a list of (wd, mask, name) tuples. An empty list is returned
+        if no events occur within timeout seconds.
+        """
+        events = []
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return events
+        try:
+            buf = os.read(self.fd, self.READ_BUF_LEN)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset + self.EVENT_HDR.size <= len(buf):
+            wd, mask, cookie, name_len = self.EVENT_HDR.unpack_from(buf, offset)
+            offset += self.EVENT_HDR.size
+            name = buf[offset:offset+name_len].rstrip(b'\0')
+            offset += name_len
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        self.rm_watch()
+        os.close(self.fd)
+
+
+###############################################################################
+
+class DirWatcher(threading.Thread):
+    """
+    Maintain a stat cache for one directory and report changes to
+    delta_callback(path, deltas) from the watcher thread. A GUI should
+    forward the deltas to its event loop, for example with
+    window.write_event_value().
+
+    watch() is synchronous. It returns the initial snapshot, a dictionary of
+    {filename: (size, mtime)}, and subsequent changes are reported as deltas.
+    inotify events are coalesced for batch_delay seconds so a file being
+    written in many small blocks generates a few deltas rather than one per
+    write.
+    """
+    def __init__(self, delta_callback, poll_interval=1.0, batch_delay=0.25):
+        super().__init__(daemon=True)
+        self.delta_callback = delta_callback
+        self.poll_interval  = poll_interval
+        self.batch_delay    = batch_delay
+
+        self.path = None
+        self.stat_cache = {}
+        self.lock = threading.Lock()
+        self.terminate = threading.Event()
+
+        self.inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                logger.info(f'inotify unavailable, polling directories: {e}')
+
+    def using_inotify(self):
+        return self.inotify is not None
+
+    def watch(self, path):
+        """
+        Start watching path and return its snapshot. The watch is added before
+        the directory is scanned so no changes are missed.
+        """
+        with self.lock:
+            self.path = path
+            if self.inotify is not None:
+                try:
+                    self.inotify.add_watch(path)
+                except OSError as e:
+                    logger.error(f'Error adding inotify watch for {path}: {e}')
+            self.stat_cache = self.scan_dir(path)
+            return dict(self.stat_cache)
+
+    def scan_dir(self, path):
+        dir_stats = {}
+        try:
+            with os.scandir(path) as dir_iter:
+                for entry in dir_iter:
+                    try:
+                        if entry.is_file():
+                            file_stat = entry.stat()
+                            dir_stats[entry.name] = (file_stat.st_size, file_stat.st_mtime)
+                    except OSError:
+                        pass # File removed during the scan
+        except OSError:
+            pass
+        return dir_stats
+
+    def stat_file(self, filename):
+        try:
+            file_stat = os.stat(os.path.join(self.path, filename))
+            if stat.S_ISREG(file_stat.st_mode):
+                return (file_stat.st_size, file_stat.st_mtime)
+        except OSError:
+            pass
+        return None
+
+    def update_files(self, filenames):
+        """
+        Refresh the stat cache for the changed files and return the deltas
+        """
+        deltas = []
+        for filename in filenames:
+            new_stat = self.stat_file(filename)
+            old_stat = self.stat_cache.get(filename)
+            if new_stat is None:
+                if old_stat is not None:
+                    del self.stat_cache[filename]
+                    deltas.append((DELTA_DEL, filename, None))
+            elif old_stat is None:
+                self.stat_cache[filename] = new_stat
+                deltas.append((DELTA_ADD, filename, new_stat))
+            elif old_stat != new_stat:
+                self.stat_cache[filename] = new_stat
+                deltas.append((DELTA_MOD, filename, new_stat))
+        return deltas
+
+    def diff_snapshot(self, dir_stats):
+        deltas = []
+        for filename, old_stat in self.stat_cache.items():
+            new_stat = dir_stats.get(filename)
+            if new_stat is None:
+                deltas.append((DELTA_DEL, filename, None))
+            elif new_stat != old_stat:
+                deltas.append((DELTA_MOD, filename, new_stat))
+        for filename, new_stat in dir_stats.items():
+            if filename not in self.stat_cache:
+                deltas.append((DELTA_ADD, filename, new_stat))
+        self.stat_cache = dir_stats
+        return deltas
+
+    def run(self):
+        if self.inotify is not None:
+            self.run_inotify()
+        else:
+            self.run_polling()
+
+    def run_inotify(self):
+        while not self.terminate.is_set():
+            events = self.inotify.read_events(self.poll_interval)
+            if len(events) == 0:
+                continue
+            # Coalesce a burst of events before stat'ing the changed files
+            self.terminate.wait(self.batch_delay)
+            events.extend(self.inotify.read_events(0))
+            with self.lock:
+                rescan = False
+                filenames = set()
+                for wd, mask, name in events:
+                    if wd != self.inotify.wd and not (mask & Inotify.IN_Q_OVERFLOW):
+                        continue
+                    if mask & (Inotify.IN_Q_OVERFLOW | Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF):
+                        rescan = True
+                    elif name and not (mask & Inotify.IN_ISDIR):
+                        filenames.add(name)
+                if rescan:
+                    deltas = self.diff_snapshot(self.scan_dir(self.path))
+                else:
+                    deltas = self.update_files(filenames)
+                path = self.path
+            if len(deltas) > 0:
+                self.delta_callback(path, deltas)
+
+    def run_polling(self):
+        """
+        Fallback when inotify isn't available. Each poll is a single scandir()
+        pass compared against the stat cache.
+        """
+        while not self.terminate.wait(self.poll_interval):
+            with self.lock:
+                if self.path is None:
+                    continue
+                deltas = self.diff_snapshot(self.scan_dir(self.path))
+                path = self.path
+            if len(deltas) > 0:
+                self.delta_callback(path, deltas)
+
+    def shutdown(self):
+        self.terminate.set()
+        if self.inotify is not None:
+            if self.is_alive():
+                self.join(timeout=2.0*self.poll_interval)
+            self.inotify.close()
+            self.inotify = None
+
+
+###############################################################################
+
+if __name__ == '__main__':
+
+    def print_deltas(path, deltas):
+        for action, filename, file_stat in deltas:
+            print(f'{path}: {action} {filename} {file_stat}')
+
+    watch_path = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()
+    dir_watcher = DirWatcher(print_deltas)
+    print(f'Watching {watch_path} using {"inotify" if dir_watcher.using_inotify() else "polling"}')
+    print(f'Initial files: {len(dir_watcher.watch(watch_path))}')
+    dir_watcher.start()
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        dir_watcher.shutdown()
+
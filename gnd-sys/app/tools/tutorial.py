@@ -32,7 +32,6 @@ import time
 import os
 import json
 import configparser
-import fitz
 from datetime import datetime
 
 import logging
@@ -40,10 +39,12 @@ logger = logging.getLogger(__name__)
 
 if __name__ == '__main__':
     from jsonfile import JsonFile
-    from utils    import compress_abs_path
+    from utils    import compress_abs_path, lazy_import
 else:
     from .jsonfile import JsonFile
-    from .utils    import compress_abs_path
+    from .utils    import compress_abs_path, lazy_import
+
+fitz = lazy_import('fitz')
 
 import FreeSimpleGUI as sg
 
@@ -17,9 +17,11 @@
         Provide JSON base class.
 """
 import os
+import sys
 import socket
 import fcntl
 import struct
+import importlib.util
 
 ###############################################################################
 
@@ -162,3 +164,24 @@ def bin_hex_encode(in_bin_buf):
         hex_string += hex_digit[in_bin_buf[i] & 0x0F]
         
     return hex_string 
+
+
+###############################################################################
+
+def lazy_import(module_name):
+    """
+    Return a module that is executed when one of its attributes is first
+    accessed. Use for large modules like numpy and fitz that are only needed
+    by some of a module's functions so they don't slow down process start up.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.find_spec(module_name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{module_name}'", name=module_name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    loader.exec_module(module)
+    return module